@@ -0,0 +1,165 @@
+"""Benchmark the auth + rate-limit middleware on a cached prompt fetch.
+
+Compares req/s and latency percentiles of ``GET /api/v1/prompts/{id}``
+(API key auth, prompt served from the cache) with the pure ASGI
+``AuthMiddleware``/``RateLimitMiddleware`` against the same logic wrapped in
+Starlette's ``BaseHTTPMiddleware`` (how both were implemented before).
+Requests go through httpx's in-process ASGI transport, so the numbers
+measure the app stack, not the network.
+
+Usage (from the repo root):
+    python scripts/bench_middleware.py                  # 5000 requests, 20 concurrent
+    python scripts/bench_middleware.py -n 20000 -c 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_PATH"] = str(Path(_tmp.name) / "bench.db")
+os.environ["RATE_LIMIT_PER_MINUTE"] = str(10**9)  # measure the limiter, never trip it
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+import bcrypt
+from httpx import ASGITransport, AsyncClient
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from server.auth.middleware import AuthMiddleware
+from server.auth.rate_limiter import RateLimitMiddleware
+from server.db.database import close_db, get_db, init_db
+from server.main import app
+
+API_KEY = "pm_live_benchkeyvalue1234567890abcdef"
+PROMPT_ID = "prompt-bench-001"
+
+
+class BaseHTTPAuthMiddleware(BaseHTTPMiddleware):
+    """Same checks as AuthMiddleware, run through BaseHTTPMiddleware."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.auth = AuthMiddleware(app)
+
+    async def dispatch(self, request, call_next):
+        return await self.auth.authenticate(request) or await call_next(request)
+
+
+class BaseHTTPRateLimitMiddleware(BaseHTTPMiddleware):
+    """Same checks as RateLimitMiddleware, run through BaseHTTPMiddleware."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.limiter = RateLimitMiddleware(app)
+
+    async def dispatch(self, request, call_next):
+        limited, headers = await self.limiter.check(request)
+        if limited is not None:
+            return limited
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
+
+async def _seed() -> None:
+    db = await get_db()
+    key_hash = bcrypt.hashpw(API_KEY.encode(), bcrypt.gensalt()).decode()
+    await db.execute(
+        "INSERT INTO organizations (id, github_owner, display_name) VALUES ('org-bench', 'bench', 'Bench')"
+    )
+    await db.execute(
+        "INSERT INTO applications (id, org_id, github_repo, display_name) "
+        "VALUES ('app-bench', 'org-bench', 'bench/app', 'Bench App')"
+    )
+    await db.execute(
+        "INSERT INTO prompts (id, app_id, name, file_path, type, front_matter, body_hash, body, git_sha, active) "
+        "VALUES (?, 'app-bench', 'greeting', 'prompts/greeting.md', 'chat', '{}', 'h', 'Hello {{ name }}.', 'sha', 1)",
+        (PROMPT_ID,),
+    )
+    await db.execute("INSERT INTO users (id, github_id, github_login) VALUES ('user-bench', 1, 'bench')")
+    await db.execute(
+        "INSERT INTO api_keys (id, user_id, key_hash, key_prefix, name) VALUES ('key-bench', 'user-bench', ?, ?, 'bench')",
+        (key_hash, API_KEY[:12]),
+    )
+    await db.commit()
+
+
+def _use_middleware(auth_cls, rate_limit_cls) -> None:
+    """Rebuild the app's middleware stack with the given auth/rate-limit classes."""
+    swap = {AuthMiddleware: auth_cls, RateLimitMiddleware: rate_limit_cls}
+    originals = {BaseHTTPAuthMiddleware: AuthMiddleware, BaseHTTPRateLimitMiddleware: RateLimitMiddleware}
+    stack = []
+    for m in app.user_middleware:
+        cls = originals.get(m.cls, m.cls)
+        stack.append(Middleware(swap.get(cls, cls), *m.args, **m.kwargs))
+    app.user_middleware = stack
+    app.middleware_stack = None
+
+
+async def _run(requests: int, concurrency: int) -> dict:
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    url = f"/api/v1/prompts/{PROMPT_ID}"
+    latencies: list[float] = []
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(50):  # warm the key and prompt caches
+            assert (await client.get(url, headers=headers)).status_code == 200
+
+        remaining = iter(range(requests))
+
+        async def worker() -> None:
+            for _ in remaining:
+                start = time.perf_counter()
+                resp = await client.get(url, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                assert resp.status_code == 200, resp.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "req_s": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=5000)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    await init_db()
+    try:
+        await _seed()
+        results = {}
+        for label, auth_cls, rate_limit_cls in (
+            ("BaseHTTPMiddleware", BaseHTTPAuthMiddleware, BaseHTTPRateLimitMiddleware),
+            ("pure ASGI", AuthMiddleware, RateLimitMiddleware),
+        ):
+            _use_middleware(auth_cls, rate_limit_cls)
+            results[label] = await _run(args.requests, args.concurrency)
+    finally:
+        await close_db()
+
+    print(f"GET /api/v1/prompts/{{id}} (cached), {args.requests} requests, concurrency {args.concurrency}")
+    print(f"{'middleware':<20} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for label, r in results.items():
+        print(f"{label:<20} {r['req_s']:>10.0f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""Request building and response handling shared by the sync and async clients.
+
+Only the transport differs between ``PromptClient`` and ``AsyncPromptClient``;
+the batch payloads, status handling and cache updates live here.
+"""
+
+from __future__ import annotations
+
+import httpx
+
+from promptdis.cache import PromptCache
+from promptdis.exceptions import AuthenticationError, ForbiddenError, PromptdisError
+
+
+def prefetch_request(
+    cache: PromptCache,
+    ids: list[str] | None,
+    org: str | None,
+    app: str | None,
+    names: list[str] | None,
+    environment: str | None,
+) -> tuple[dict, str | None]:
+    """Build the prompts:batch payload and the name-key template for the results."""
+    if ids:
+        payload: dict = {"ids": ids}
+        name_key = None
+        known = [f"id:{i}" for i in ids]
+    else:
+        payload = {"org": org, "app": app}
+        if names:
+            payload["names"] = names
+        if environment:
+            payload["environment"] = environment
+        name_key = f"name:{org}/{app}/{{name}}:{environment or 'any'}"
+        known = [name_key.format(name=n) for n in names or []]
+
+    etags = {}
+    for key in known:
+        entry, _ = cache.get(key)
+        if entry and entry.etag and entry.data.get("id"):
+            etags[entry.data["id"]] = entry.etag
+    if etags:
+        payload["etags"] = etags
+    return payload, name_key
+
+
+def store_prefetched(cache: PromptCache, result: dict, name_key: str | None) -> int:
+    """Cache a prompts:batch response. Returns the number of prompts it covered."""
+    for item in result.get("prompts", []):
+        if item.get("not_modified"):
+            cache.refresh_ttl(f"id:{item['id']}")
+            if name_key:
+                cache.refresh_ttl(name_key.format(name=item["name"]))
+            continue
+        data = item["prompt"]
+        cache.put(f"id:{data['id']}", data, item.get("etag"))
+        if name_key:
+            cache.put(name_key.format(name=data["name"]), data, item.get("etag"))
+    return len(result.get("prompts", []))
+
+
+def post_result(resp: httpx.Response) -> dict:
+    """Raise for an error status on a batch POST, else return the decoded body."""
+    if resp.status_code == 401:
+        raise AuthenticationError()
+    if resp.status_code == 403:
+        raise ForbiddenError()
+    if resp.status_code >= 400:
+        raise PromptdisError(f"API error: {resp.status_code}", status_code=resp.status_code)
+    return resp.json()
@@ -8,6 +8,7 @@ import random
 
 import httpx
 
+from promptdis._batch import post_result, prefetch_request, store_prefetched
 from promptdis.cache import PromptCache
 from promptdis.models import Prompt
 from promptdis.exceptions import PromptdisError, NotFoundError, AuthenticationError, ForbiddenError
@@ -53,6 +54,37 @@ class AsyncPromptClient:
     async def render(self, prompt_id: str, variables: dict) -> str:
         return (await self.get(prompt_id)).render(variables)
 
+    async def prefetch(
+        self,
+        ids: list[str] | None = None,
+        *,
+        org: str | None = None,
+        app: str | None = None,
+        names: list[str] | None = None,
+        environment: str | None = None,
+    ) -> int:
+        """Warm the cache with many prompts in one request (see ``PromptClient.prefetch``)."""
+        payload, name_key = prefetch_request(self._cache, ids, org, app, names, environment)
+        return store_prefetched(self._cache, await self._post("/prompts:batch", payload), name_key)
+
+    async def render_many(self, items: list[dict]) -> list[dict]:
+        """Render many prompts server-side in one request (see ``PromptClient.render_many``)."""
+        return (await self._post("/prompts/render:batch", {"items": items}))["results"]
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        for attempt in range(self._retry_count):
+            try:
+                resp = await self._http.post(path, json=payload)
+                break
+            except httpx.TransportError:
+                if attempt == self._retry_count - 1:
+                    raise PromptdisError("Failed to connect to Promptdis server")
+                delay = (0.5 * (2 ** attempt)) + random.uniform(0, 0.25)
+                logger.debug("Retry %d/%d after %.2fs", attempt + 1, self._retry_count, delay)
+                await asyncio.sleep(delay)
+
+        return post_result(resp)
+
     async def _fetch(self, cache_key: str, path: str, params: dict | None = None) -> Prompt:
         entry, is_fresh = self._cache.get(cache_key)
         if entry and is_fresh:
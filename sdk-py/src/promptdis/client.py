@@ -9,6 +9,7 @@ import threading
 
 import httpx
 
+from promptdis._batch import post_result, prefetch_request, store_prefetched
 from promptdis.cache import PromptCache
 from promptdis.models import Prompt
 from promptdis.exceptions import PromptdisError, NotFoundError, AuthenticationError, ForbiddenError
@@ -64,6 +65,48 @@ class PromptClient:
         """Fetch a prompt and render it with Jinja2 variables."""
         return self.get(prompt_id).render(variables)
 
+    def prefetch(
+        self,
+        ids: list[str] | None = None,
+        *,
+        org: str | None = None,
+        app: str | None = None,
+        names: list[str] | None = None,
+        environment: str | None = None,
+    ) -> int:
+        """Warm the cache with many prompts in one request.
+
+        Pass ``ids``, or ``org`` + ``app`` with optional ``names`` (omit names
+        to fetch every active prompt of the app) and ``environment``. Cached
+        entries are revalidated by ETag. Returns the number of prompts cached.
+        """
+        payload, name_key = prefetch_request(self._cache, ids, org, app, names, environment)
+        return store_prefetched(self._cache, self._post("/prompts:batch", payload), name_key)
+
+    def render_many(self, items: list[dict]) -> list[dict]:
+        """Render many prompts server-side in one request.
+
+        Each item is ``{"prompt_id": ..., "variables": {...}}`` or
+        ``{"org": ..., "app": ..., "name": ..., "environment": ..., "variables": {...}}``.
+        Returns one result per item, in order: ``{"rendered_body": ..., ...}`` on
+        success or ``{"error": {"code": ..., "message": ...}}`` on failure.
+        """
+        return self._post("/prompts/render:batch", {"items": items})["results"]
+
+    def _post(self, path: str, payload: dict) -> dict:
+        for attempt in range(self._retry_count):
+            try:
+                resp = self._http.post(path, json=payload)
+                break
+            except httpx.TransportError:
+                if attempt == self._retry_count - 1:
+                    raise PromptdisError("Failed to connect to Promptdis server")
+                delay = (0.5 * (2 ** attempt)) + random.uniform(0, 0.25)
+                logger.debug("Retry %d/%d after %.2fs", attempt + 1, self._retry_count, delay)
+                time.sleep(delay)
+
+        return post_result(resp)
+
     def _fetch(self, cache_key: str, path: str, params: dict | None = None) -> Prompt:
         entry, is_fresh = self._cache.get(cache_key)
         if entry and is_fresh:
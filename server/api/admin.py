@@ -4,38 +4,49 @@ from __future__ import annotations
 
 import json
 import logging
+import math
 
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse
 
-from server.db.database import get_db
+from server.db.database import get_db, write_transaction
 from server.db.queries import organizations as org_queries
 from server.db.queries import applications as app_queries
 from server.db.queries import prompts as prompt_queries
 from server.db.queries import analytics as analytics_queries
 from server.db.queries import users as user_queries
 from server.config import settings
-from server.services.github_service import GitHubService
+from server.services.github_service import (
+    BACKGROUND,
+    INTERACTIVE,
+    AsyncGitHubService,
+    GitHubQuotaExhausted,
+    blob_cache,
+    github_clients,
+    github_metrics,
+    github_quota,
+)
 from server.services.prompt_service import (
     create_prompt,
     update_prompt,
     delete_prompt_file,
     get_prompt_with_content,
 )
-from server.services.render_service import render_prompt, render_prompt_with_includes
+from server.services.render_service import render_prompt, render_prompt_with_includes, template_cache
 from server.services.tts_service import (
     synthesize_tts,
     is_tts_configured,
     TTSError,
     TTSNotConfiguredError,
 )
-from server.services.sync_service import sync_app
+from server.services.sync_service import index_files, sync_app
 from server.services.cache_service import prompt_cache
+from server.services.access_log import access_log_writer
+from server.services.webhook_queue import webhook_queue
 from server.services.credential_service import resolve_credential, resolve_provider_status
 from server.services.provider_registry import get_registry_public
 from server.db.queries import provider_configs as pc_queries
-from server.utils.crypto import decrypt
-from server.utils.front_matter import parse_prompt_file, serialize_prompt_file
+from server.utils.front_matter import git_blob_sha, parse_prompt_file, serialize_prompt_file
 from server.utils.prompty_converter import md_to_prompty, prompty_to_md
 
 logger = logging.getLogger(__name__)
@@ -50,11 +61,21 @@ def _require_user(request: Request) -> dict:
     return user
 
 
-def _get_github_for_user(user: dict) -> GitHubService:
+def _get_github_for_user(user: dict, priority: str = INTERACTIVE) -> AsyncGitHubService:
     token = user.get("access_token_encrypted")
     if not token:
         raise HTTPException(status_code=500, detail={"error": {"code": "INTERNAL_ERROR", "message": "No GitHub token available"}})
-    return GitHubService(decrypt(token))
+    # Background work on a request path fails fast rather than holding the request for quota
+    max_wait = settings.github_quota_max_wait_seconds if priority == BACKGROUND else None
+    return github_clients.get(token, priority=priority, max_wait=max_wait)
+
+
+def _quota_exhausted(e: GitHubQuotaExhausted) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail={"error": {"code": "GITHUB_QUOTA_EXHAUSTED", "message": str(e)}},
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
 
 
 # ── Organizations ──
@@ -106,18 +127,17 @@ async def refresh_orgs(request: Request):
 
     try:
         # Authorized orgs (OAuth app has access)
-        authorized = gh.list_orgs()
+        authorized = await gh.list_orgs()
         authorized_logins = {o["login"] for o in authorized}
 
         # All memberships (includes restricted orgs)
         try:
-            memberships = gh.list_org_memberships()
+            memberships = await gh.list_org_memberships()
         except Exception:
             # Fallback if memberships endpoint fails — just use authorized list
             memberships = [{"login": o["login"], "avatar_url": o["avatar_url"], "state": "active", "role": "member"} for o in authorized]
 
-        gh_user = gh.gh.get_user()
-        personal = {"login": gh_user.login, "avatar_url": gh_user.avatar_url}
+        personal = await gh.get_user_profile()
     except Exception as exc:
         # Detect expired/revoked GitHub token (PyGithub raises GithubException with 401)
         exc_str = str(exc)
@@ -253,7 +273,7 @@ async def create_application(org_id: str, request: Request):
     # Verify repo exists and user has access
     gh = _get_github_for_user(user)
     try:
-        gh.gh.get_repo(github_repo)
+        await gh.get_repo_info(github_repo)
     except Exception:
         raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": f"Cannot access repo: {github_repo}"}})
     finally:
@@ -301,7 +321,8 @@ async def delete_application(app_id: str, request: Request):
     db = await get_db()
     await prompt_queries.delete_prompts_by_app(db, app_id)
     await app_queries.delete_app(db, app_id)
-    prompt_cache.clear()
+    prompt_cache.invalidate_app(app_id)
+    template_cache.invalidate_app(app_id)
     return {"ok": True}
 
 
@@ -320,7 +341,7 @@ async def list_prompts(
     per_page: int = 50,
 ):
     _require_user(request)
-    db = await get_db()
+    db = await get_db(read_only=True)
 
     tag_list = tags.split(",") if tags else None
     offset = (page - 1) * per_page
@@ -414,7 +435,7 @@ async def update_prompt_endpoint(prompt_id: str, request: Request):
         gh.close()
 
     # Invalidate cache
-    prompt_cache.invalidate(f"id:{prompt_id}")
+    prompt_cache.invalidate_prompt(prompt_id)
     return result
 
 
@@ -435,7 +456,7 @@ async def delete_prompt_endpoint(prompt_id: str, request: Request):
     finally:
         gh.close()
 
-    prompt_cache.invalidate(f"id:{prompt_id}")
+    prompt_cache.invalidate_prompt(prompt_id)
     return {"ok": True}
 
 
@@ -453,7 +474,7 @@ async def get_prompt_history(prompt_id: str, request: Request):
 
     gh = _get_github_for_user(user)
     try:
-        history = gh.get_file_history(app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main"))
+        history = await gh.get_file_history(app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main"))
     finally:
         gh.close()
 
@@ -474,7 +495,7 @@ async def get_prompt_diff(prompt_id: str, sha: str, request: Request):
 
     gh = _get_github_for_user(user)
     try:
-        diff = gh.get_diff(app["github_repo"], prompt["file_path"], sha, branch=app.get("default_branch", "main"))
+        diff = await gh.get_diff(app["github_repo"], prompt["file_path"], sha, branch=app.get("default_branch", "main"))
     finally:
         gh.close()
 
@@ -496,7 +517,7 @@ async def get_prompt_at_sha(prompt_id: str, sha: str, request: Request):
 
     gh = _get_github_for_user(user)
     try:
-        content, blob_sha = gh.get_file_content_at_sha(
+        content, blob_sha = await gh.get_file_content_at_sha(
             app["github_repo"], prompt["file_path"], sha
         )
     except ValueError as e:
@@ -535,15 +556,15 @@ async def rollback_prompt(prompt_id: str, request: Request):
     gh = _get_github_for_user(user)
     try:
         # Get the file content at the target SHA
-        old_content, _ = gh.get_file_content_at_sha(
+        old_content, _ = await gh.get_file_content_at_sha(
             app["github_repo"], prompt["file_path"], target_sha
         )
         # Get current file SHA (needed for update)
-        _, current_sha = gh.get_file_content(
+        _, current_sha = await gh.get_file_content(
             app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main")
         )
         # Commit the old content as a new commit
-        new_commit_sha = gh.update_file(
+        new_commit_sha = await gh.update_file(
             app["github_repo"],
             prompt["file_path"],
             old_content,
@@ -559,7 +580,7 @@ async def rollback_prompt(prompt_id: str, request: Request):
         gh.close()
 
     # Invalidate cache for this prompt
-    prompt_cache.invalidate(f"id:{prompt_id}")
+    prompt_cache.invalidate_prompt(prompt_id)
 
     # Re-sync the prompt from GitHub to update DB metadata
     from server.services.sync_service import sync_app
@@ -592,14 +613,15 @@ async def toggle_prompt_active(prompt_id: str, request: Request):
     if not prompt:
         raise HTTPException(status_code=404, detail={"error": {"code": "PROMPT_NOT_FOUND", "message": "Prompt not found"}})
 
-    await db.execute(
-        "UPDATE prompts SET active = ?, updated_at = datetime('now') WHERE id = ?",
-        (active, prompt_id),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            "UPDATE prompts SET active = ?, updated_at = datetime('now') WHERE id = ?",
+            (active, prompt_id),
+        )
 
-    # Invalidate cache for this prompt
-    prompt_cache.invalidate(f"id:{prompt_id}")
+    # Invalidate cache for this prompt (and templates that include it)
+    prompt_cache.invalidate_prompt(prompt_id)
+    template_cache.invalidate(prompt["app_id"], prompt_id, prompt["name"])
 
     return {"ok": True, "active": active}
 
@@ -650,7 +672,7 @@ async def batch_update_prompts(request: Request):
     try:
         files_to_update = []
         for p in prompts:
-            content, _ = gh.get_file_content(
+            content, _ = await gh.get_file_content(
                 app["github_repo"], p["file_path"],
                 branch=app.get("default_branch", "main"),
             )
@@ -671,7 +693,7 @@ async def batch_update_prompts(request: Request):
             new_content = serialize_prompt_file(fm, body_text)
             files_to_update.append({"path": p["file_path"], "content": new_content})
 
-        commit_sha = gh.create_or_update_files(
+        commit_sha = await gh.create_or_update_files(
             app["github_repo"],
             files_to_update,
             commit_message=commit_message,
@@ -682,16 +704,11 @@ async def batch_update_prompts(request: Request):
     finally:
         gh.close()
 
-    # Re-sync affected prompts
-    gh2 = _get_github_for_user(user)
-    try:
-        await sync_app(db, app, gh2)
-    finally:
-        gh2.close()
-
-    # Invalidate caches
-    for pid in prompt_ids:
-        prompt_cache.invalidate(f"id:{pid}")
+    # Index the committed contents directly (blob SHAs match what GitHub stored)
+    await index_files(
+        db, app_id,
+        [{"path": f["path"], "content": f["content"], "sha": git_blob_sha(f["content"])} for f in files_to_update],
+    )
 
     return {"ok": True, "updated": len(prompts), "commit_sha": commit_sha}
 
@@ -733,11 +750,11 @@ async def batch_delete_prompts(request: Request):
         # (set content to empty blob with mode 100644 won't work — use delete_file per file for now,
         #  or better: create tree without these paths)
         for p in prompts:
-            _, file_sha = gh.get_file_content(
+            _, file_sha = await gh.get_file_content(
                 app["github_repo"], p["file_path"],
                 branch=app.get("default_branch", "main"),
             )
-            gh.delete_file(
+            await gh.delete_file(
                 app["github_repo"], p["file_path"],
                 commit_message=commit_message,
                 sha=file_sha,
@@ -749,7 +766,8 @@ async def batch_delete_prompts(request: Request):
     # Delete from DB
     for p in prompts:
         await prompt_queries.delete_prompt(db, p["id"])
-        prompt_cache.invalidate(f"id:{p['id']}")
+        prompt_cache.invalidate_prompt(p["id"])
+        template_cache.invalidate(p["app_id"], p["id"], p["name"])
 
     return {"ok": True, "deleted": len(prompts)}
 
@@ -830,7 +848,7 @@ async def import_prompty(request: Request):
 @router.get("/analytics/requests-per-day")
 async def analytics_requests_per_day(request: Request, app_id: str | None = None, days: int = 30):
     _require_user(request)
-    db = await get_db()
+    db = await get_db(read_only=True)
     data = await analytics_queries.requests_per_day(db, app_id=app_id, days=days)
     return {"items": data}
 
@@ -838,7 +856,7 @@ async def analytics_requests_per_day(request: Request, app_id: str | None = None
 @router.get("/analytics/cache-hit-rate")
 async def analytics_cache_hit_rate(request: Request, app_id: str | None = None, days: int = 30):
     _require_user(request)
-    db = await get_db()
+    db = await get_db(read_only=True)
     data = await analytics_queries.cache_hit_rate(db, app_id=app_id, days=days)
     return {"items": data}
 
@@ -846,7 +864,7 @@ async def analytics_cache_hit_rate(request: Request, app_id: str | None = None,
 @router.get("/analytics/latency")
 async def analytics_latency(request: Request, app_id: str | None = None, days: int = 7):
     _require_user(request)
-    db = await get_db()
+    db = await get_db(read_only=True)
     data = await analytics_queries.latency_percentiles(db, app_id=app_id, days=days)
     return {"items": data}
 
@@ -854,7 +872,7 @@ async def analytics_latency(request: Request, app_id: str | None = None, days: i
 @router.get("/analytics/top-prompts")
 async def analytics_top_prompts(request: Request, app_id: str | None = None, days: int = 30, limit: int = 10):
     _require_user(request)
-    db = await get_db()
+    db = await get_db(read_only=True)
     data = await analytics_queries.top_prompts(db, app_id=app_id, days=days, limit=limit)
     return {"items": data}
 
@@ -862,11 +880,18 @@ async def analytics_top_prompts(request: Request, app_id: str | None = None, day
 @router.get("/analytics/usage-by-key")
 async def analytics_usage_by_key(request: Request, days: int = 30, limit: int = 10):
     _require_user(request)
-    db = await get_db()
+    db = await get_db(read_only=True)
     data = await analytics_queries.usage_by_api_key(db, days=days, limit=limit)
     return {"items": data}
 
 
+@router.get("/analytics/access-log/stats")
+async def analytics_access_log_stats(request: Request):
+    """Queue depth and write/drop counters for the buffered access-log writer."""
+    _require_user(request)
+    return access_log_writer.stats()
+
+
 # ── TTS ──
 
 @router.get("/tts/status")
@@ -902,10 +927,10 @@ async def tts_preview(prompt_id: str, request: Request):
     try:
         if includes:
             rendered_body = await render_prompt_with_includes(
-                prompt_body, variables, db, prompt["app_id"]
+                prompt_body, variables, db, prompt["app_id"], cache_for=(prompt["app_id"], prompt_id)
             )
         else:
-            rendered_body = render_prompt(prompt_body, variables)
+            rendered_body = render_prompt(prompt_body, variables, cache_for=(prompt["app_id"], prompt_id))
     except ValueError as e:
         raise HTTPException(
             status_code=400,
@@ -1072,9 +1097,8 @@ async def list_github_orgs(request: Request):
     user = _require_user(request)
     gh = _get_github_for_user(user)
     try:
-        gh_user = gh.gh.get_user()
-        personal = {"login": gh_user.login, "avatar_url": gh_user.avatar_url, "description": "Personal account"}
-        orgs = gh.list_orgs()
+        personal = {**await gh.get_user_profile(), "description": "Personal account"}
+        orgs = await gh.list_orgs()
     finally:
         gh.close()
     return {"items": [personal] + orgs}
@@ -1086,7 +1110,7 @@ async def list_github_repos(request: Request, org: str):
     user = _require_user(request)
     gh = _get_github_for_user(user)
     try:
-        repos = gh.list_org_repos(org)
+        repos = await gh.list_org_repos(org)
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": {"code": "GITHUB_ERROR", "message": str(e)}})
     finally:
@@ -1094,13 +1118,37 @@ async def list_github_repos(request: Request, org: str):
     return {"items": repos}
 
 
+@router.get("/github/metrics")
+async def github_call_metrics(request: Request):
+    """Per-method GitHub call counts and latencies, plus client pool and blob cache stats, for this process."""
+    _require_user(request)
+    return {
+        "methods": github_metrics.stats(),
+        "client_pool": github_clients.stats(),
+        "blob_cache": blob_cache.stats(),
+    }
+
+
+@router.get("/github/quota")
+async def github_quota_status(request: Request):
+    """Remaining GitHub rate-limit quota per token seen by this process, and the caller's own."""
+    user = _require_user(request)
+    gh = _get_github_for_user(user)
+    try:
+        current = github_quota.quota(gh.service.token_id)
+    finally:
+        gh.close()
+    return {**github_quota.stats(), "current": current}
+
+
 # ── Sync ──
 
 @router.post("/sync")
 async def force_sync_all(request: Request):
     user = _require_user(request)
     db = await get_db()
-    gh = _get_github_for_user(user)
+    # Bulk work: yields GitHub quota and threads to interactive admin calls
+    gh = _get_github_for_user(user, priority=BACKGROUND)
 
     orgs = await org_queries.list_orgs_for_user(db, user["id"])
     total_synced = 0
@@ -1109,31 +1157,34 @@ async def force_sync_all(request: Request):
         for org in orgs:
             apps = await app_queries.list_apps_for_org(db, org["id"])
             for app in apps:
-                count = await sync_app(db, app, gh)
-                total_synced += count
+                result = await sync_app(db, app, gh)
+                total_synced += result["synced"]
+    except GitHubQuotaExhausted as e:
+        raise _quota_exhausted(e) from e
     finally:
         gh.close()
 
-    prompt_cache.clear()
     return {"synced": total_synced}
 
 
 @router.post("/apps/{app_id}/sync")
-async def force_sync_app(app_id: str, request: Request):
+async def force_sync_app(app_id: str, request: Request, full: bool = False):
+    """Reconcile an app with its repo; ``full=true`` re-indexes every file."""
     user = _require_user(request)
     db = await get_db()
     app = await app_queries.get_app(db, app_id)
     if not app:
         raise HTTPException(status_code=404)
 
-    gh = _get_github_for_user(user)
+    gh = _get_github_for_user(user, priority=BACKGROUND)
     try:
-        count = await sync_app(db, app, gh)
+        result = await sync_app(db, app, gh, full=full)
+    except GitHubQuotaExhausted as e:
+        raise _quota_exhausted(e) from e
     finally:
         gh.close()
 
-    prompt_cache.clear()
-    return {"synced": count}
+    return result
 
 
 @router.get("/sync/status")
@@ -1144,4 +1195,4 @@ async def sync_status(request: Request):
         "SELECT id, github_repo, display_name, last_synced_at FROM applications ORDER BY last_synced_at DESC"
     ) as cursor:
         rows = await cursor.fetchall()
-    return {"items": [dict(r) for r in rows], "cache_size": prompt_cache.size}
+    return {"items": [dict(r) for r in rows], "cache_size": prompt_cache.size, "webhook_queue": webhook_queue.stats()}
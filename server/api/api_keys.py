@@ -9,7 +9,7 @@ from fastapi import APIRouter, HTTPException, Request
 from server.db.database import get_db
 from server.db.queries import api_keys as key_queries
 from server.db.queries import applications as app_queries
-from server.auth.api_keys import generate_api_key
+from server.auth.api_keys import generate_api_key, verified_key_cache
 
 router = APIRouter(prefix="/api/v1/admin/api-keys", tags=["api-keys"])
 
@@ -21,6 +21,13 @@ def _require_user(request: Request) -> dict:
     return user
 
 
+def _require_admin(request: Request) -> dict:
+    user = _require_user(request)
+    if not user.get("is_admin"):
+        raise HTTPException(status_code=403, detail={"error": {"code": "FORBIDDEN", "message": "Admin access required"}})
+    return user
+
+
 @router.get("")
 async def list_api_keys(request: Request):
     user = _require_user(request)
@@ -38,6 +45,13 @@ async def list_api_keys(request: Request):
     return {"items": keys}
 
 
+@router.get("/cache-stats")
+async def api_key_cache_stats(request: Request):
+    """Hit/miss counters for the in-process verified API key cache (admins only)."""
+    _require_admin(request)
+    return verified_key_cache.stats()
+
+
 @router.post("")
 async def create_api_key(request: Request):
     user = _require_user(request)
@@ -64,6 +78,14 @@ async def create_api_key(request: Request):
                 detail={"error": {"code": "VALIDATION_ERROR", "message": f"Application '{aid}' not found"}},
             )
 
+    # Optional per-key rate limit (requests per minute); otherwise RATE_LIMIT_PER_MINUTE
+    rate_limit = scopes.get("rate_limit_per_minute")
+    if rate_limit is not None and (not isinstance(rate_limit, int) or isinstance(rate_limit, bool) or rate_limit < 1):
+        raise HTTPException(
+            status_code=400,
+            detail={"error": {"code": "VALIDATION_ERROR", "message": "scopes.rate_limit_per_minute must be a positive integer"}},
+        )
+
     scopes.setdefault("permissions", ["read"])
     scopes_json = json.dumps(scopes)
     expires_at = body.get("expires_at")
@@ -92,4 +114,5 @@ async def revoke_api_key(key_id: str, request: Request):
     success = await key_queries.revoke_key(db, key_id, user["id"])
     if not success:
         raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "message": "API key not found"}})
+    verified_key_cache.invalidate_key_id(key_id)
     return {"ok": True}
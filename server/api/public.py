@@ -2,30 +2,50 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import time
 
 from fastapi import APIRouter, HTTPException, Request, Response
 
+from server.config import settings
 from server.db.database import get_db
 from server.db.queries import prompts as prompt_queries
 from server.services.github_service import GitHubService
-from server.services.render_service import render_prompt, render_prompt_with_includes
-from server.services.cache_service import prompt_cache
+from server.services.render_service import (
+    compile_template,
+    compile_template_with_includes,
+    render_prompt,
+    render_prompt_with_includes,
+    render_template,
+)
+from server.services.cache_service import CacheEntry, prompt_cache, prompt_loads
+from server.services.access_log import access_log_writer
 from server.auth.api_keys import check_scope
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1/prompts", tags=["prompts"])
+# Collection-level routes (``/api/v1/prompts:batch``) cannot live under the
+# ``/api/v1/prompts`` prefix, which requires a ``/`` after it
+batch_router = APIRouter(prefix="/api/v1", tags=["prompts"])
 
+# Strong refs to background revalidation tasks so they are not GC'd mid-flight
+_background_tasks: set[asyncio.Task] = set()
 
-def _enforce_app_scope(request: Request, app_id: str | None) -> None:
-    """Raise 403 if the API key's scopes don't include the prompt's app."""
+
+def _has_app_scope(request: Request, app_id: str | None) -> bool:
+    """True if the request may access the app (session auth or key scopes allow it)."""
     scopes = getattr(request.state, "api_key_scopes", None)
     if scopes is None:
-        return  # session auth or no scopes set
-    if not check_scope(scopes, app_id=app_id):
+        return True  # session auth or no scopes set
+    return check_scope(scopes, app_id=app_id)
+
+
+def _enforce_app_scope(request: Request, app_id: str | None) -> None:
+    """Raise 403 if the API key's scopes don't include the prompt's app."""
+    if not _has_app_scope(request, app_id):
         raise HTTPException(
             status_code=403,
             detail={"error": {"code": "FORBIDDEN", "message": "API key does not have access to this application"}},
@@ -43,33 +63,72 @@ def _get_github(request: Request) -> GitHubService:
     raise HTTPException(status_code=500, detail="GitHub service unavailable")
 
 
-@router.get("/{prompt_id}")
-async def get_prompt(prompt_id: str, request: Request, response: Response):
-    """Fetch a prompt by UUID."""
-    start = time.time()
+_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+
+
+def _gzip_etag(etag: str) -> str:
+    """ETag of the gzip variant: distinct from the identity body's strong ETag."""
+    return f'{etag[:-1]}-gz"' if etag.endswith('"') else f"{etag}-gz"
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """True if an Accept-Encoding header allows gzip (honouring ``q=0`` and ``*``)."""
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    for coding in ("gzip", "x-gzip"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return qualities.get("*", 0.0) > 0
+
+
+def _etag_matches(if_none_match: str, etags: tuple[str, ...]) -> bool:
+    """Weak If-None-Match comparison of a (possibly listed) header against ``etags``."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.removeprefix("W/") in etags:
+            return True
+    return False
+
+
+def _cached_response(request: Request, entry: CacheEntry) -> Response:
+    """Serve a cache entry's pre-encoded JSON (gzip when accepted), or 304 on ETag match.
+
+    The two encodings are different bytes, so each carries its own strong ETag.
+    Both describe the same prompt, though, so a 304 is sent when the client
+    holds either one (the batch endpoint and SDK prefetch hand out the identity
+    ETag, which gzip-accepting clients then revalidate with).
+    """
+    use_gzip = entry.payload_gzip is not None and _accepts_gzip(
+        request.headers.get("accept-encoding", "")
+    )
+    etag = _gzip_etag(entry.etag) if use_gzip else entry.etag
+    headers = {"ETag": etag, "Cache-Control": _CACHE_CONTROL, "Vary": "Accept-Encoding"}
     if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, (entry.etag, _gzip_etag(entry.etag))):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=entry.payload_gzip, media_type="application/json", headers=headers)
+    return Response(content=entry.payload, media_type="application/json", headers=headers)
 
-    # Check cache
-    cached, etag, is_fresh = prompt_cache.get(f"id:{prompt_id}")
-    if cached and is_fresh:
-        _enforce_app_scope(request, cached.get("app_id"))
-        if if_none_match and if_none_match == etag:
-            _log_access(request, prompt_id, cached.get("name"), True, start)
-            return Response(status_code=304)
-        response.headers["ETag"] = etag
-        response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
-        _log_access(request, prompt_id, cached.get("name"), True, start)
-        return cached
-
-    # Cache miss — fetch from DB + GitHub
-    db = await get_db()
-    prompt = await prompt_queries.get_prompt(db, prompt_id)
-    if not prompt:
-        raise HTTPException(status_code=404, detail={"error": {"code": "PROMPT_NOT_FOUND", "message": f"No prompt found with id '{prompt_id}'"}})
-
-    _enforce_app_scope(request, prompt.get("app_id"))
 
-    # Build response from SQLite metadata (avoid GitHub API call for basic fetch)
+def _build_public_prompt(prompt: dict, app_id: str, org: str, app_name: str) -> dict:
+    """Build the public API response dict from a prompts row."""
     fm = json.loads(prompt.get("front_matter", "{}"))
     tags = prompt.get("tags", "[]")
     if isinstance(tags, str):
@@ -78,13 +137,13 @@ async def get_prompt(prompt_id: str, request: Request, response: Response):
         except (json.JSONDecodeError, TypeError):
             tags = []
 
-    result = {
+    return {
         "id": prompt["id"],
-        "app_id": prompt.get("app_id"),
+        "app_id": app_id,
         "name": prompt["name"],
         "version": fm.get("version", prompt.get("version", "")),
-        "org": fm.get("org", ""),
-        "app": fm.get("app", ""),
+        "org": org,
+        "app": app_name,
         "domain": prompt.get("domain"),
         "description": prompt.get("description"),
         "type": prompt.get("type", "chat"),
@@ -102,99 +161,399 @@ async def get_prompt(prompt_id: str, request: Request, response: Response):
         "updated_at": prompt.get("updated_at"),
     }
 
-    # Cache it
-    etag = f'"{result.get("version", "0")}-{(result.get("git_sha") or "")[:8]}"'
-    prompt_cache.put(f"id:{prompt_id}", result, etag)
 
-    if if_none_match and if_none_match == etag:
-        _log_access(request, prompt_id, result.get("name"), False, start)
-        return Response(status_code=304)
+def _etag_for(result: dict) -> str:
+    return f'"{result.get("version", "0")}-{(result.get("git_sha") or "")[:8]}"'
+
+
+async def _load_prompt_by_id(prompt_id: str) -> CacheEntry | None:
+    """Rebuild the id:<prompt_id> cache entry from SQLite. Returns None if not found."""
+    db = await get_db(read_only=True)
+    prompt = await prompt_queries.get_prompt(db, prompt_id)
+    if not prompt:
+        return None
+
+    # Build response from SQLite metadata (avoid GitHub API call for basic fetch)
+    fm = json.loads(prompt.get("front_matter", "{}"))
+    result = _build_public_prompt(prompt, prompt.get("app_id"), fm.get("org", ""), fm.get("app", ""))
+    return prompt_cache.put(
+        f"id:{prompt_id}", result, _etag_for(result), file_path=prompt.get("file_path")
+    )
+
+
+async def _load_prompt_by_name(
+    cache_key: str, org: str, app_name: str, name: str, environment: str | None
+) -> tuple[str | None, CacheEntry | None]:
+    """Rebuild a name:* cache entry from SQLite. Returns (app_id, entry); either may be None."""
+    db = await get_db(read_only=True)
+    app = await prompt_queries.find_app_by_org_and_repo(db, org, app_name)
+    if not app:
+        return None, None
+
+    prompt = await prompt_queries.get_prompt_by_name(db, app["id"], name, environment)
+    if not prompt:
+        return app["id"], None
+
+    result = _build_public_prompt(prompt, app["id"], org, app_name)
+    entry = prompt_cache.put(cache_key, result, _etag_for(result), file_path=prompt.get("file_path"))
+    prompt_cache.put_entry(f"id:{prompt['id']}", entry)
+    return app["id"], entry
+
+
+def _revalidate_in_background(cache_key: str, loader) -> None:
+    """Refresh a stale entry unless a rebuild for this key is already running."""
+    if prompt_loads.in_flight(cache_key):
+        return
+
+    async def _refresh():
+        try:
+            await prompt_loads.do(cache_key, loader)
+        except Exception:
+            logger.exception("Background revalidation failed for %s", cache_key)
+
+    task = asyncio.get_running_loop().create_task(_refresh())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@router.get("/{prompt_id}")
+async def get_prompt(prompt_id: str, request: Request):
+    """Fetch a prompt by UUID."""
+    start = time.time()
+    cache_key = f"id:{prompt_id}"
+
+    async def loader():
+        entry = await _load_prompt_by_id(prompt_id)
+        if entry is None:
+            prompt_cache.invalidate(cache_key)
+        return entry
+
+    # Check cache — stale entries are served while one coroutine revalidates
+    entry, is_fresh = prompt_cache.get_entry(cache_key)
+    if entry:
+        _enforce_app_scope(request, entry.data.get("app_id"))
+        if not is_fresh:
+            _revalidate_in_background(cache_key, loader)
+        _log_access(request, prompt_id, entry.data.get("name"), True, start)
+        return _cached_response(request, entry)
+
+    # Cache miss — exactly one coroutine per key hits the DB
+    entry = await prompt_loads.do(cache_key, loader)
+    if entry is None:
+        raise HTTPException(status_code=404, detail={"error": {"code": "PROMPT_NOT_FOUND", "message": f"No prompt found with id '{prompt_id}'"}})
 
-    response.headers["ETag"] = etag
-    response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
-    _log_access(request, prompt_id, result.get("name"), False, start)
-    return result
+    _enforce_app_scope(request, entry.data.get("app_id"))
+    _log_access(request, prompt_id, entry.data.get("name"), False, start)
+    return _cached_response(request, entry)
 
 
 @router.get("/by-name/{org}/{app_name}/{name}")
 async def get_prompt_by_name(
     org: str, app_name: str, name: str,
-    request: Request, response: Response,
+    request: Request,
     environment: str | None = None,
 ):
     """Fetch a prompt by its fully qualified name (org/app/name)."""
     start = time.time()
     cache_key = f"name:{org}/{app_name}/{name}:{environment or 'any'}"
-    if_none_match = request.headers.get("if-none-match")
 
-    # Check cache
-    cached, etag, is_fresh = prompt_cache.get(cache_key)
-    if cached and is_fresh:
-        _enforce_app_scope(request, cached.get("app_id"))
-        if if_none_match and if_none_match == etag:
-            _log_access(request, cached.get("id", ""), name, True, start)
-            return Response(status_code=304)
-        response.headers["ETag"] = etag
-        response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
-        _log_access(request, cached.get("id", ""), name, True, start)
-        return cached
-
-    # Cache miss
-    db = await get_db()
-    app = await prompt_queries.find_app_by_org_and_repo(db, org, app_name)
-    if not app:
+    async def loader():
+        app_id, entry = await _load_prompt_by_name(cache_key, org, app_name, name, environment)
+        if entry is None:
+            prompt_cache.invalidate(cache_key)
+        return app_id, entry
+
+    # Check cache — stale entries are served while one coroutine revalidates
+    entry, is_fresh = prompt_cache.get_entry(cache_key)
+    if entry:
+        _enforce_app_scope(request, entry.data.get("app_id"))
+        if not is_fresh:
+            _revalidate_in_background(cache_key, loader)
+        _log_access(request, entry.data.get("id", ""), name, True, start)
+        return _cached_response(request, entry)
+
+    # Cache miss — exactly one coroutine per key hits the DB
+    app_id, entry = await prompt_loads.do(cache_key, loader)
+    if app_id is None:
         raise HTTPException(status_code=404, detail={"error": {"code": "APP_NOT_FOUND", "message": f"No app found for {org}/{app_name}"}})
 
-    _enforce_app_scope(request, app["id"])
+    _enforce_app_scope(request, app_id)
 
-    prompt = await prompt_queries.get_prompt_by_name(db, app["id"], name, environment)
-    if not prompt:
+    if entry is None:
         raise HTTPException(status_code=404, detail={"error": {"code": "PROMPT_NOT_FOUND", "message": f"No prompt found: {org}/{app_name}/{name}"}})
 
-    fm = json.loads(prompt.get("front_matter", "{}"))
-    tags = prompt.get("tags", "[]")
-    if isinstance(tags, str):
+    _log_access(request, entry.data["id"], name, False, start)
+    return _cached_response(request, entry)
+
+
+@batch_router.get("/prompts:batch")
+async def get_prompts_batch_query(
+    request: Request,
+    ids: str | None = None,
+    org: str | None = None,
+    app: str | None = None,
+    names: str | None = None,
+    environment: str | None = None,
+):
+    """Fetch many prompts in one call (comma-separated ``ids`` or ``names``)."""
+    return await _get_prompts_batch(
+        request,
+        ids=[i for i in (ids or "").split(",") if i],
+        org=org,
+        app=app,
+        names=[n for n in (names or "").split(",") if n],
+        environment=environment,
+        etags={},
+    )
+
+
+@batch_router.post("/prompts:batch")
+async def get_prompts_batch(request: Request):
+    """Fetch many prompts in one call.
+
+    Body: ``{"ids": [...]}``, ``{"org", "app", "names": [...]}`` or
+    ``{"org", "app"}`` for every active prompt of the app, each with optional
+    ``environment``. ``etags`` maps prompt id to a known ETag; unchanged
+    prompts come back as ``{"id", "name", "etag", "not_modified": true}``.
+    """
+    body = await request.json()
+    return await _get_prompts_batch(
+        request,
+        ids=body.get("ids") or [],
+        org=body.get("org"),
+        app=body.get("app"),
+        names=body.get("names") or [],
+        environment=body.get("environment"),
+        etags=body.get("etags") or {},
+    )
+
+
+async def _get_prompts_batch(
+    request: Request,
+    ids: list[str],
+    org: str | None,
+    app: str | None,
+    names: list[str],
+    environment: str | None,
+    etags: dict[str, str],
+) -> dict:
+    start = time.time()
+    if not isinstance(ids, list) or not isinstance(names, list) or not isinstance(etags, dict):
+        raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": "ids and names must be lists, etags an object"}})
+    if ids and (names or org or app):
+        raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": "Use either ids or org/app (with optional names)"}})
+    if not ids and not (org and app):
+        raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": "ids or org and app are required"}})
+    if len(ids) + len(names) > settings.prompt_batch_max_items:
+        raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": f"At most {settings.prompt_batch_max_items} ids or names per batch"}})
+
+    db = await get_db(read_only=True)
+    # (entry, served from prompt_cache) in response order
+    entries: list[tuple[CacheEntry, bool]] = []
+    errors: list[dict] = []
+
+    if ids:
+        wanted = list(dict.fromkeys(ids))
+        # Fresh server-cache entries are used as-is; one IN query for the rest
+        hits: dict[str, CacheEntry] = {}
+        for prompt_id in wanted:
+            entry, is_fresh = prompt_cache.get_entry(f"id:{prompt_id}")
+            if entry and is_fresh:
+                hits[prompt_id] = entry
+        rows = await prompt_queries.get_prompts_by_ids(db, [i for i in wanted if i not in hits])
+        for prompt_id in wanted:
+            if prompt_id in hits:
+                entries.append((hits[prompt_id], True))
+                continue
+            prompt = rows.get(prompt_id)
+            if not prompt:
+                errors.append({"id": prompt_id, "code": "PROMPT_NOT_FOUND"})
+                continue
+            fm = json.loads(prompt.get("front_matter", "{}"))
+            result = _build_public_prompt(prompt, prompt.get("app_id"), fm.get("org", ""), fm.get("app", ""))
+            entries.append((prompt_cache.put(
+                f"id:{prompt_id}", result, _etag_for(result), file_path=prompt.get("file_path")
+            ), False))
+        allowed = []
+        for entry, cache_hit in entries:
+            if _has_app_scope(request, entry.data.get("app_id")):
+                allowed.append((entry, cache_hit))
+            else:
+                errors.append({"id": entry.data["id"], "code": "FORBIDDEN"})
+        entries = allowed
+    else:
+        app_row = await prompt_queries.find_app_by_org_and_repo(db, org, app)
+        if not app_row:
+            raise HTTPException(status_code=404, detail={"error": {"code": "APP_NOT_FOUND", "message": f"No app found for {org}/{app}"}})
+        _enforce_app_scope(request, app_row["id"])
+
+        if names:
+            rows = await prompt_queries.get_prompts_by_names(db, app_row["id"], list(dict.fromkeys(names)))
+            prompts = []
+            for name in dict.fromkeys(names):
+                prompt = rows.get(name)
+                if prompt and (not environment or prompt.get("environment") == environment):
+                    prompts.append(prompt)
+                else:
+                    errors.append({"name": name, "code": "PROMPT_NOT_FOUND"})
+        else:
+            prompts = await prompt_queries.list_active_prompts(db, app_row["id"], environment)
+
+        for prompt in prompts:
+            result = _build_public_prompt(prompt, app_row["id"], org, app)
+            entry = prompt_cache.put(
+                f"name:{org}/{app}/{prompt['name']}:{environment or 'any'}",
+                result, _etag_for(result), file_path=prompt.get("file_path"),
+            )
+            prompt_cache.put_entry(f"id:{prompt['id']}", entry)
+            entries.append((entry, False))
+
+    items = []
+    for entry, cache_hit in entries:
+        data = entry.data
+        known = etags.get(data["id"])
+        if isinstance(known, str) and _etag_matches(known, (entry.etag, _gzip_etag(entry.etag))):
+            items.append({"id": data["id"], "name": data["name"], "etag": entry.etag, "not_modified": True})
+        else:
+            items.append({"etag": entry.etag, "prompt": data})
+        _log_access(request, data["id"], data["name"], cache_hit, start)
+
+    return {"prompts": items, "errors": errors}
+
+
+@router.post("/render:batch")
+async def render_prompts_batch(request: Request):
+    """Render many prompts in one call.
+
+    Each item is ``{"prompt_id", "variables"}`` or ``{"org", "app", "name",
+    "environment"?, "variables"}``. Prompts are fetched with one ``IN`` query
+    per lookup kind, templates come from the compiled-template cache, and
+    results (or per-item errors) are returned in request order. Batches of
+    ``render_batch_thread_threshold`` or more items render concurrently in
+    worker threads, at most ``render_batch_concurrency`` at a time.
+    """
+    body = await request.json()
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": "items (non-empty list) is required"}})
+    if len(items) > settings.render_batch_max_items:
+        raise HTTPException(status_code=400, detail={"error": {"code": "VALIDATION_ERROR", "message": f"At most {settings.render_batch_max_items} items per batch"}})
+
+    db = await get_db(read_only=True)
+    lookups = await _lookup_batch_prompts(db, request, items)
+
+    results: list[dict] = []
+    jobs: list[tuple[int, object, dict]] = []
+    for index, (item, found) in enumerate(zip(items, lookups, strict=True)):
+        if "error" in found:
+            results.append({"index": index, **found})
+            continue
+        prompt = found["prompt"]
+        variables = item.get("variables", {})
+        if not isinstance(variables, dict):
+            results.append(_batch_error(index, "VALIDATION_ERROR", "variables must be an object"))
+            continue
+        if not _has_app_scope(request, prompt.get("app_id")):
+            results.append(_batch_error(index, "FORBIDDEN", "API key does not have access to this application"))
+            continue
+
+        fm = json.loads(prompt.get("front_matter", "{}"))
+        template_body = fm.get("_body", "")
+        cache_for = (prompt["app_id"], prompt["id"])
         try:
-            tags = json.loads(tags)
-        except (json.JSONDecodeError, TypeError):
-            tags = []
+            if fm.get("includes", []):
+                template = await compile_template_with_includes(template_body, db, prompt["app_id"], cache_for)
+            else:
+                template = compile_template(template_body, cache_for)
+        except ValueError as e:
+            results.append(_batch_error(index, "RENDER_ERROR", str(e)))
+            continue
+
+        results.append({
+            "index": index,
+            "id": prompt["id"],
+            "name": prompt["name"],
+            "rendered_body": None,
+            "meta": fm,
+            "model": fm.get("model", {}),
+        })
+        jobs.append((len(results) - 1, template, variables))
+
+    # Small batches render inline; larger ones fan out to worker threads so
+    # the event loop stays free while the items render at the same time
+    if len(jobs) >= settings.render_batch_thread_threshold:
+        slots = asyncio.Semaphore(max(1, settings.render_batch_concurrency))
+
+        async def render_in_thread(template, variables):
+            async with slots:
+                return await asyncio.to_thread(_render_job, template, variables)
+
+        rendered = await asyncio.gather(*(render_in_thread(t, v) for _, t, v in jobs))
+    else:
+        rendered = [_render_job(t, v) for _, t, v in jobs]
+
+    for (pos, _, _), output in zip(jobs, rendered, strict=True):
+        if isinstance(output, ValueError):
+            results[pos] = _batch_error(results[pos]["index"], "RENDER_ERROR", str(output))
+        else:
+            results[pos]["rendered_body"] = output
 
-    result = {
-        "id": prompt["id"],
-        "app_id": app["id"],
-        "name": prompt["name"],
-        "version": fm.get("version", prompt.get("version", "")),
-        "org": org,
-        "app": app_name,
-        "domain": prompt.get("domain"),
-        "description": prompt.get("description"),
-        "type": prompt.get("type", "chat"),
-        "role": fm.get("role", "system"),
-        "model": fm.get("model", {}),
-        "modality": fm.get("modality"),
-        "tts": fm.get("tts"),
-        "audio": fm.get("audio"),
-        "environment": prompt.get("environment", "development"),
-        "active": bool(prompt.get("active", True)),
-        "tags": tags,
-        "body": fm.get("_body", ""),
-        "includes": fm.get("includes", []),
-        "git_sha": prompt.get("git_sha"),
-        "updated_at": prompt.get("updated_at"),
-    }
+    return {"results": results}
 
-    etag = f'"{result.get("version", "0")}-{(result.get("git_sha") or "")[:8]}"'
-    prompt_cache.put(cache_key, result, etag)
-    prompt_cache.put(f"id:{prompt['id']}", result, etag)
 
-    if if_none_match and if_none_match == etag:
-        _log_access(request, prompt["id"], name, False, start)
-        return Response(status_code=304)
+def _batch_error(index: int, code: str, message: str) -> dict:
+    return {"index": index, "error": {"code": code, "message": message}}
 
-    response.headers["ETag"] = etag
-    response.headers["Cache-Control"] = "public, max-age=60, stale-while-revalidate=300"
-    _log_access(request, prompt["id"], name, False, start)
-    return result
+
+def _render_job(template, variables: dict) -> str | ValueError:
+    try:
+        return render_template(template, variables)
+    except ValueError as e:
+        return e
+
+
+async def _lookup_batch_prompts(db, request: Request, items: list) -> list[dict]:
+    """Resolve batch items to ``{"prompt": row}`` or ``{"error": {...}}``, in order."""
+    ids = {it["prompt_id"] for it in items if isinstance(it, dict) and it.get("prompt_id")}
+    by_id = await prompt_queries.get_prompts_by_ids(db, sorted(ids))
+
+    names: dict[tuple[str, str], set[str]] = {}
+    for it in items:
+        if isinstance(it, dict) and not it.get("prompt_id") and it.get("org") and it.get("app") and it.get("name"):
+            names.setdefault((it["org"], it["app"]), set()).add(it["name"])
+
+    apps: dict[tuple[str, str], dict | None] = {}
+    by_name: dict[tuple[str, str], dict[str, dict]] = {}
+    for (org, app_name), app_names in names.items():
+        app = await prompt_queries.find_app_by_org_and_repo(db, org, app_name)
+        apps[(org, app_name)] = app
+        if app:
+            by_name[(org, app_name)] = await prompt_queries.get_prompts_by_names(db, app["id"], sorted(app_names))
+
+    found: list[dict] = []
+    for it in items:
+        if not isinstance(it, dict):
+            found.append({"error": {"code": "VALIDATION_ERROR", "message": "Each item must be an object"}})
+        elif it.get("prompt_id"):
+            prompt = by_id.get(it["prompt_id"])
+            if prompt:
+                found.append({"prompt": prompt})
+            else:
+                found.append({"error": {"code": "PROMPT_NOT_FOUND", "message": f"No prompt found with id '{it['prompt_id']}'"}})
+        elif it.get("org") and it.get("app") and it.get("name"):
+            key = (it["org"], it["app"])
+            prompt = by_name.get(key, {}).get(it["name"])
+            if not apps[key]:
+                found.append({"error": {"code": "APP_NOT_FOUND", "message": f"No app found for {it['org']}/{it['app']}"}})
+            elif not _has_app_scope(request, apps[key]["id"]):
+                found.append({"error": {"code": "FORBIDDEN", "message": "API key does not have access to this application"}})
+            elif prompt and (not it.get("environment") or prompt.get("environment") == it["environment"]):
+                found.append({"prompt": prompt})
+            else:
+                found.append({"error": {"code": "PROMPT_NOT_FOUND", "message": f"No prompt found: {it['org']}/{it['app']}/{it['name']}"}})
+        else:
+            found.append({"error": {"code": "VALIDATION_ERROR", "message": "Each item needs prompt_id or org/app/name"}})
+    return found
 
 
 @router.post("/{prompt_id}/render")
@@ -203,7 +562,7 @@ async def render_prompt_endpoint(prompt_id: str, request: Request):
     body = await request.json()
     variables = body.get("variables", {})
 
-    db = await get_db()
+    db = await get_db(read_only=True)
     prompt = await prompt_queries.get_prompt(db, prompt_id)
     if not prompt:
         raise HTTPException(status_code=404, detail={"error": {"code": "PROMPT_NOT_FOUND", "message": f"No prompt found with id '{prompt_id}'"}})
@@ -217,10 +576,10 @@ async def render_prompt_endpoint(prompt_id: str, request: Request):
     try:
         if includes:
             rendered = await render_prompt_with_includes(
-                template_body, variables, db, prompt["app_id"]
+                template_body, variables, db, prompt["app_id"], cache_for=(prompt["app_id"], prompt_id)
             )
         else:
-            rendered = render_prompt(template_body, variables)
+            rendered = render_prompt(template_body, variables, cache_for=(prompt["app_id"], prompt_id))
     except ValueError as e:
         raise HTTPException(status_code=400, detail={"error": {"code": "RENDER_ERROR", "message": str(e)}})
 
@@ -234,26 +593,13 @@ async def render_prompt_endpoint(prompt_id: str, request: Request):
 
 
 def _log_access(request: Request, prompt_id: str, name: str | None, cache_hit: bool, start: float):
-    """Fire-and-forget access logging (non-blocking)."""
-    import asyncio
-
+    """Queue an access-log row for the background writer (non-blocking)."""
     elapsed = int((time.time() - start) * 1000)
     api_key = getattr(request.state, "api_key", None)
     api_key_id = api_key["id"] if api_key else None
 
-    async def _log():
-        try:
-            db = await get_db()
-            await prompt_queries.log_access(
-                db, prompt_id, name, api_key_id, None, cache_hit, elapsed,
-                request.client.host if request.client else None,
-                request.headers.get("user-agent"),
-            )
-        except Exception:
-            pass
-
-    try:
-        loop = asyncio.get_event_loop()
-        loop.create_task(_log())
-    except RuntimeError:
-        pass
+    access_log_writer.enqueue(
+        prompt_id, name, api_key_id, None, cache_hit, elapsed,
+        request.client.host if request.client else None,
+        request.headers.get("user-agent"),
+    )
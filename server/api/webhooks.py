@@ -7,10 +7,11 @@ import hmac
 import json
 import logging
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 
+from server.config import settings
 from server.db.database import get_db
-from server.services.cache_service import prompt_cache
+from server.services.webhook_queue import CHANGED, REMOVED, get_sync_token, webhook_queue
 
 logger = logging.getLogger(__name__)
 
@@ -29,23 +30,28 @@ async def _check_delivery_idempotency(db, delivery_id: str, app_id: str) -> bool
     return False
 
 
-async def _record_delivery(db, delivery_id: str, app_id: str, event_type: str) -> None:
-    """Record a processed webhook delivery for idempotency."""
-    if not delivery_id:
-        return
-    try:
-        await db.execute(
-            "INSERT OR IGNORE INTO webhook_deliveries (delivery_id, app_id, event_type) VALUES (?, ?, ?)",
-            (delivery_id, app_id, event_type),
-        )
-        await db.commit()
-    except Exception:
-        pass  # Best-effort — don't fail the webhook if tracking fails
+def _final_path_states(commits: list[dict]) -> dict[str, str]:
+    """Final state (CHANGED or REMOVED) of every .md file touched by a push's commits."""
+    states: dict[str, str] = {}
+    for commit in commits:
+        for f in commit.get("added", []) + commit.get("modified", []):
+            if f.endswith(".md"):
+                states[f] = CHANGED
+        for f in commit.get("removed", []):
+            if f.endswith(".md"):
+                states[f] = REMOVED
+    return states
 
 
 @router.post("/github")
-async def github_webhook(request: Request):
-    """Receive GitHub push events and trigger re-indexing of changed .md files."""
+async def github_webhook(request: Request, response: Response):
+    """Receive GitHub push events and queue re-indexing of changed .md files.
+
+    The push is verified and queued, and 202 is returned right away; the
+    background worker in ``webhook_queue`` applies it and logs how many cache
+    entries it evicted. On Lambda the push is applied before responding, so
+    the response also carries that ``evicted`` count.
+    """
     body = await request.body()
     signature = request.headers.get("x-hub-signature-256", "")
     delivery_id = request.headers.get("x-github-delivery", "")
@@ -72,8 +78,8 @@ async def github_webhook(request: Request):
             return {"ok": True, "message": "No matching application"}
         app = dict(row)
 
-    # Check idempotency — skip if already processed
-    if await _check_delivery_idempotency(db, delivery_id, app["id"]):
+    # Check idempotency — skip if already processed or still queued
+    if webhook_queue.has_delivery(delivery_id) or await _check_delivery_idempotency(db, delivery_id, app["id"]):
         logger.info("Duplicate webhook delivery %s, skipping", delivery_id)
         return {"ok": True, "message": "Already processed"}
 
@@ -91,66 +97,43 @@ async def github_webhook(request: Request):
     if event != "push":
         return {"ok": True, "message": f"Ignoring event: {event}"}
 
-    # Find changed .md files
-    commits = payload.get("commits", [])
-    changed_files: set[str] = set()
-    removed_files: set[str] = set()
+    # Only pushes to the indexed branch matter
+    ref = payload.get("ref")
+    if ref and ref != f"refs/heads/{app.get('default_branch', 'main')}":
+        return {"ok": True, "message": f"Ignoring push to {ref}"}
 
-    for commit in commits:
-        for f in commit.get("added", []) + commit.get("modified", []):
-            if f.endswith(".md"):
-                changed_files.add(f)
-        for f in commit.get("removed", []):
-            if f.endswith(".md"):
-                removed_files.add(f)
-
-    if not changed_files and not removed_files:
+    # Find changed .md files
+    paths = _final_path_states(payload.get("commits", []))
+    if not paths:
         return {"ok": True, "message": "No .md files changed"}
 
-    # Process async (import here to avoid circular)
-    from server.services.sync_service import sync_single_file, remove_file
-    from server.services.github_service import GitHubService
-
-    # We need a GitHub token to fetch file content. Use a stored service token or the app webhook context.
-    # For now, get the first admin user's token for this org.
-    async with db.execute(
-        """SELECT u.access_token_encrypted FROM users u
-           JOIN org_memberships om ON om.user_id = u.id
-           WHERE om.org_id = ? AND om.role = 'admin'
-           LIMIT 1""",
-        (app["org_id"],),
-    ) as cursor:
-        token_row = await cursor.fetchone()
-
-    if not token_row or not token_row["access_token_encrypted"]:
+    # Fetching files needs an org admin's GitHub token
+    if not await get_sync_token(db, app["org_id"]):
         logger.warning("No admin token available for org %s, skipping sync", app["org_id"])
         return {"ok": True, "message": "No token available for sync"}
 
-    from server.utils.crypto import decrypt
-    gh = GitHubService(decrypt(token_row["access_token_encrypted"]))
-
-    synced = 0
-    try:
-        for file_path in changed_files:
-            try:
-                await sync_single_file(db, app, file_path, gh)
-                synced += 1
-            except Exception as e:
-                logger.error("Failed to sync %s: %s", file_path, e)
-
-        for file_path in removed_files:
-            try:
-                await remove_file(db, app["id"], file_path)
-            except Exception as e:
-                logger.error("Failed to remove %s: %s", file_path, e)
-    finally:
-        gh.close()
-
-    # Invalidate cache for affected prompts
-    prompt_cache.clear()
-
-    # Record delivery for idempotency
-    await _record_delivery(db, delivery_id, app["id"], event)
-
-    logger.info("Webhook processed: %d files synced, %d removed", synced, len(removed_files))
-    return {"ok": True, "synced": synced, "removed": len(removed_files)}
+    # Files are synced as of the push's head commit (absent for branch deletions);
+    # its parent tells coalescing whether a later push continues from it
+    after, before = (
+        sha if sha and set(sha) != {"0"} else None
+        for sha in (payload.get("after"), payload.get("before"))
+    )
+
+    if not webhook_queue.enqueue(app["id"], delivery_id, event, paths, after=after, before=before):
+        # GitHub shows the failed delivery, which can be redelivered later
+        raise HTTPException(status_code=503, detail="Webhook queue full")
+
+    response.status_code = 202
+    changed = sum(1 for state in paths.values() if state == CHANGED)
+    result = {"ok": True, "queued": True, "changed": changed, "removed": len(paths) - changed}
+
+    if settings.deployment_mode == "lambda":
+        # No background worker outlives a Lambda invocation: apply before responding,
+        # and report a failure so the delivery can be redelivered from GitHub
+        applied = await webhook_queue.process(db)
+        if webhook_queue.is_retrying(app["id"]):
+            webhook_queue.discard(app["id"])
+            raise HTTPException(status_code=502, detail="Webhook sync failed")
+        result["evicted"] = sum(r["evicted"] for r in applied if r["app_id"] == app["id"])
+
+    return result
@@ -2,16 +2,138 @@
 
 from __future__ import annotations
 
+import hashlib
+import hmac
 import json
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime
 
 import bcrypt
 
 import aiosqlite
 
+from server.config import settings
 from server.db.queries import api_keys as key_queries
 
 
+class VerifiedKeyCache:
+    """Thread-safe LRU of recently verified API keys.
+
+    Entries are keyed by an HMAC-SHA256 digest of the presented key, so the
+    plaintext key is never held in memory and a cache hit skips bcrypt entirely.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: int = 60):
+        self._cache: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(provided_key: str) -> str:
+        """Fast keyed digest of a presented API key."""
+        return hmac.new(
+            settings.app_secret_key.encode(), provided_key.encode(), hashlib.sha256
+        ).hexdigest()
+
+    def get(self, digest: str) -> dict | None:
+        """Return the cached key record, or None on miss/expiry."""
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is None or (time.time() - entry[1]) >= self._ttl:
+                if entry is not None:
+                    del self._cache[digest]
+                self.misses += 1
+                return None
+            self._cache.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, digest: str, record: dict) -> None:
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+            self._cache[digest] = (record, time.time())
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def invalidate_key_id(self, key_id: str) -> int:
+        """Drop every cached entry for a key id (e.g. on revoke). Returns count removed."""
+        with self._lock:
+            to_remove = [d for d, (rec, _) in self._cache.items() if rec.get("id") == key_id]
+            for d in to_remove:
+                del self._cache[d]
+            return len(to_remove)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "ttl_seconds": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class LastUsedBuffer:
+    """Write-behind buffer for ``api_keys.last_used_at``.
+
+    Authentication only records a timestamp in memory; ``flush`` coalesces
+    pending timestamps per key and writes them in one ``executemany``.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key_id: str) -> None:
+        now = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._pending[key_id] = now
+
+    async def flush(self, db: aiosqlite.Connection) -> int:
+        """Persist pending timestamps. Returns the number of keys written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            await key_queries.update_last_used_many(
+                db, [(ts, key_id) for key_id, ts in pending.items()]
+            )
+        except Exception:
+            # Put them back unless a newer timestamp arrived meanwhile
+            with self._lock:
+                for key_id, ts in pending.items():
+                    self._pending.setdefault(key_id, ts)
+            raise
+        return len(pending)
+
+    @property
+    def size(self) -> int:
+        return len(self._pending)
+
+
+# Global instances
+verified_key_cache = VerifiedKeyCache(
+    max_size=settings.api_key_cache_max_size,
+    ttl=settings.api_key_cache_ttl_seconds,
+)
+last_used_buffer = LastUsedBuffer()
+
+
 def generate_api_key(environment: str = "live") -> tuple[str, str, str]:
     """Generate a new API key. Returns (full_key, key_hash, key_prefix)."""
     raw = secrets.token_urlsafe(36)
@@ -21,25 +143,54 @@ def generate_api_key(environment: str = "live") -> tuple[str, str, str]:
     return full_key, key_hash, key_prefix
 
 
-async def validate_api_key(db: aiosqlite.Connection, provided_key: str) -> dict | None:
-    """Validate an API key. Returns the key record if valid, None otherwise."""
+def _is_expired(record: dict) -> bool:
+    if not record.get("expires_at"):
+        return False
+    expires = datetime.fromisoformat(record["expires_at"])
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=UTC)
+    return expires < datetime.now(UTC)
+
+
+def identify_api_key(provided_key: str) -> tuple[str, dict | None]:
+    """Cheap identification of a presented key: (digest, cached verified record or None).
+
+    No DB access and no bcrypt, so it can run before authentication (the rate
+    limiter does). A record is only returned for a key verified within the
+    cache TTL; pass the result to ``validate_api_key`` to avoid a second lookup.
+    """
+    digest = VerifiedKeyCache.digest(provided_key)
+    return digest, verified_key_cache.get(digest)
+
+
+async def validate_api_key(
+    db: aiosqlite.Connection, provided_key: str, identity: tuple[str, dict | None] | None = None
+) -> dict | None:
+    """Validate an API key. Returns the key record if valid, None otherwise.
+
+    Recently verified keys are served from ``verified_key_cache``; only a miss
+    pays for the bcrypt comparison. ``last_used_at`` is recorded in
+    ``last_used_buffer`` and persisted later, so this path never writes.
+    ``identity`` is a prior ``identify_api_key`` result for the same key.
+    """
+    digest, cached = identity or identify_api_key(provided_key)
+    if cached is not None:
+        if _is_expired(cached):
+            verified_key_cache.invalidate_key_id(cached["id"])
+            return None
+        last_used_buffer.record(cached["id"])
+        return cached
+
     prefix = provided_key[:12]
     candidates = await key_queries.get_key_by_prefix(db, prefix)
 
     for candidate in candidates:
         if bcrypt.checkpw(provided_key.encode(), candidate["key_hash"].encode()):
-            # Check expiry
-            if candidate.get("expires_at"):
-                from datetime import datetime, timezone
-
-                expires = datetime.fromisoformat(candidate["expires_at"])
-                if expires.tzinfo is None:
-                    expires = expires.replace(tzinfo=timezone.utc)
-                if expires < datetime.now(timezone.utc):
-                    return None
-
-            # Update last used
-            await key_queries.update_last_used(db, candidate["id"])
+            if _is_expired(candidate):
+                return None
+
+            verified_key_cache.put(digest, candidate)
+            last_used_buffer.record(candidate["id"])
             return candidate
 
     return None
@@ -203,8 +203,8 @@ async def logout(request: Request, response: Response):
     """Clear the session cookie."""
     session_id = request.cookies.get("promptdis_session")
     if session_id:
-        db = await get_db()
-        await db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-        await db.commit()
+        from server.auth.sessions import delete_session
+
+        await delete_session(await get_db(), session_id)
     response.delete_cookie("promptdis_session", domain=settings.cookie_domain)
     return {"ok": True}
@@ -5,8 +5,8 @@ from __future__ import annotations
 import logging
 
 from fastapi import Request
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from server.db.database import get_db
 from server.auth.sessions import verify_session
@@ -26,17 +26,42 @@ PUBLIC_PATHS = {
 # Paths that accept API key auth (public prompt fetching)
 API_KEY_PATHS_PREFIX = "/api/v1/prompts"
 
+_NOT_VALIDATED = object()
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+
+class AuthMiddleware:
+    """Pure ASGI authentication middleware.
+
+    Sets ``request.state.user`` (session cookie) or ``request.state.api_key``
+    and ``request.state.api_key_scopes`` (Bearer API key), and answers 401
+    for unauthenticated prompt API and admin requests. Written against raw
+    ASGI rather than ``BaseHTTPMiddleware`` so a request costs no extra task
+    or response stream.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        response = await self.authenticate(Request(scope))
+        if response is not None:
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    async def authenticate(self, request: Request) -> Response | None:
+        """Populate ``request.state`` from the credentials; return a 401 response to send instead, if any."""
         path = request.url.path
 
         # Skip auth for preflight requests and public paths
         if request.method == "OPTIONS":
-            return await call_next(request)
+            return None
 
         if path in PUBLIC_PATHS or path.startswith("/docs") or path.startswith("/openapi"):
-            return await call_next(request)
+            return None
 
         # Initialize state
         request.state.user = None
@@ -45,7 +70,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
         try:
             db = await get_db()
         except RuntimeError:
-            return await call_next(request)
+            return None
 
         # Try session cookie auth first
         session_id = request.cookies.get("promptdis_session")
@@ -53,16 +78,19 @@ class AuthMiddleware(BaseHTTPMiddleware):
             user = await verify_session(db, session_id)
             if user:
                 request.state.user = user
-                return await call_next(request)
+                return None
 
         # Try API key auth (Bearer token)
         auth_header = request.headers.get("authorization", "")
         if auth_header.startswith("Bearer ") and auth_header[7:].startswith("pm_"):
-            api_key_record = await validate_api_key(db, auth_header[7:])
+            # The rate limiter has usually validated the key already (record or None)
+            api_key_record = getattr(request.state, "api_key_validated", _NOT_VALIDATED)
+            if api_key_record is _NOT_VALIDATED:
+                api_key_record = await validate_api_key(await get_db(read_only=True), auth_header[7:])
             if api_key_record:
                 request.state.api_key = api_key_record
                 request.state.api_key_scopes = parse_scopes(api_key_record.get("scopes"))
-                return await call_next(request)
+                return None
 
         # For public prompt API paths, require auth
         if path.startswith(API_KEY_PATHS_PREFIX):
@@ -72,4 +100,4 @@ class AuthMiddleware(BaseHTTPMiddleware):
         if path.startswith("/api/v1/admin"):
             return JSONResponse(status_code=401, content={"error": {"code": "UNAUTHORIZED", "message": "Authentication required. Please sign in with GitHub."}})
 
-        return await call_next(request)
+        return None
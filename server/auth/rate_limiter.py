@@ -1,58 +1,141 @@
-"""Sliding-window rate limiter middleware."""
+"""Rate limiter middleware."""
 
 from __future__ import annotations
 
 import time
-from collections import defaultdict
 
 from fastapi import Request
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from server.auth.api_keys import identify_api_key, parse_scopes, validate_api_key
 from server.config import settings
+from server.db.database import get_db
+from server.db.queries import api_keys as key_queries
+from server.services.rate_limit_store import RateLimitStore, rate_limit_store
 
 SKIP_PATHS = {"/health", "/docs", "/openapi.json"}
 
+# Tokens a request costs, by (method, path suffix); everything else costs 1
+ROUTE_COSTS = {
+    ("POST", "/prompts/render:batch"): 10,
+    ("GET", "/prompts:batch"): 5,
+    ("POST", "/prompts:batch"): 5,
+    ("POST", "/render"): 2,
+}
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """In-memory sliding window rate limiter.
 
-    Key is the API key prefix (if present) or client IP.
+class RateLimitMiddleware:
+    """Pure ASGI rate limiter over a pluggable ``RateLimitStore``.
+
+    Runs before ``AuthMiddleware`` and validates a Bearer key itself, so every
+    request with a valid key is limited per key: a key verified within the
+    key cache TTL costs no DB or bcrypt, and a cache miss pays the one bcrypt
+    check of the request, whose result auth reuses from
+    ``request.state.api_key_validated``. Anything else (sessions, invalid
+    keys) is limited per client IP. While an IP is over its limit, an uncached
+    key is only bcrypt-checked if its prefix belongs to a stored key: a valid
+    key is charged to its own bucket, anything else is refused. An API key may
+    carry its own limit as ``rate_limit_per_minute`` in its scopes; others get
+    ``limit``. Each request costs its ``ROUTE_COSTS`` weight. Responses carry
+    ``X-RateLimit-*`` headers. The store is in-process by default, or shared
+    across workers (``RATE_LIMIT_BACKEND``).
     """
 
-    def __init__(self, app, limit: int | None = None):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, limit: int | None = None, store: RateLimitStore | None = None):
+        self.app = app
         self.limit = limit or settings.rate_limit_per_minute
-        self._windows: dict[str, list[float]] = defaultdict(list)
+        self.store = store or rate_limit_store
+        self._blocked_ips: dict[str, float] = {}  # ip key -> monotonic time its limit allows requests again
 
-    async def dispatch(self, request: Request, call_next):
-        path = request.url.path
-        if path in SKIP_PATHS or path.startswith("/docs"):
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        response, headers = await self.check(Request(scope))
+        if response is not None:
+            await response(scope, receive, send)
+            return
+        if not headers:
+            await self.app(scope, receive, send)
+            return
 
-        key = self._get_key(request)
-        now = time.monotonic()
-        window = self._windows[key]
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
 
-        # Prune timestamps older than 60 seconds
-        cutoff = now - 60.0
-        while window and window[0] < cutoff:
-            window.pop(0)
+        await self.app(scope, receive, send_with_headers)
+
+    async def check(self, request: Request) -> tuple[Response | None, dict[str, str]]:
+        """Charge the request. Returns a 429 response to send instead (if limited) and headers to add."""
+        path = request.url.path
+        if path in SKIP_PATHS or path.startswith("/docs"):
+            return None, {}
 
-        if len(window) >= self.limit:
-            retry_after = int(60 - (now - window[0])) + 1
+        ip_key = self._get_key(request, None)
+        record = await self._validate_key(request, ip_key)
+        limit = self._get_limit(record)
+        key = self._get_key(request, record)
+        result = await self.store.hit(key, limit, min(limit, self._get_cost(request)))
+        if not result.allowed:
+            if record is None:
+                self._block_ip(ip_key, result.retry_after)
             return JSONResponse(
                 status_code=429,
                 content={"error": {"code": "RATE_LIMITED", "message": "Too many requests"}},
-                headers={"Retry-After": str(retry_after)},
-            )
+                headers=result.headers(),
+            ), {}
+        return None, result.headers()
 
-        window.append(now)
-        return await call_next(request)
+    def clear(self) -> None:
+        self.store.clear()
+        self._blocked_ips.clear()
+
+    async def _validate_key(self, request: Request, ip_key: str) -> dict | None:
+        """Validated record of the request's Bearer key; None if there is none, it is invalid, or the IP is blocked and its prefix unknown."""
+        auth_header = request.headers.get("authorization", "")
+        if not (auth_header.startswith("Bearer ") and auth_header[7:].startswith("pm_")):
+            return None
+        provided_key = auth_header[7:]
+        identity = identify_api_key(provided_key)
+        try:
+            db = await get_db(read_only=True)
+        except RuntimeError:
+            return None
+        # Over the IP limit: only keys whose prefix is a real key earn a
+        # bcrypt check, so keys behind a shared NAT still reach their own bucket
+        if (
+            identity[1] is None
+            and self._blocked_ips.get(ip_key, 0.0) > time.monotonic()
+            and not await key_queries.get_key_by_prefix(db, provided_key[:12])
+        ):
+            return None
+        record = await validate_api_key(db, provided_key, identity)
+        request.state.api_key_validated = record
+        return record
+
+    def _block_ip(self, ip_key: str, seconds: float) -> None:
+        now = time.monotonic()
+        if len(self._blocked_ips) >= settings.rate_limit_max_keys:
+            self._blocked_ips = {k: until for k, until in self._blocked_ips.items() if until > now}
+        self._blocked_ips[ip_key] = now + seconds
 
     @staticmethod
-    def _get_key(request: Request) -> str:
-        api_key = getattr(request.state, "api_key", None)
-        if api_key and isinstance(api_key, dict):
-            return f"key:{api_key.get('key_prefix', 'unknown')}"
+    def _get_key(request: Request, record: dict | None) -> str:
+        if record is not None:
+            return f"key:{record['id']}"
         return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    def _get_limit(self, record: dict | None) -> int:
+        limit = parse_scopes(record.get("scopes")).get("rate_limit_per_minute") if record else None
+        return limit if isinstance(limit, int) and limit > 0 else self.limit
+
+    @staticmethod
+    def _get_cost(request: Request) -> int:
+        path = request.url.path
+        for (method, suffix), cost in ROUTE_COSTS.items():
+            if request.method == method and path.endswith(suffix):
+                return cost
+        return 1
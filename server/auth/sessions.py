@@ -3,49 +3,214 @@
 from __future__ import annotations
 
 import secrets
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
 
 import aiosqlite
 
+from server.config import settings
+from server.db.database import write_transaction
 
 SESSION_TTL_HOURS = 24
 
 
+class SessionCache:
+    """Thread-safe LRU of recently verified sessions.
+
+    Holds the session's user row and expiry for ``ttl`` seconds, so repeat
+    requests on a session skip the sessions/users join. Logout and a new
+    login for the user drop the affected entries.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: int = 30):
+        self._cache: OrderedDict[str, tuple[dict, datetime, float]] = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str) -> tuple[dict, datetime] | None:
+        """Return (user, expires_at), or None on miss/expiry of the cache entry."""
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is None or (time.time() - entry[2]) >= self._ttl:
+                if entry is not None:
+                    del self._cache[session_id]
+                self.misses += 1
+                return None
+            self._cache.move_to_end(session_id)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, session_id: str, user: dict, expires_at: datetime) -> None:
+        with self._lock:
+            entry = self._cache.get(session_id)
+            # A refreshed expiry doesn't make the cached user row any fresher
+            cached_at = entry[2] if entry is not None else time.time()
+            self._cache[session_id] = (user, expires_at, cached_at)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop every cached session of a user. Returns count removed."""
+        with self._lock:
+            to_remove = [s for s, (user, _, _) in self._cache.items() if user.get("id") == user_id]
+            for s in to_remove:
+                del self._cache[s]
+            return len(to_remove)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "ttl_seconds": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SessionExpiryBuffer:
+    """Write-behind buffer for refreshed ``sessions.expires_at`` values.
+
+    ``flush`` coalesces pending expiries per session and writes them in one
+    ``executemany``.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, expires_at: datetime) -> None:
+        with self._lock:
+            self._pending[session_id] = expires_at.isoformat()
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._pending.pop(session_id, None)
+
+    async def flush(self, db: aiosqlite.Connection) -> int:
+        """Persist pending expiries. Returns the number of sessions written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            async with write_transaction(db):
+                await db.executemany(
+                    "UPDATE sessions SET expires_at = ? WHERE id = ?",
+                    [(expires_at, session_id) for session_id, expires_at in pending.items()],
+                )
+        except Exception:
+            # Put them back unless a newer expiry arrived meanwhile
+            with self._lock:
+                for session_id, expires_at in pending.items():
+                    self._pending.setdefault(session_id, expires_at)
+            raise
+        return len(pending)
+
+    @property
+    def size(self) -> int:
+        return len(self._pending)
+
+
+# Global instances
+session_cache = SessionCache(
+    max_size=settings.session_cache_max_size,
+    ttl=settings.session_cache_ttl_seconds,
+)
+session_expiry_buffer = SessionExpiryBuffer()
+
+
+def _parse_expiry(value: str) -> datetime:
+    # Rows hold either isoformat (create_session) or SQLite datetime() text
+    expires = datetime.fromisoformat(value)
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=UTC)
+    return expires
+
+
 async def create_session(db: aiosqlite.Connection, user_id: str) -> str:
     """Create a new session and return the session ID."""
     session_id = secrets.token_urlsafe(48)
-    expires_at = (datetime.now(timezone.utc) + timedelta(hours=SESSION_TTL_HOURS)).isoformat()
-    await db.execute(
-        "INSERT INTO sessions (id, user_id, expires_at) VALUES (?, ?, ?)",
-        (session_id, user_id, expires_at),
-    )
-    await db.commit()
+    expires_at = (datetime.now(UTC) + timedelta(hours=SESSION_TTL_HOURS)).isoformat()
+    async with write_transaction(db):
+        await db.execute(
+            "INSERT INTO sessions (id, user_id, expires_at) VALUES (?, ?, ?)",
+            (session_id, user_id, expires_at),
+        )
+    # A login may have updated the user row that other sessions have cached
+    session_cache.invalidate_user(user_id)
     return session_id
 
 
 async def verify_session(db: aiosqlite.Connection, session_id: str) -> dict | None:
-    """Verify a session and return the associated user, or None if invalid/expired."""
-    async with db.execute(
-        """SELECT u.* FROM sessions s
-           JOIN users u ON u.id = s.user_id
-           WHERE s.id = ? AND s.expires_at > datetime('now')""",
-        (session_id,),
-    ) as cursor:
-        row = await cursor.fetchone()
-        if row:
-            # Refresh session expiry on activity
-            new_expires = (datetime.now(timezone.utc) + timedelta(hours=SESSION_TTL_HOURS)).isoformat()
-            await db.execute(
-                "UPDATE sessions SET expires_at = ? WHERE id = ?",
-                (new_expires, session_id),
-            )
-            await db.commit()
-            return dict(row)
-    return None
+    """Verify a session and return the associated user, or None if invalid/expired.
+
+    Recently verified sessions are served from ``session_cache``. The sliding
+    expiry is only refreshed once the remaining lifetime drops below
+    ``SESSION_REFRESH_BELOW_HOURS``, and the new expiry goes to
+    ``session_expiry_buffer`` (written inline on Lambda, which has no
+    flusher), so an active session costs at most one write per refresh
+    interval instead of one per request.
+    """
+    now = datetime.now(UTC)
+    cached = session_cache.get(session_id)
+    if cached is not None:
+        user, expires_at = cached
+    else:
+        async with db.execute(
+            """SELECT u.*, s.expires_at AS session_expires_at FROM sessions s
+               JOIN users u ON u.id = s.user_id
+               WHERE s.id = ? AND s.expires_at > datetime('now')""",
+            (session_id,),
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        expires_at = _parse_expiry(user.pop("session_expires_at"))
+
+    if expires_at <= now:
+        session_cache.invalidate(session_id)
+        return None
+
+    if expires_at - now < timedelta(hours=settings.session_refresh_below_hours):
+        expires_at = now + timedelta(hours=SESSION_TTL_HOURS)
+        session_expiry_buffer.record(session_id, expires_at)
+        if settings.deployment_mode == "lambda":
+            await session_expiry_buffer.flush(db)
+    elif cached is not None:
+        return user
+
+    session_cache.put(session_id, user, expires_at)
+    return user
+
+
+async def delete_session(db: aiosqlite.Connection, session_id: str) -> None:
+    """Delete a session (logout) and drop it from the cache and expiry buffer."""
+    session_expiry_buffer.discard(session_id)
+    session_cache.invalidate(session_id)
+    async with write_transaction(db):
+        await db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
 
 
 async def cleanup_expired_sessions(db: aiosqlite.Connection) -> int:
     """Delete expired sessions. Returns count deleted."""
-    result = await db.execute("DELETE FROM sessions WHERE expires_at <= datetime('now')")
-    await db.commit()
+    async with write_transaction(db):
+        result = await db.execute("DELETE FROM sessions WHERE expires_at <= datetime('now')")
     return result.rowcount
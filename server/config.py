@@ -13,12 +13,81 @@ class Settings(BaseSettings):
 
     # Database
     database_path: str = "./data/promptdis.db"
+    db_read_pool_size: int = 4
 
     # Logging
     log_level: str = "info"
 
-    # Rate limiting
+    # Rate limiting (per API key or IP; keys may override via scopes.rate_limit_per_minute)
     rate_limit_per_minute: int = 100
+    rate_limit_max_keys: int = 10000
+    # Rate-limit state: "memory" (per process), "sqlite" (shared by workers on one
+    # host) or "dynamodb"; empty = dynamodb on Lambda, memory otherwise. Shared
+    # backends reserve this fraction of a key's limit per round trip.
+    rate_limit_backend: str = ""
+    rate_limit_db_path: str = "./data/rate_limits.db"
+    rate_limit_lease_fraction: float = 0.05
+
+    # API key auth hot path: verified-key cache + write-behind last_used_at
+    api_key_cache_ttl_seconds: int = 60
+    api_key_cache_max_size: int = 1000
+    api_key_last_used_flush_seconds: int = 30
+
+    # Session auth hot path: verified-session cache, and sliding expiry refreshed
+    # (write-behind) only once less than this many hours remain
+    session_cache_ttl_seconds: int = 30
+    session_cache_max_size: int = 1000
+    session_refresh_below_hours: float = 23.0
+    session_expiry_flush_seconds: int = 30
+
+    # Buffered prompt_access_log writer
+    access_log_max_queue: int = 10000
+    access_log_batch_size: int = 500
+    access_log_flush_seconds: float = 2.0
+
+    # Compiled Jinja2 template cache (render endpoints)
+    template_cache_max_size: int = 500
+    template_cache_ttl_seconds: int = 300
+
+    # POST /api/v1/prompts/render:batch
+    render_batch_max_items: int = 100
+    render_batch_thread_threshold: int = 16
+    render_batch_concurrency: int = 8
+
+    # GET/POST /api/v1/prompts:batch (max ids or names per request)
+    prompt_batch_max_items: int = 500
+
+    # GitHub sync: parallel blob fetches per full sync
+    github_sync_concurrency: int = 8
+
+    # Threads running blocking GitHub API calls off the event loop
+    github_max_threads: int = 16
+
+    # Pooled GitHub clients, one per stored token, closed after being idle
+    github_client_pool_max_size: int = 100
+    github_client_idle_seconds: int = 300
+
+    # GitHub read caches: blobs by SHA (disk store optional, e.g. ./data/blob_cache)
+    # and ETags of conditional requests per client
+    github_blob_cache_max_size: int = 2000
+    github_blob_cache_dir: str = ""
+    github_etag_cache_max_size: int = 500
+
+    # GitHub quota scheduling: calls kept for interactive use, remaining quota
+    # below which background calls are paced, and their max concurrency
+    github_quota_reserve: int = 500
+    github_quota_low_watermark: int = 1500
+    github_background_max_concurrency: int = 8
+    # Longest a background call made for an HTTP request or the webhook worker
+    # waits for quota; past it, the request gets 429 and the worker retries later
+    github_quota_max_wait_seconds: float = 10.0
+
+    # Webhook queue: pending push deliveries, and delay to coalesce bursts per app
+    webhook_queue_max_pending: int = 1000
+    webhook_coalesce_seconds: float = 2.0
+    # Failed webhook syncs: attempts before giving up, first retry delay (doubles per attempt)
+    webhook_max_attempts: int = 5
+    webhook_retry_backoff_seconds: float = 30.0
 
     # CORS
     cors_origins: str = "http://localhost:5173"
@@ -29,6 +98,7 @@ class Settings(BaseSettings):
     # AWS (Lambda mode only)
     aws_region: str = "us-west-2"
     dynamodb_state_table: str = "promptdis-oauth-states"
+    dynamodb_rate_limit_table: str = "promptdis-rate-limits"
     s3_tts_bucket: str = ""
 
     # ElevenLabs TTS (global fallback — prefer per-app keys via provider_configs)
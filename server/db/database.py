@@ -1,4 +1,9 @@
+import asyncio
+import itertools
 import logging
+import weakref
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import aiosqlite
@@ -7,18 +12,72 @@ from server.config import settings
 
 logger = logging.getLogger(__name__)
 
+# One serialized writer plus a pool of read-only connections. With WAL,
+# readers never block on the writer, so read-heavy routes spread across
+# several aiosqlite worker threads instead of queuing behind writes.
 _db: aiosqlite.Connection | None = None
+_readers: list[aiosqlite.Connection] = []
+_reader_cycle: itertools.cycle | None = None
 
 
-async def get_db() -> aiosqlite.Connection:
-    global _db
+async def get_db(read_only: bool = False) -> aiosqlite.Connection:
+    """Return a database connection.
+
+    ``read_only=True`` hands out one of the pooled read-only connections
+    (round-robin). Falls back to the writer when no read pool is configured.
+    """
     if _db is None:
         raise RuntimeError("Database not initialized. Call init_db() first.")
+    if read_only and _reader_cycle is not None:
+        return next(_reader_cycle)
     return _db
 
 
+class _TransactionLock:
+    """Per-connection lock plus the task currently holding it (for nesting)."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.owner: asyncio.Task | None = None
+
+
+_transaction_locks: weakref.WeakKeyDictionary[aiosqlite.Connection, _TransactionLock] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@asynccontextmanager
+async def write_transaction(db: aiosqlite.Connection) -> AsyncIterator[aiosqlite.Connection]:
+    """Run a unit of writes on ``db`` as one transaction, exclusive of other writers.
+
+    The writer connection is shared by every coroutine, so a bare commit or
+    rollback from one would end whatever transaction another has open on it.
+    Every write goes through this block instead: blocks on the same
+    connection run one at a time, and the outermost block commits on success
+    or rolls back on error, touching only its own statements. A nested block
+    in the task that already holds the connection joins the outer transaction.
+    """
+    state = _transaction_locks.get(db)
+    if state is None:
+        state = _transaction_locks[db] = _TransactionLock()
+    task = asyncio.current_task()
+    if state.owner is task:
+        yield db
+        return
+    async with state.lock:
+        state.owner = task
+        try:
+            yield db
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+        finally:
+            state.owner = None
+
+
 async def init_db() -> None:
-    global _db
+    global _db, _reader_cycle
     db_path = Path(settings.database_path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -35,11 +94,31 @@ async def init_db() -> None:
     await _db.execute("PRAGMA foreign_keys=ON")
 
     await _run_migrations(_db)
-    logger.info("Database initialized at %s", db_path)
+
+    # Readers only help under WAL; in DELETE journal mode they would contend
+    # with the writer for the database lock.
+    if settings.deployment_mode != "lambda":
+        for _ in range(settings.db_read_pool_size):
+            _readers.append(await _open_reader(db_path))
+        if _readers:
+            _reader_cycle = itertools.cycle(_readers)
+
+    logger.info("Database initialized at %s (%d read connections)", db_path, len(_readers))
+
+
+async def _open_reader(db_path: Path) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA query_only=ON")
+    await conn.execute("PRAGMA busy_timeout=5000")
+    return conn
 
 
 async def close_db() -> None:
-    global _db
+    global _db, _reader_cycle
+    _reader_cycle = None
+    while _readers:
+        await _readers.pop().close()
     if _db is not None:
         await _db.close()
         _db = None
@@ -0,0 +1,15 @@
+-- Migration 005: Materialized include graph for prompt composition
+-- One row per {% include "name" %} edge, written at sync time so rendering can
+-- fetch a prompt's whole include closure with a single recursive query.
+
+CREATE TABLE IF NOT EXISTS prompt_includes (
+    prompt_id TEXT NOT NULL REFERENCES prompts(id) ON DELETE CASCADE,
+    app_id TEXT NOT NULL,
+    include_name TEXT NOT NULL,      -- prompts.name of the included prompt (same app)
+    PRIMARY KEY (prompt_id, include_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_prompt_includes_target
+    ON prompt_includes(app_id, include_name);
+
+INSERT OR IGNORE INTO schema_version (version) VALUES (5);
@@ -0,0 +1,17 @@
+-- Migration 006: Only rewrite the FTS row when an indexed column changes
+-- The original trigger fired on every UPDATE (active toggles, sync timestamps,
+-- file moves, upserts of identical content), re-tokenizing the whole body.
+
+DROP TRIGGER IF EXISTS prompts_fts_update;
+
+CREATE TRIGGER IF NOT EXISTS prompts_fts_update AFTER UPDATE OF name, description, tags, body ON prompts
+WHEN old.name IS NOT new.name OR old.description IS NOT new.description
+    OR old.tags IS NOT new.tags OR old.body IS NOT new.body
+BEGIN
+    INSERT INTO prompts_fts(prompts_fts, rowid, name, description, tags, body)
+    VALUES ('delete', old.rowid, old.name, old.description, old.tags, old.body);
+    INSERT INTO prompts_fts(rowid, name, description, tags, body)
+    VALUES (new.rowid, new.name, new.description, new.tags, new.body);
+END;
+
+INSERT OR IGNORE INTO schema_version (version) VALUES (6);
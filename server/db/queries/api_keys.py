@@ -4,6 +4,8 @@ import uuid
 
 import aiosqlite
 
+from server.db.database import write_transaction
+
 
 async def list_keys_for_user(db: aiosqlite.Connection, user_id: str) -> list[dict]:
     async with db.execute(
@@ -41,21 +43,21 @@ async def create_key(
     expires_at: str | None = None,
 ) -> str:
     key_id = str(uuid.uuid4())
-    await db.execute(
-        """INSERT INTO api_keys (id, user_id, key_hash, key_prefix, name, scopes, expires_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (key_id, user_id, key_hash, key_prefix, name, scopes, expires_at),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            """INSERT INTO api_keys (id, user_id, key_hash, key_prefix, name, scopes, expires_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (key_id, user_id, key_hash, key_prefix, name, scopes, expires_at),
+        )
     return key_id
 
 
 async def revoke_key(db: aiosqlite.Connection, key_id: str, user_id: str) -> bool:
-    result = await db.execute(
-        "UPDATE api_keys SET revoked_at = datetime('now') WHERE id = ? AND user_id = ?",
-        (key_id, user_id),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        result = await db.execute(
+            "UPDATE api_keys SET revoked_at = datetime('now') WHERE id = ? AND user_id = ?",
+            (key_id, user_id),
+        )
     return result.rowcount > 0
 
 
@@ -87,8 +89,11 @@ async def get_apps_for_key(db: aiosqlite.Connection, key_id: str) -> list[dict]:
         return [dict(r) for r in rows]
 
 
-async def update_last_used(db: aiosqlite.Connection, key_id: str) -> None:
-    await db.execute(
-        "UPDATE api_keys SET last_used_at = datetime('now') WHERE id = ?", (key_id,)
-    )
-    await db.commit()
+async def update_last_used_many(db: aiosqlite.Connection, rows: list[tuple[str, str]]) -> None:
+    """Apply many (last_used_at, key_id) updates in a single transaction."""
+    if not rows:
+        return
+    async with write_transaction(db):
+        await db.executemany(
+            "UPDATE api_keys SET last_used_at = ? WHERE id = ?", rows
+        )
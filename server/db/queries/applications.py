@@ -5,6 +5,8 @@ import uuid
 
 import aiosqlite
 
+from server.db.database import write_transaction
+
 
 async def list_apps_for_org(db: aiosqlite.Connection, org_id: str) -> list[dict]:
     async with db.execute(
@@ -41,13 +43,13 @@ async def create_app(
 ) -> str:
     app_id = str(uuid.uuid4())
     webhook_secret = secrets.token_hex(32)
-    await db.execute(
-        """INSERT INTO applications
-           (id, org_id, github_repo, subdirectory, display_name, default_branch, webhook_secret)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (app_id, org_id, github_repo, subdirectory, display_name or github_repo, default_branch, webhook_secret),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            """INSERT INTO applications
+               (id, org_id, github_repo, subdirectory, display_name, default_branch, webhook_secret)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (app_id, org_id, github_repo, subdirectory, display_name or github_repo, default_branch, webhook_secret),
+        )
     return app_id
 
 
@@ -73,17 +75,17 @@ async def update_app(
         return
     updates.append("updated_at = datetime('now')")
     params.append(app_id)
-    await db.execute(f"UPDATE applications SET {', '.join(updates)} WHERE id = ?", params)
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(f"UPDATE applications SET {', '.join(updates)} WHERE id = ?", params)
 
 
 async def delete_app(db: aiosqlite.Connection, app_id: str) -> None:
-    await db.execute("DELETE FROM applications WHERE id = ?", (app_id,))
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute("DELETE FROM applications WHERE id = ?", (app_id,))
 
 
 async def update_sync_time(db: aiosqlite.Connection, app_id: str) -> None:
-    await db.execute(
-        "UPDATE applications SET last_synced_at = datetime('now') WHERE id = ?", (app_id,)
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            "UPDATE applications SET last_synced_at = datetime('now') WHERE id = ?", (app_id,)
+        )
@@ -4,6 +4,8 @@ import uuid
 
 import aiosqlite
 
+from server.db.database import write_transaction
+
 
 async def create_eval_run(
     db: aiosqlite.Connection,
@@ -14,12 +16,12 @@ async def create_eval_run(
     triggered_by: str = "manual",
 ) -> str:
     run_id = str(uuid.uuid4())
-    await db.execute(
-        """INSERT INTO eval_runs (id, prompt_id, prompt_version, provider, model, triggered_by)
-           VALUES (?, ?, ?, ?, ?, ?)""",
-        (run_id, prompt_id, prompt_version, provider, model, triggered_by),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            """INSERT INTO eval_runs (id, prompt_id, prompt_version, provider, model, triggered_by)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (run_id, prompt_id, prompt_version, provider, model, triggered_by),
+        )
     return run_id
 
 
@@ -32,13 +34,13 @@ async def update_eval_run(
     cost_usd: float | None = None,
     duration_ms: int | None = None,
 ) -> None:
-    await db.execute(
-        """UPDATE eval_runs
-           SET status=?, results=?, error_message=?, cost_usd=?, duration_ms=?
-           WHERE id=?""",
-        (status, results, error_message, cost_usd, duration_ms, run_id),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            """UPDATE eval_runs
+               SET status=?, results=?, error_message=?, cost_usd=?, duration_ms=?
+               WHERE id=?""",
+            (status, results, error_message, cost_usd, duration_ms, run_id),
+        )
 
 
 async def list_eval_runs(
@@ -59,5 +61,5 @@ async def get_eval_run(db: aiosqlite.Connection, run_id: str) -> dict | None:
 
 
 async def delete_eval_run(db: aiosqlite.Connection, run_id: str) -> None:
-    await db.execute("DELETE FROM eval_runs WHERE id = ?", (run_id,))
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute("DELETE FROM eval_runs WHERE id = ?", (run_id,))
@@ -4,6 +4,8 @@ import uuid
 
 import aiosqlite
 
+from server.db.database import write_transaction
+
 
 async def list_orgs(db: aiosqlite.Connection) -> list[dict]:
     async with db.execute("SELECT * FROM organizations ORDER BY display_name") as cursor:
@@ -43,19 +45,18 @@ async def upsert_org(
     display_name: str | None = None,
     avatar_url: str | None = None,
 ) -> str:
-    existing = await get_org_by_owner(db, github_owner)
-    if existing:
+    async with write_transaction(db):
+        existing = await get_org_by_owner(db, github_owner)
+        if existing:
+            await db.execute(
+                "UPDATE organizations SET display_name=?, avatar_url=?, updated_at=datetime('now') WHERE id=?",
+                (display_name or existing["display_name"], avatar_url, existing["id"]),
+            )
+            return existing["id"]
+
+        org_id = str(uuid.uuid4())
         await db.execute(
-            "UPDATE organizations SET display_name=?, avatar_url=?, updated_at=datetime('now') WHERE id=?",
-            (display_name or existing["display_name"], avatar_url, existing["id"]),
+            "INSERT INTO organizations (id, github_owner, display_name, avatar_url) VALUES (?, ?, ?, ?)",
+            (org_id, github_owner, display_name or github_owner, avatar_url),
         )
-        await db.commit()
-        return existing["id"]
-
-    org_id = str(uuid.uuid4())
-    await db.execute(
-        "INSERT INTO organizations (id, github_owner, display_name, avatar_url) VALUES (?, ?, ?, ?)",
-        (org_id, github_owner, display_name or github_owner, avatar_url),
-    )
-    await db.commit()
     return org_id
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import json
 
 import aiosqlite
 
+from server.db.database import write_transaction
+
 
 async def get_prompt(db: aiosqlite.Connection, prompt_id: str) -> dict | None:
     async with db.execute("SELECT * FROM prompts WHERE id = ?", (prompt_id,)) as cursor:
@@ -27,6 +30,43 @@ async def get_prompt_by_name(
         return dict(row) if row else None
 
 
+async def get_prompts_by_ids(db: aiosqlite.Connection, prompt_ids: list[str]) -> dict[str, dict]:
+    """Fetch many prompts in one query. Returns {id: row}."""
+    if not prompt_ids:
+        return {}
+    placeholders = ",".join("?" * len(prompt_ids))
+    async with db.execute(f"SELECT * FROM prompts WHERE id IN ({placeholders})", prompt_ids) as cursor:
+        return {row["id"]: dict(row) for row in await cursor.fetchall()}
+
+
+async def get_prompts_by_names(
+    db: aiosqlite.Connection, app_id: str, names: list[str]
+) -> dict[str, dict]:
+    """Fetch many active prompts of one app in one query. Returns {name: row}."""
+    if not names:
+        return {}
+    placeholders = ",".join("?" * len(names))
+    async with db.execute(
+        f"SELECT * FROM prompts WHERE app_id = ? AND name IN ({placeholders}) AND active = 1",
+        [app_id, *names],
+    ) as cursor:
+        return {row["name"]: dict(row) for row in await cursor.fetchall()}
+
+
+async def list_active_prompts(
+    db: aiosqlite.Connection, app_id: str, environment: str | None = None
+) -> list[dict]:
+    """All active prompts of an app (optionally one environment), ordered by name."""
+    sql = "SELECT * FROM prompts WHERE app_id = ? AND active = 1"
+    params: list = [app_id]
+    if environment:
+        sql += " AND environment = ?"
+        params.append(environment)
+    sql += " ORDER BY name"
+    async with db.execute(sql, params) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+
 async def find_app_by_org_and_repo(
     db: aiosqlite.Connection, org: str, app_name: str
 ) -> dict | None:
@@ -99,64 +139,218 @@ async def list_prompts(
         return [dict(r) for r in rows], total
 
 
-async def upsert_prompt(db: aiosqlite.Connection, data: dict) -> None:
-    await db.execute(
-        """INSERT INTO prompts
-           (id, app_id, name, file_path, domain, description, type,
-            modality_input, modality_output, default_model, environment,
-            tags, active, version, git_sha, front_matter, body_hash,
-            body, last_synced_at, updated_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))
-           ON CONFLICT(id) DO UPDATE SET
-            name=excluded.name, file_path=excluded.file_path, domain=excluded.domain,
-            description=excluded.description, type=excluded.type,
-            modality_input=excluded.modality_input, modality_output=excluded.modality_output,
-            default_model=excluded.default_model, environment=excluded.environment,
-            tags=excluded.tags, active=excluded.active, version=excluded.version,
-            git_sha=excluded.git_sha, front_matter=excluded.front_matter,
-            body_hash=excluded.body_hash, body=excluded.body,
-            last_synced_at=datetime('now'), updated_at=datetime('now')
-        """,
-        (
-            data["id"], data["app_id"], data["name"], data["file_path"],
-            data.get("domain"), data.get("description"), data.get("type", "chat"),
-            data.get("modality_input", "text"), data.get("modality_output", "text"),
-            data.get("default_model"), data.get("environment", "development"),
-            data.get("tags", "[]"), 1 if data.get("active", True) else 0,
-            data.get("version"), data.get("git_sha"), data.get("front_matter", "{}"),
-            data.get("body_hash"), data.get("body"),
-        ),
+_UPSERT_PROMPT_SQL = """INSERT INTO prompts
+   (id, app_id, name, file_path, domain, description, type,
+    modality_input, modality_output, default_model, environment,
+    tags, active, version, git_sha, front_matter, body_hash,
+    body, last_synced_at, updated_at)
+   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))
+   ON CONFLICT(id) DO UPDATE SET
+    name=excluded.name, file_path=excluded.file_path, domain=excluded.domain,
+    description=excluded.description, type=excluded.type,
+    modality_input=excluded.modality_input, modality_output=excluded.modality_output,
+    default_model=excluded.default_model, environment=excluded.environment,
+    tags=excluded.tags, active=excluded.active, version=excluded.version,
+    git_sha=excluded.git_sha, front_matter=excluded.front_matter,
+    body_hash=excluded.body_hash, body=excluded.body,
+    last_synced_at=datetime('now'), updated_at=datetime('now')
+"""
+
+
+def _upsert_params(data: dict) -> tuple:
+    return (
+        data["id"], data["app_id"], data["name"], data["file_path"],
+        data.get("domain"), data.get("description"), data.get("type", "chat"),
+        data.get("modality_input", "text"), data.get("modality_output", "text"),
+        data.get("default_model"), data.get("environment", "development"),
+        data.get("tags", "[]"), 1 if data.get("active", True) else 0,
+        data.get("version"), data.get("git_sha"), data.get("front_matter", "{}"),
+        data.get("body_hash"), data.get("body"),
     )
-    await db.commit()
+
+
+async def upsert_prompt(db: aiosqlite.Connection, data: dict) -> None:
+    async with write_transaction(db):
+        await db.execute(_UPSERT_PROMPT_SQL, _upsert_params(data))
+
+
+async def upsert_prompts(
+    db: aiosqlite.Connection,
+    rows: list[dict],
+    savepoint_per_row: bool = False,
+) -> list[tuple[dict, Exception]]:
+    """Upsert many prompts in one transaction.
+
+    Rows carrying an ``includes`` list also get their include edges replaced.
+    By default all rows go through ``executemany`` and any failure rolls the
+    whole batch back and raises. With ``savepoint_per_row=True`` each row is
+    written inside its own SAVEPOINT, so a bad row is rolled back alone;
+    the failed rows are returned as (row, error) pairs. Called inside an
+    open ``write_transaction`` the rows join it and commit with it.
+    """
+    if not rows:
+        return []
+
+    if not savepoint_per_row:
+        async with write_transaction(db):
+            await db.executemany(_UPSERT_PROMPT_SQL, [_upsert_params(r) for r in rows])
+            await _replace_includes_many(db, [r for r in rows if "includes" in r])
+        return []
+
+    failed = []
+    async with write_transaction(db):
+        # Releasing an outermost savepoint would commit, so open the transaction first
+        if not db.in_transaction:
+            await db.execute("BEGIN")
+        for row in rows:
+            await db.execute("SAVEPOINT upsert_prompt_row")
+            try:
+                await db.execute(_UPSERT_PROMPT_SQL, _upsert_params(row))
+                if "includes" in row:
+                    await _replace_includes_many(db, [row])
+            except aiosqlite.Error as e:
+                await db.execute("ROLLBACK TO upsert_prompt_row")
+                failed.append((row, e))
+            await db.execute("RELEASE upsert_prompt_row")
+    return failed
 
 
 async def delete_prompt(db: aiosqlite.Connection, prompt_id: str) -> None:
-    await db.execute("DELETE FROM prompts WHERE id = ?", (prompt_id,))
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute("DELETE FROM prompts WHERE id = ?", (prompt_id,))
+
+
+async def get_file_shas(db: aiosqlite.Connection, app_id: str) -> dict[str, str | None]:
+    """Map file_path -> git_sha (blob SHA) for every indexed prompt of an app."""
+    async with db.execute(
+        "SELECT file_path, git_sha FROM prompts WHERE app_id = ?", (app_id,)
+    ) as cursor:
+        return {row["file_path"]: row["git_sha"] for row in await cursor.fetchall()}
+
+
+async def move_prompt_files(
+    db: aiosqlite.Connection, app_id: str, moves: list[tuple[str, str]]
+) -> None:
+    """Repoint prompts at new file paths. ``moves`` holds (old_path, new_path) pairs."""
+    if not moves:
+        return
+    async with write_transaction(db):
+        await db.executemany(
+            """UPDATE prompts SET file_path = ?, last_synced_at = datetime('now')
+               WHERE app_id = ? AND file_path = ?""",
+            [(new_path, app_id, old_path) for old_path, new_path in moves],
+        )
+
+
+async def delete_prompts_by_paths(
+    db: aiosqlite.Connection, app_id: str, file_paths: list[str]
+) -> list[dict]:
+    """Delete the prompts backed by the given files. Returns the deleted (id, name) rows."""
+    if not file_paths:
+        return []
+    placeholders = ",".join("?" * len(file_paths))
+    async with write_transaction(db):
+        async with db.execute(
+            f"SELECT id, name FROM prompts WHERE app_id = ? AND file_path IN ({placeholders})",
+            [app_id, *file_paths],
+        ) as cursor:
+            deleted = [dict(row) for row in await cursor.fetchall()]
+        await db.execute(
+            f"DELETE FROM prompts WHERE app_id = ? AND file_path IN ({placeholders})",
+            [app_id, *file_paths],
+        )
+    return deleted
 
 
 async def delete_prompts_by_app(db: aiosqlite.Connection, app_id: str) -> None:
-    await db.execute("DELETE FROM prompts WHERE app_id = ?", (app_id,))
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute("DELETE FROM prompts WHERE app_id = ?", (app_id,))
 
 
-async def log_access(
-    db: aiosqlite.Connection,
-    prompt_id: str,
-    prompt_name: str | None,
-    api_key_id: str | None,
-    version_served: str | None,
-    cache_hit: bool,
-    response_time_ms: int,
-    client_ip: str | None,
-    user_agent: str | None,
+async def replace_includes(
+    db: aiosqlite.Connection, prompt_id: str, app_id: str, include_names: list[str]
 ) -> None:
-    await db.execute(
-        """INSERT INTO prompt_access_log
-           (prompt_id, prompt_name, api_key_id, version_served, cache_hit,
-            response_time_ms, client_ip, user_agent)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (prompt_id, prompt_name, api_key_id, version_served, 1 if cache_hit else 0,
-         response_time_ms, client_ip, user_agent),
-    )
-    await db.commit()
+    """Replace the materialized include edges of a prompt."""
+    async with write_transaction(db):
+        await db.execute("DELETE FROM prompt_includes WHERE prompt_id = ?", (prompt_id,))
+        if include_names:
+            await db.executemany(
+                "INSERT OR IGNORE INTO prompt_includes (prompt_id, app_id, include_name) VALUES (?, ?, ?)",
+                [(prompt_id, app_id, name) for name in include_names],
+            )
+
+
+async def _replace_includes_many(db: aiosqlite.Connection, rows: list[dict]) -> None:
+    if not rows:
+        return
+    await db.executemany("DELETE FROM prompt_includes WHERE prompt_id = ?", [(r["id"],) for r in rows])
+    edges = [(r["id"], r["app_id"], name) for r in rows for name in r["includes"]]
+    if edges:
+        await db.executemany(
+            "INSERT OR IGNORE INTO prompt_includes (prompt_id, app_id, include_name) VALUES (?, ?, ?)",
+            edges,
+        )
+
+
+async def get_include_edges(db: aiosqlite.Connection, app_id: str) -> dict[str, list[str]]:
+    """Materialized include graph of an app's active prompts: {name: [included names]}."""
+    async with db.execute(
+        "SELECT p.name, e.include_name FROM prompt_includes e "
+        "JOIN prompts p ON p.id = e.prompt_id "
+        "WHERE e.app_id = ? AND p.active = 1",
+        (app_id,),
+    ) as cursor:
+        rows = await cursor.fetchall()
+    edges: dict[str, list[str]] = {}
+    for row in rows:
+        edges.setdefault(row["name"], []).append(row["include_name"])
+    return edges
+
+
+async def get_include_closure(
+    db: aiosqlite.Connection, app_id: str, names: list[str], max_depth: int
+) -> dict[str, str]:
+    """Fetch the bodies of ``names`` and everything they transitively include.
+
+    Walks ``prompt_includes`` with a recursive CTE (bounded by ``max_depth``,
+    which also terminates cycles), so the whole closure costs one query.
+    Returns {name: body} for the active prompts found.
+    """
+    sql = """
+        WITH RECURSIVE closure(name, depth) AS (
+            SELECT value, 1 FROM json_each(?)
+            UNION
+            SELECT e.include_name, c.depth + 1
+            FROM closure c
+            JOIN prompts p ON p.app_id = ? AND p.name = c.name AND p.active = 1
+            JOIN prompt_includes e ON e.prompt_id = p.id
+            WHERE c.depth < ?
+        )
+        SELECT p.name, COALESCE(p.body, json_extract(p.front_matter, '$._body'), '') AS body
+        FROM prompts p
+        WHERE p.app_id = ? AND p.active = 1 AND p.name IN (SELECT name FROM closure)
+    """
+    async with db.execute(sql, (json.dumps(names), app_id, max_depth, app_id)) as cursor:
+        rows = await cursor.fetchall()
+        return {row["name"]: row["body"] for row in rows}
+
+
+async def log_access_many(db: aiosqlite.Connection, rows: list[tuple]) -> None:
+    """Insert many access-log rows in a single transaction.
+
+    Each row is (prompt_id, prompt_name, api_key_id, version_served, cache_hit,
+    response_time_ms, client_ip, user_agent). On failure the whole batch is
+    rolled back (so no partial batch rides along with the next commit) and
+    the error is raised. The rollback is scoped by ``write_transaction``, so
+    it never reaches writes other coroutines have in flight on ``db``.
+    """
+    if not rows:
+        return
+    async with write_transaction(db):
+        await db.executemany(
+            """INSERT INTO prompt_access_log
+               (prompt_id, prompt_name, api_key_id, version_served, cache_hit,
+                response_time_ms, client_ip, user_agent)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows,
+        )
@@ -7,6 +7,7 @@ import uuid
 
 import aiosqlite
 
+from server.db.database import write_transaction
 from server.utils.crypto import encrypt, decrypt
 
 
@@ -57,30 +58,30 @@ async def upsert_provider_config(
     secrets: dict | None = None,
 ) -> str:
     """Insert or update a provider config. Returns the config id."""
-    existing = await get_provider_config(db, scope, scope_id, provider, environment)
-
-    config_str = json.dumps(config_json or {})
-    secrets_enc = None
-    if secrets:
-        secrets_enc = encrypt(json.dumps(secrets))
-    elif existing and existing.get("_secrets_encrypted_raw"):
-        # Preserve existing secrets if none provided
-        secrets_enc = existing["_secrets_encrypted_raw"]
-
-    if existing:
-        config_id = existing["id"]
-        await db.execute(
-            "UPDATE provider_configs SET config_json = ?, secrets_encrypted = ?, updated_at = datetime('now') WHERE id = ?",
-            (config_str, secrets_enc, config_id),
-        )
-    else:
-        config_id = str(uuid.uuid4())
-        await db.execute(
-            "INSERT INTO provider_configs (id, scope, scope_id, provider, environment, config_json, secrets_encrypted) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (config_id, scope, scope_id, provider, environment, config_str, secrets_enc),
-        )
-    await db.commit()
+    async with write_transaction(db):
+        existing = await get_provider_config(db, scope, scope_id, provider, environment)
+
+        config_str = json.dumps(config_json or {})
+        secrets_enc = None
+        if secrets:
+            secrets_enc = encrypt(json.dumps(secrets))
+        elif existing and existing.get("_secrets_encrypted_raw"):
+            # Preserve existing secrets if none provided
+            secrets_enc = existing["_secrets_encrypted_raw"]
+
+        if existing:
+            config_id = existing["id"]
+            await db.execute(
+                "UPDATE provider_configs SET config_json = ?, secrets_encrypted = ?, updated_at = datetime('now') WHERE id = ?",
+                (config_str, secrets_enc, config_id),
+            )
+        else:
+            config_id = str(uuid.uuid4())
+            await db.execute(
+                "INSERT INTO provider_configs (id, scope, scope_id, provider, environment, config_json, secrets_encrypted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (config_id, scope, scope_id, provider, environment, config_str, secrets_enc),
+            )
     return config_id
 
 
@@ -92,17 +93,17 @@ async def delete_provider_config(
     environment: str | None = None,
 ) -> bool:
     """Delete a provider config. Returns True if a row was deleted."""
-    if environment is None:
-        cursor = await db.execute(
-            "DELETE FROM provider_configs WHERE scope = ? AND scope_id = ? AND provider = ? AND environment IS NULL",
-            (scope, scope_id, provider),
-        )
-    else:
-        cursor = await db.execute(
-            "DELETE FROM provider_configs WHERE scope = ? AND scope_id = ? AND provider = ? AND environment = ?",
-            (scope, scope_id, provider, environment),
-        )
-    await db.commit()
+    async with write_transaction(db):
+        if environment is None:
+            cursor = await db.execute(
+                "DELETE FROM provider_configs WHERE scope = ? AND scope_id = ? AND provider = ? AND environment IS NULL",
+                (scope, scope_id, provider),
+            )
+        else:
+            cursor = await db.execute(
+                "DELETE FROM provider_configs WHERE scope = ? AND scope_id = ? AND provider = ? AND environment = ?",
+                (scope, scope_id, provider, environment),
+            )
     return cursor.rowcount > 0
 
 
@@ -4,6 +4,8 @@ import uuid
 
 import aiosqlite
 
+from server.db.database import write_transaction
+
 
 async def get_user(db: aiosqlite.Connection, user_id: str) -> dict | None:
     async with db.execute("SELECT * FROM users WHERE id = ?", (user_id,)) as cursor:
@@ -28,26 +30,25 @@ async def upsert_user(
     avatar_url: str | None = None,
     access_token_encrypted: str | None = None,
 ) -> str:
-    existing = await get_user_by_github_id(db, github_id)
-    if existing:
+    async with write_transaction(db):
+        existing = await get_user_by_github_id(db, github_id)
+        if existing:
+            await db.execute(
+                """UPDATE users SET github_login=?, display_name=?, email=?,
+                   avatar_url=?, access_token_encrypted=?, last_login_at=datetime('now')
+                   WHERE id=?""",
+                (github_login, display_name, email, avatar_url, access_token_encrypted, existing["id"]),
+            )
+            return existing["id"]
+
+        user_id = str(uuid.uuid4())
         await db.execute(
-            """UPDATE users SET github_login=?, display_name=?, email=?,
-               avatar_url=?, access_token_encrypted=?, last_login_at=datetime('now')
-               WHERE id=?""",
-            (github_login, display_name, email, avatar_url, access_token_encrypted, existing["id"]),
+            """INSERT INTO users
+               (id, github_id, github_login, display_name, email, avatar_url,
+                access_token_encrypted, last_login_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+            (user_id, github_id, github_login, display_name, email, avatar_url, access_token_encrypted),
         )
-        await db.commit()
-        return existing["id"]
-
-    user_id = str(uuid.uuid4())
-    await db.execute(
-        """INSERT INTO users
-           (id, github_id, github_login, display_name, email, avatar_url,
-            access_token_encrypted, last_login_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
-        (user_id, github_id, github_login, display_name, email, avatar_url, access_token_encrypted),
-    )
-    await db.commit()
     return user_id
 
 
@@ -58,22 +59,22 @@ async def upsert_org_membership(
     role: str = "member",
     access_status: str = "authorized",
 ) -> None:
-    await db.execute(
-        """INSERT INTO org_memberships (user_id, org_id, role, access_status)
-           VALUES (?, ?, ?, ?)
-           ON CONFLICT(user_id, org_id) DO UPDATE SET role=excluded.role, access_status=excluded.access_status""",
-        (user_id, org_id, role, access_status),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        await db.execute(
+            """INSERT INTO org_memberships (user_id, org_id, role, access_status)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(user_id, org_id) DO UPDATE SET role=excluded.role, access_status=excluded.access_status""",
+            (user_id, org_id, role, access_status),
+        )
 
 
 async def delete_org_membership(
     db: aiosqlite.Connection, user_id: str, org_id: str
 ) -> bool:
     """Remove a user's membership in an org. Returns True if a row was deleted."""
-    cursor = await db.execute(
-        "DELETE FROM org_memberships WHERE user_id = ? AND org_id = ?",
-        (user_id, org_id),
-    )
-    await db.commit()
+    async with write_transaction(db):
+        cursor = await db.execute(
+            "DELETE FROM org_memberships WHERE user_id = ? AND org_id = ?",
+            (user_id, org_id),
+        )
     return cursor.rowcount > 0
@@ -12,11 +12,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from server._version import __version__
 from server.config import settings
 from server.db.database import init_db, close_db, get_db
-from server.auth.sessions import cleanup_expired_sessions
+from server.auth.sessions import cleanup_expired_sessions, session_expiry_buffer
+from server.auth.api_keys import last_used_buffer
+from server.services.access_log import access_log_writer
+from server.services.webhook_queue import webhook_queue
+from server.services.github_service import github_clients
+from server.services.rate_limit_store import rate_limit_store
 from server.auth.middleware import AuthMiddleware
 from server.auth.rate_limiter import RateLimitMiddleware
 from server.auth.github_oauth import router as auth_router
-from server.api.public import router as public_router
+from server.api.public import batch_router as public_batch_router, router as public_router
 from server.api.admin import router as admin_router
 from server.api.webhooks import router as webhooks_router
 from server.api.api_keys import router as api_keys_router
@@ -39,22 +44,96 @@ async def _session_cleanup_loop():
             logger.exception("Session cleanup failed")
 
 
+async def _last_used_flush_loop():
+    """Background task: persist buffered API key last_used_at timestamps."""
+    while True:
+        await asyncio.sleep(settings.api_key_last_used_flush_seconds)
+        try:
+            db = await get_db()
+            await last_used_buffer.flush(db)
+        except Exception:
+            logger.exception("API key last_used_at flush failed")
+
+
+async def _session_expiry_flush_loop():
+    """Background task: persist buffered session expiry refreshes."""
+    while True:
+        await asyncio.sleep(settings.session_expiry_flush_seconds)
+        try:
+            db = await get_db()
+            await session_expiry_buffer.flush(db)
+        except Exception:
+            logger.exception("Session expiry flush failed")
+
+
+async def _access_log_flush_loop():
+    """Background task: write queued prompt_access_log rows in batches."""
+    while True:
+        await access_log_writer.wait_for_batch(settings.access_log_flush_seconds)
+        try:
+            db = await get_db()
+            await access_log_writer.flush(db)
+        except Exception:
+            logger.exception("Access log flush failed")
+
+
+async def _webhook_worker_loop():
+    """Background task: apply queued GitHub pushes, coalesced per app."""
+    while True:
+        await webhook_queue.wait_for_work()
+        # Let a burst of pushes to the same app pile up into one sync
+        await asyncio.sleep(settings.webhook_coalesce_seconds)
+        try:
+            db = await get_db()
+            await webhook_queue.process(db)
+        except Exception:
+            logger.exception("Webhook processing failed")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
     logger.info("Starting Promptdis server...")
     await init_db()
 
-    cleanup_task = None
+    background_tasks: list[asyncio.Task] = []
     if settings.deployment_mode != "lambda":
         # Container mode: run session cleanup loop in background
-        cleanup_task = asyncio.create_task(_session_cleanup_loop())
+        background_tasks.append(asyncio.create_task(_session_cleanup_loop()))
+        background_tasks.append(asyncio.create_task(_last_used_flush_loop()))
+        background_tasks.append(asyncio.create_task(_session_expiry_flush_loop()))
+        background_tasks.append(asyncio.create_task(_access_log_flush_loop()))
+        background_tasks.append(asyncio.create_task(_webhook_worker_loop()))
 
     logger.info("Promptdis server ready (mode=%s)", settings.deployment_mode)
     yield
 
-    if cleanup_task:
-        cleanup_task.cancel()
+    for task in background_tasks:
+        task.cancel()
+
+    # Drain write-behind buffers before the connection goes away
+    try:
+        await last_used_buffer.flush(await get_db())
+    except Exception:
+        logger.exception("Final API key last_used_at flush failed")
+    try:
+        await session_expiry_buffer.flush(await get_db())
+    except Exception:
+        logger.exception("Final session expiry flush failed")
+    try:
+        await access_log_writer.flush(await get_db())
+    except Exception:
+        logger.exception("Final access log flush failed")
+    try:
+        await webhook_queue.process(await get_db())
+    except Exception:
+        logger.exception("Final webhook queue drain failed")
+
+    if settings.deployment_mode != "lambda":
+        # Mangum runs the lifespan per invocation: pooled clients and the rate-limit
+        # store's connection must outlive it, and go with the execution environment
+        github_clients.clear()
+        await rate_limit_store.close()
     await close_db()
     logger.info("Promptdis server stopped")
 
@@ -68,6 +147,7 @@ app = FastAPI(
 
 # Middleware order: Starlette LIFO — last added runs outermost (first).
 # We want: request → CORS → RateLimiter → Auth → route handlers
+# (the rate limiter identifies cached API keys itself, so it needs no auth state)
 # Add Auth first (innermost), then RateLimiter, then CORS last (outermost).
 # CORS must be outermost so it adds headers to ALL responses, including 401/429 errors.
 app.add_middleware(AuthMiddleware)
@@ -83,6 +163,7 @@ app.add_middleware(
 # Register routers
 app.include_router(auth_router)
 app.include_router(public_router)
+app.include_router(public_batch_router)
 app.include_router(admin_router)
 app.include_router(webhooks_router)
 app.include_router(api_keys_router)
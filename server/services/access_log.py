@@ -0,0 +1,124 @@
+"""Buffered bulk writer for prompt_access_log.
+
+Request handlers enqueue rows without touching the database; a background
+flusher writes them in batches with a single ``executemany`` per transaction.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+
+import aiosqlite
+
+from server.config import settings
+from server.db.queries import prompts as prompt_queries
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogWriter:
+    """Bounded in-memory queue of access-log rows with batched flushing.
+
+    A batch whose write fails is rolled back and put back at the head of the
+    queue for the next flush; if it fails again it is dropped (counted in
+    ``dropped``), so one bad batch can't block logging for good.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500):
+        self._queue: deque[tuple] = deque()
+        self._max_queue = max_queue
+        self._batch_size = batch_size
+        self._wakeup: asyncio.Event | None = None
+        self._retrying = 0  # rows at the head of the queue that already failed once
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.requeued = 0
+
+    def enqueue(
+        self,
+        prompt_id: str,
+        prompt_name: str | None,
+        api_key_id: str | None,
+        version_served: str | None,
+        cache_hit: bool,
+        response_time_ms: int,
+        client_ip: str | None,
+        user_agent: str | None,
+    ) -> bool:
+        """Queue a row. Returns False (and counts a drop) when the queue is full."""
+        if len(self._queue) >= self._max_queue:
+            self.dropped += 1
+            return False
+        self._queue.append((
+            prompt_id, prompt_name, api_key_id, version_served, 1 if cache_hit else 0,
+            response_time_ms, client_ip, user_agent,
+        ))
+        self.enqueued += 1
+        if self._wakeup is not None and len(self._queue) >= self._batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self, db: aiosqlite.Connection) -> int:
+        """Write everything currently queued, one batch per transaction. Returns rows written."""
+        total = 0
+        while self._queue:
+            size = self._retrying or min(self._batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(size)]
+            try:
+                await prompt_queries.log_access_many(db, batch)
+            except Exception:
+                if self._retrying:
+                    # Access logging is best-effort — a batch that failed twice is dropped
+                    self._retrying = 0
+                    self.dropped += len(batch)
+                    logger.exception("Failed to write %d access-log rows again; dropping them", len(batch))
+                    continue
+                self._queue.extendleft(reversed(batch))
+                self._retrying = len(batch)
+                self.requeued += len(batch)
+                logger.exception("Failed to write %d access-log rows; retrying on the next flush", len(batch))
+                break
+            self._retrying = 0
+            total += len(batch)
+        self.written += total
+        return total
+
+    async def wait_for_batch(self, timeout: float) -> None:
+        """Block until a full batch is queued or ``timeout`` seconds pass."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def clear(self) -> None:
+        """Discard queued rows and reset counters."""
+        self._queue.clear()
+        self._retrying = 0
+        self.enqueued = self.written = self.dropped = self.requeued = 0
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "max_queue": self._max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "requeued": self.requeued,
+            "dropped": self.dropped,
+        }
+
+    @property
+    def size(self) -> int:
+        return len(self._queue)
+
+
+# Global writer instance
+access_log_writer = AccessLogWriter(
+    max_queue=settings.access_log_max_queue,
+    batch_size=settings.access_log_batch_size,
+)
@@ -2,7 +2,10 @@
 
 from __future__ import annotations
 
+import asyncio
+import gzip
 import hashlib
+import json
 import logging
 import time
 import threading
@@ -12,12 +15,34 @@ logger = logging.getLogger(__name__)
 
 
 class PromptCache:
-    """Thread-safe in-memory LRU cache with ETag support."""
+    """Thread-safe in-memory LRU cache with ETag support.
 
-    def __init__(self, max_size: int = 1000, default_ttl: int = 60):
-        self._cache: OrderedDict[str, _CacheEntry] = OrderedDict()
+    Each entry also holds the response body pre-encoded as JSON bytes (plus a
+    gzip variant for larger payloads), so cache hits skip JSON encoding.
+
+    Entries are fresh for ``default_ttl`` seconds and may then be served
+    stale for ``stale_ttl`` more while they are revalidated; past that they
+    are dropped, so an entry whose revalidation keeps failing is not served
+    forever.
+
+    A reverse index maps ``app:<app_id>``, ``prompt:<prompt_id>`` and
+    ``file:<app_id>:<file_path>`` tags to every cache key (``id:*`` and
+    ``name:*``) holding that prompt, so mutations evict only what they touch.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        default_ttl: int = 60,
+        gzip_min_bytes: int = 1024,
+        stale_ttl: int = 300,
+    ):
+        self._cache: OrderedDict[str, CacheEntry] = OrderedDict()
         self._max_size = max_size
         self._default_ttl = default_ttl
+        self._stale_ttl = stale_ttl
+        self._gzip_min_bytes = gzip_min_bytes
+        self._index: dict[str, set[str]] = {}
         self._lock = threading.Lock()
 
     def get(self, key: str) -> tuple[dict | None, str | None, bool]:
@@ -25,61 +50,195 @@ class PromptCache:
 
         Returns (None, None, False) on cache miss.
         """
+        entry, is_fresh = self.get_entry(key)
+        if entry is None:
+            return None, None, False
+        return entry.data, entry.etag, is_fresh
+
+    def get_entry(self, key: str) -> tuple[CacheEntry | None, bool]:
+        """Get the full cache entry (including encoded payloads). Returns (entry, is_fresh).
+
+        An entry past its stale window is removed and reported as a miss.
+        """
         with self._lock:
             entry = self._cache.get(key)
             if entry is None:
-                return None, None, False
+                return None, False
+
+            age = time.time() - entry.cached_at
+            if age >= self._default_ttl + self._stale_ttl:
+                self._remove(key)
+                return None, False
 
             # Move to end (most recently used)
             self._cache.move_to_end(key)
+            return entry, age < self._default_ttl
 
-            is_fresh = (time.time() - entry.cached_at) < self._default_ttl
-            return entry.data, entry.etag, is_fresh
+    def put(self, key: str, data: dict, etag: str | None = None, file_path: str | None = None) -> CacheEntry:
+        """Store a prompt in cache. Returns the stored entry.
 
-    def put(self, key: str, data: dict, etag: str | None = None) -> None:
-        """Store a prompt in cache."""
+        ``file_path`` (the prompt's path in the repo) enables ``invalidate_file``.
+        """
+        entry = _build_entry(data, etag, self._gzip_min_bytes, file_path)
+        self.put_entry(key, entry)
+        return entry
+
+    def put_entry(self, key: str, entry: CacheEntry) -> None:
+        """Store an already-built entry (e.g. the same prompt under a second key)."""
         with self._lock:
             if key in self._cache:
+                self._unindex(key, self._cache[key])
                 self._cache.move_to_end(key)
-            self._cache[key] = _CacheEntry(
-                data=data,
-                etag=etag or _generate_etag(data),
-                cached_at=time.time(),
-            )
+            self._cache[key] = entry
+            for tag in entry.tags:
+                self._index.setdefault(tag, set()).add(key)
             # Evict LRU if over capacity
             while len(self._cache) > self._max_size:
-                self._cache.popitem(last=False)
+                old_key, old_entry = self._cache.popitem(last=False)
+                self._unindex(old_key, old_entry)
 
     def invalidate(self, key: str) -> None:
         """Remove a specific key from cache."""
         with self._lock:
-            self._cache.pop(key, None)
+            self._remove(key)
 
     def invalidate_by_prefix(self, prefix: str) -> int:
         """Remove all keys matching a prefix. Returns count removed."""
         with self._lock:
             keys_to_remove = [k for k in self._cache if k.startswith(prefix)]
             for k in keys_to_remove:
-                del self._cache[k]
+                self._remove(k)
             return len(keys_to_remove)
 
+    def invalidate_prompt(self, prompt_id: str) -> int:
+        """Remove every key (by id and by name) for a prompt. Returns count removed."""
+        return self._invalidate_tag(f"prompt:{prompt_id}")
+
+    def invalidate_app(self, app_id: str) -> int:
+        """Remove every key for prompts of an application. Returns count removed."""
+        return self._invalidate_tag(f"app:{app_id}")
+
+    def invalidate_file(self, app_id: str, file_path: str) -> int:
+        """Remove every key for the prompt backed by a repo file. Returns count removed."""
+        return self._invalidate_tag(f"file:{app_id}:{file_path}")
+
     def clear(self) -> None:
         """Clear entire cache."""
         with self._lock:
             self._cache.clear()
+            self._index.clear()
+
+    def _invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            keys = list(self._index.get(tag, ()))
+            for k in keys:
+                self._remove(k)
+            return len(keys)
+
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._unindex(key, entry)
+
+    def _unindex(self, key: str, entry: CacheEntry) -> None:
+        for tag in entry.tags:
+            keys = self._index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[tag]
 
     @property
     def size(self) -> int:
         return len(self._cache)
 
 
-class _CacheEntry:
-    __slots__ = ("data", "etag", "cached_at")
+class CacheEntry:
+    __slots__ = ("cached_at", "data", "etag", "payload", "payload_gzip", "tags")
 
-    def __init__(self, data: dict, etag: str, cached_at: float):
+    def __init__(
+        self,
+        data: dict,
+        etag: str,
+        cached_at: float,
+        payload: bytes = b"",
+        payload_gzip: bytes | None = None,
+        tags: tuple[str, ...] = (),
+    ):
         self.data = data
         self.etag = etag
         self.cached_at = cached_at
+        self.payload = payload
+        self.payload_gzip = payload_gzip
+        self.tags = tags
+
+
+class SingleFlight:
+    """Coalesce concurrent rebuilds of the same cache key into one coroutine.
+
+    The first caller for a key starts the loader as its own task; later callers
+    await that same task. Waiters are shielded, so a cancelled request does not
+    cancel the rebuild the others are waiting on.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, loader):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved; waiters (if any) re-raise it
+
+
+def encode_payload(data: dict) -> bytes:
+    """Encode a dict exactly as FastAPI's JSONResponse would."""
+    return json.dumps(
+        data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _build_entry(
+    data: dict, etag: str | None, gzip_min_bytes: int, file_path: str | None = None
+) -> CacheEntry:
+    payload = encode_payload(data)
+    payload_gzip = None
+    if len(payload) >= gzip_min_bytes:
+        # mtime=0 keeps the compressed bytes deterministic for a given payload
+        payload_gzip = gzip.compress(payload, compresslevel=6, mtime=0)
+    return CacheEntry(
+        data=data,
+        etag=etag or _generate_etag(data),
+        cached_at=time.time(),
+        payload=payload,
+        payload_gzip=payload_gzip,
+        tags=_entry_tags(data, file_path),
+    )
+
+
+def _entry_tags(data: dict, file_path: str | None) -> tuple[str, ...]:
+    tags = []
+    app_id = data.get("app_id")
+    if app_id:
+        tags.append(f"app:{app_id}")
+        if file_path:
+            tags.append(f"file:{app_id}:{file_path}")
+    if data.get("id"):
+        tags.append(f"prompt:{data['id']}")
+    return tuple(tags)
 
 
 def _generate_etag(data: dict) -> str:
@@ -92,5 +251,6 @@ def _generate_etag(data: dict) -> str:
     return f'"{hashlib.md5(content.encode()).hexdigest()[:16]}"'
 
 
-# Global cache instance
+# Global instances
 prompt_cache = PromptCache()
+prompt_loads = SingleFlight()
@@ -2,25 +2,171 @@
 
 from __future__ import annotations
 
+import asyncio
 import base64
+import functools
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
 
 from github import Github, GithubException, InputGitAuthor
 
+from server.config import settings
+from server.utils.crypto import decrypt
+from server.utils.front_matter import git_blob_sha
+
 logger = logging.getLogger(__name__)
 
 
+class ETagCache:
+    """Thread-safe LRU of {request: (etag, body)} for conditional GitHub requests."""
+
+    def __init__(self, max_size: int = 500):
+        self._cache: OrderedDict[tuple, tuple[str, object]] = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[str, object] | None:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, etag: str, body: object) -> None:
+        with self._lock:
+            self._cache[key] = (etag, body)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+
+class BlobCache:
+    """Content-addressed cache of Git blob contents keyed by blob SHA.
+
+    Blobs are immutable, so entries never go stale: an in-memory LRU backed
+    by an optional on-disk store (``<disk_dir>/<sha[:2]>/<sha[2:]>``) that
+    survives restarts. Disk entries are re-hashed on read.
+    """
+
+    def __init__(self, max_size: int = 2000, disk_dir: str = ""):
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._max_size = max_size
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, sha: str) -> str | None:
+        with self._lock:
+            content = self._cache.get(sha)
+            if content is not None:
+                self._cache.move_to_end(sha)
+                self.hits += 1
+                return content
+        content = self._read_disk(sha)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(sha, content)
+        return content
+
+    def put(self, sha: str, content: str) -> None:
+        with self._lock:
+            self._remember(sha, content)
+        self._write_disk(sha, content)
+
+    def clear(self) -> None:
+        """Clear the in-memory LRU and counters (the disk store is left alone)."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "disk_dir": str(self._disk_dir) if self._disk_dir else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def _remember(self, sha: str, content: str) -> None:
+        self._cache[sha] = content
+        self._cache.move_to_end(sha)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    def _disk_path(self, sha: str) -> Path:
+        return self._disk_dir / sha[:2] / sha[2:]
+
+    def _read_disk(self, sha: str) -> str | None:
+        if self._disk_dir is None:
+            return None
+        try:
+            content = self._disk_path(sha).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+        return content if git_blob_sha(content) == sha else None
+
+    def _write_disk(self, sha: str, content: str) -> None:
+        if self._disk_dir is None:
+            return
+        path = self._disk_path(sha)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            tmp.write_text(content, encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Failed to write blob %s to disk cache: %s", sha, e)
+
+
+# Global blob cache (content-addressed, shared by all clients)
+blob_cache = BlobCache(
+    max_size=settings.github_blob_cache_max_size,
+    disk_dir=settings.github_blob_cache_dir,
+)
+
+
 class GitHubService:
     """Wraps PyGithub to read/write .md prompt files in GitHub repos."""
 
-    def __init__(self, access_token: str):
-        self.gh = Github(access_token)
+    def __init__(self, access_token: str, pool_size: int | None = None):
+        self.gh = Github(access_token, pool_size=pool_size)
+        # Stable, non-reversible label for the token in quota stats
+        self.token_id = hashlib.sha256(access_token.encode()).hexdigest()[:12]
+        # Per client (i.e. per token), so one user's cached responses never reach another
+        self._etag_cache = ETagCache(max_size=settings.github_etag_cache_max_size)
 
     def close(self):
         self.gh.close()
 
     # ── Read operations ──
 
+    def get_user_profile(self) -> dict:
+        """Login and avatar of the authenticated user."""
+        user = self.gh.get_user()
+        return {"login": user.login, "avatar_url": user.avatar_url}
+
+    def get_repo_info(self, repo_full_name: str) -> dict:
+        """Fetch a repo (raises GithubException if it is missing or inaccessible)."""
+        repo = self.gh.get_repo(repo_full_name)
+        return {"full_name": repo.full_name, "default_branch": repo.default_branch, "private": repo.private}
+
     def list_repos(self) -> list[dict]:
         """List repos accessible to the authenticated user."""
         repos = []
@@ -118,32 +264,80 @@ class GitHubService:
                 })
         return files
 
+    def list_md_tree(
+        self, repo_full_name: str, subdirectory: str = "", branch: str = "main"
+    ) -> tuple[list[dict], bool]:
+        """List all .md blobs under a subdirectory with one recursive tree call.
+
+        ``branch`` may also be a commit SHA. Returns (files, complete).
+        ``complete`` is False when GitHub truncated the tree and the listing
+        fell back to ``list_md_files``. Raises
+        GithubException if the tree cannot be read.
+        """
+        prefix = f"{subdirectory.strip('/')}/" if subdirectory and subdirectory.strip("/") else ""
+
+        # Conditional: an unchanged branch costs a free 304
+        tree = self._conditional_get(
+            f"/repos/{repo_full_name}/git/trees/{quote(branch, safe='/')}", {"recursive": "1"}
+        )
+        if tree.get("truncated"):
+            logger.warning("Git tree for %s is truncated; falling back to directory walk", repo_full_name)
+            return self.list_md_files(repo_full_name, subdirectory=subdirectory, branch=branch), False
+
+        files = []
+        for element in tree["tree"]:
+            if element["type"] != "blob" or not element["path"].endswith(".md"):
+                continue
+            if prefix and not element["path"].startswith(prefix):
+                continue
+            files.append({
+                "path": element["path"],
+                "name": element["path"].rsplit("/", 1)[-1],
+                "sha": element["sha"],
+                "size": element.get("size"),
+            })
+        return files, True
+
+    def get_blob(self, repo_full_name: str, sha: str) -> str:
+        """Content of one blob by SHA; one GitHub call unless it is in ``blob_cache``."""
+        return self._get_blob(self.gh.get_repo(repo_full_name, lazy=True), sha)
+
     def get_file_content(
         self, repo_full_name: str, file_path: str, branch: str = "main"
     ) -> tuple[str, str]:
-        """Get file content and SHA. Returns (content, sha)."""
-        repo = self.gh.get_repo(repo_full_name)
-        file = repo.get_contents(file_path, ref=branch)
+        """Get file content and SHA. Returns (content, sha).
+
+        Sent as a conditional request, so re-reading an unchanged file is a
+        free 304. Raises GithubException if the file cannot be read.
+        """
+        file = self._conditional_get(
+            f"/repos/{repo_full_name}/contents/{quote(file_path)}", {"ref": branch}
+        )
         if isinstance(file, list):
             raise ValueError(f"Expected file, got directory: {file_path}")
-        content = base64.b64decode(file.content).decode("utf-8")
-        return content, file.sha
+        content = blob_cache.get(file["sha"])
+        if content is None:
+            content = base64.b64decode(file["content"]).decode("utf-8")
+            blob_cache.put(file["sha"], content)
+        return content, file["sha"]
 
     def get_file_history(
         self, repo_full_name: str, file_path: str, branch: str = "main", limit: int = 20
     ) -> list[dict]:
-        """Get git commit history for a specific file."""
-        repo = self.gh.get_repo(repo_full_name)
-        commits = repo.get_commits(path=file_path, sha=branch)
+        """Get git commit history for a specific file (conditional request)."""
+        commits = self._conditional_get(
+            f"/repos/{repo_full_name}/commits", {"path": file_path, "sha": branch, "per_page": limit}
+        )
         history = []
-        for i, commit in enumerate(commits):
-            if i >= limit:
-                break
+        for commit in commits[:limit]:
+            author = commit["commit"].get("author")
+            date = author.get("date") if author else None
             history.append({
-                "sha": commit.sha,
-                "message": commit.commit.message,
-                "author": commit.commit.author.name if commit.commit.author else None,
-                "date": commit.commit.author.date.isoformat() if commit.commit.author else None,
+                "sha": commit["sha"],
+                "message": commit["commit"]["message"],
+                "author": author.get("name") if author else None,
+                # GitHub sends "...Z"; keep the "+00:00" form the history API has always returned
+                "date": datetime.fromisoformat(date).isoformat() if date else None,
             })
         return history
 
@@ -157,14 +351,48 @@ class GitHubService:
             if file.filename == file_path:
                 # Fetch the blob content at this commit
                 tree = commit.commit.tree
-                blob = self._find_blob_in_tree(repo, tree, file_path)
-                if blob:
-                    content = base64.b64decode(blob.content).decode("utf-8")
-                    return content, blob.sha
+                blob_sha = self._find_blob_in_tree(repo, tree, file_path)
+                if blob_sha:
+                    return self._get_blob(repo, blob_sha), blob_sha
         raise ValueError(f"File {file_path} not found at commit {sha}")
 
-    def _find_blob_in_tree(self, repo, tree, file_path: str):
-        """Walk the git tree to find a blob by file path."""
+    def _get_blob(self, repo, sha: str) -> str:
+        """Blob content by SHA, from ``blob_cache`` when possible."""
+        content = blob_cache.get(sha)
+        if content is None:
+            content = base64.b64decode(repo.get_git_blob(sha).content).decode("utf-8")
+            blob_cache.put(sha, content)
+        return content
+
+    def _conditional_get(self, path: str, parameters: dict | None = None):
+        """GET a mutable resource with If-None-Match from the last response's ETag.
+
+        A 304 reuses the cached body and does not count against the rate limit.
+        Raises GithubException on error responses.
+        """
+        key = (path, tuple(sorted((parameters or {}).items())))
+        cached = self._etag_cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        status, response_headers, output = self.gh.requester.requestJson("GET", path, parameters, headers)
+        if status == 304 and cached:
+            return cached[1]
+        data = json.loads(output) if output else None
+        if status >= 400:
+            raise GithubException(status, data, response_headers)
+        if response_headers.get("etag"):
+            self._etag_cache.put(key, response_headers["etag"], data)
+        return data
+
+    def _rate_limit(self) -> tuple[int, int, int] | None:
+        """(remaining, limit, reset epoch) from the last response's X-RateLimit-* headers, if any."""
+        remaining, limit = self.gh.requester.rate_limiting
+        reset_at = self.gh.requester.rate_limiting_resettime
+        if not all(isinstance(v, int) for v in (remaining, limit, reset_at)) or limit < 0:
+            return None
+        return remaining, limit, reset_at
+
+    def _find_blob_in_tree(self, repo, tree, file_path: str) -> str | None:
+        """Walk the git tree to find a blob SHA by file path."""
         parts = file_path.split("/")
         current_tree = tree
         for i, part in enumerate(parts):
@@ -172,7 +400,7 @@ class GitHubService:
                 if element.path == part:
                     if i == len(parts) - 1:
                         # Leaf node — should be a blob
-                        return repo.get_git_blob(element.sha)
+                        return element.sha
                     else:
                         # Directory — recurse into subtree
                         current_tree = repo.get_git_tree(element.sha)
@@ -304,13 +532,426 @@ class GitHubService:
     def get_diff(
         self, repo_full_name: str, file_path: str, sha: str, branch: str = "main"
     ) -> str | None:
-        """Get diff of a file between a specific commit and the current branch tip."""
-        repo = self.gh.get_repo(repo_full_name)
+        """Get diff of a file between a specific commit and the current branch tip (conditional request)."""
         try:
-            comparison = repo.compare(sha, branch)
-            for file in comparison.files:
-                if file.filename == file_path:
-                    return file.patch
+            comparison = self._conditional_get(
+                f"/repos/{repo_full_name}/compare/{quote(sha, safe='')}...{quote(branch, safe='/')}"
+            )
         except GithubException:
             return None
+        for file in comparison.get("files", []):
+            if file["filename"] == file_path:
+                return file.get("patch")
         return None
+
+
+class GitHubCallMetrics:
+    """Per-method call counts and latencies of GitHub calls made through the async facade."""
+
+    def __init__(self):
+        self._calls: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, elapsed_ms: float, error: bool) -> None:
+        with self._lock:
+            entry = self._calls.setdefault(method, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["calls"] += 1
+            entry["errors"] += 1 if error else 0
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                method: {
+                    "calls": e["calls"],
+                    "errors": e["errors"],
+                    "avg_ms": round(e["total_ms"] / e["calls"], 1),
+                    "max_ms": round(e["max_ms"], 1),
+                }
+                for method, e in sorted(self._calls.items())
+            }
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class GitHubQuotaExhausted(Exception):
+    """A background call would have to wait longer than allowed for GitHub quota."""
+
+    def __init__(self, token_id: str, retry_after: float):
+        super().__init__(f"GitHub quota for token {token_id} is low; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class GitHubQuotaScheduler:
+    """Schedules GitHub calls against each token's remaining rate-limit quota.
+
+    Quota is tracked per token from the ``X-RateLimit-*`` headers of every
+    response. Interactive (admin UI) calls always run. Background calls (bulk
+    syncs, webhook syncs) run with limited concurrency so interactive calls
+    always find a free thread, are paced to spread the spendable quota until
+    the reset once ``remaining`` drops below ``low_watermark`` (each call
+    takes the next free slot of the token's schedule, so concurrent calls are
+    spaced out too), and are deferred until the reset once only ``reserve``
+    calls are left. A caller that must not wait long (an HTTP request, the
+    webhook worker) passes ``max_wait`` and gets ``GitHubQuotaExhausted``
+    instead of a longer wait.
+    """
+
+    def __init__(self, reserve: int = 500, low_watermark: int = 1500, background_concurrency: int = 8):
+        self._quota: dict[str, _Quota] = {}
+        self._reserve = reserve
+        self._low_watermark = low_watermark
+        self._background_concurrency = background_concurrency
+        self._background_slots: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+        self.paced = 0
+        self.deferred = 0
+
+    def record(self, token_id: str, remaining: int, limit: int, reset_at: int) -> None:
+        with self._lock:
+            quota = self._quota.get(token_id)
+            if quota is None:
+                self._quota[token_id] = _Quota(remaining, limit, reset_at)
+            else:
+                # Keep the pacing schedule across responses
+                quota.remaining, quota.limit, quota.reset_at = remaining, limit, reset_at
+
+    def delay_for(self, token_id: str) -> tuple[float, bool]:
+        """Spacing between background calls for this token, and whether they wait for the reset instead."""
+        with self._lock:
+            quota = self._quota.get(token_id)
+        if quota is None:
+            return 0.0, False
+        until_reset = quota.reset_at - time.time()
+        if until_reset <= 0:
+            return 0.0, False
+        spendable = quota.remaining - self._reserve
+        if spendable <= 0:
+            return until_reset, True
+        if quota.remaining < self._low_watermark:
+            return until_reset / spendable, False
+        return 0.0, False
+
+    async def acquire(self, token_id: str, priority: str, max_wait: float | None = None) -> None:
+        """Wait until a call of ``priority`` may run; pair with ``release``.
+
+        Raises ``GitHubQuotaExhausted`` (without taking a slot) if a background
+        call would wait longer than ``max_wait`` seconds.
+        """
+        if priority != BACKGROUND:
+            return
+        delay, deferred = self._reserve_slot(token_id, max_wait)
+        if delay > 0:
+            with self._lock:
+                if deferred:
+                    self.deferred += 1
+                else:
+                    self.paced += 1
+            if deferred:
+                logger.warning("GitHub quota low for token %s; deferring background call %.0fs", token_id, delay)
+            await asyncio.sleep(delay)
+        if self._background_slots is None:
+            self._background_slots = asyncio.Semaphore(self._background_concurrency)
+        await self._background_slots.acquire()
+
+    def release(self, priority: str) -> None:
+        if priority == BACKGROUND and self._background_slots is not None:
+            self._background_slots.release()
+
+    def _reserve_slot(self, token_id: str, max_wait: float | None) -> tuple[float, bool]:
+        interval, deferred = self.delay_for(token_id)
+        if interval <= 0:
+            return 0.0, False
+        with self._lock:
+            quota = self._quota.get(token_id)
+            now = time.time()
+            start = now + interval if deferred or quota is None else max(now, quota.next_at)
+            if max_wait is not None and start - now > max_wait:
+                raise GitHubQuotaExhausted(token_id, start - now)
+            if not deferred and quota is not None:
+                quota.next_at = start + interval
+        return start - now, deferred
+
+    def quota(self, token_id: str) -> dict | None:
+        with self._lock:
+            quota = self._quota.get(token_id)
+        return quota.as_dict(token_id) if quota else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._quota.clear()
+            self._background_slots = None
+            self.paced = self.deferred = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            tokens = [q.as_dict(token_id) for token_id, q in self._quota.items()]
+            return {
+                "tokens": sorted(tokens, key=lambda t: t["remaining"]),
+                "reserve": self._reserve,
+                "low_watermark": self._low_watermark,
+                "background_concurrency": self._background_concurrency,
+                "paced": self.paced,
+                "deferred": self.deferred,
+            }
+
+
+class _Quota:
+    __slots__ = ("limit", "next_at", "remaining", "reset_at")
+
+    def __init__(self, remaining: int, limit: int, reset_at: int):
+        self.remaining = remaining
+        self.limit = limit
+        self.reset_at = reset_at
+        self.next_at = 0.0  # earliest start of the next paced background call
+
+    def as_dict(self, token_id: str) -> dict:
+        return {
+            "token_id": token_id,
+            "remaining": self.remaining,
+            "limit": self.limit,
+            "reset_at": self.reset_at,
+            "resets_in_seconds": max(0, int(self.reset_at - time.time())),
+        }
+
+
+# Global metrics, quota scheduler, and the pool that runs blocking PyGithub calls off the event loop
+github_metrics = GitHubCallMetrics()
+github_quota = GitHubQuotaScheduler(
+    reserve=settings.github_quota_reserve,
+    low_watermark=settings.github_quota_low_watermark,
+    background_concurrency=settings.github_background_max_concurrency,
+)
+_github_executor = ThreadPoolExecutor(max_workers=settings.github_max_threads, thread_name_prefix="github")
+
+
+class AsyncGitHubService:
+    """Async facade over GitHubService.
+
+    Every public GitHubService method is exposed as a coroutine that runs the
+    blocking PyGithub call in a dedicated bounded thread pool, so a slow
+    GitHub ties up pool threads instead of the event loop (and prompt
+    serving). Each call's latency is recorded in ``github_metrics``, and
+    each call is scheduled by ``github_quota`` according to ``priority``
+    (failing with ``GitHubQuotaExhausted`` rather than waiting past
+    ``max_wait``).
+    """
+
+    def __init__(
+        self, service: GitHubService, release=None, priority: str = INTERACTIVE, max_wait: float | None = None
+    ):
+        self.service = service
+        self.priority = priority
+        self.max_wait = max_wait
+        self._release = release
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self.service, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            await github_quota.acquire(self.service.token_id, self.priority, self.max_wait)
+            start = time.perf_counter()
+            error = False
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    _github_executor, functools.partial(method, *args, **kwargs)
+                )
+            except Exception:
+                error = True
+                raise
+            finally:
+                github_quota.release(self.priority)
+                github_metrics.record(name, (time.perf_counter() - start) * 1000, error)
+                self._record_quota()
+
+        call.__name__ = name
+        return call
+
+    async def get_blob_contents(
+        self, repo_full_name: str, blob_shas: list[str], max_workers: int = 8
+    ) -> dict[str, str]:
+        """Fetch many blobs, up to ``max_workers`` at a time. Returns {sha: content}; failed blobs are omitted.
+
+        Blobs in ``blob_cache`` cost no call; every other blob is fetched as
+        its own scheduled call, so quota pacing applies per blob rather than
+        once per batch. Raises ``GitHubQuotaExhausted`` if the quota runs
+        low mid-batch (blobs fetched so far stay cached for the retry).
+        """
+        contents: dict[str, str] = {}
+        missing = []
+        for sha in dict.fromkeys(blob_shas):
+            content = blob_cache.get(sha)
+            if content is None:
+                missing.append(sha)
+            else:
+                contents[sha] = content
+
+        slots = asyncio.Semaphore(max(1, max_workers))
+        exhausted: list[GitHubQuotaExhausted] = []
+
+        async def fetch(sha: str) -> None:
+            async with slots:
+                if exhausted:
+                    return
+                try:
+                    contents[sha] = await self.get_blob(repo_full_name, sha)
+                except GitHubQuotaExhausted as e:
+                    exhausted.append(e)
+                except Exception as e:
+                    # One unreadable blob is skipped; the rest of the batch goes on
+                    logger.warning(
+                        "Failed to fetch blob %s from %s: %s", sha, repo_full_name, e, exc_info=True
+                    )
+
+        await asyncio.gather(*(fetch(sha) for sha in missing))
+        if exhausted:
+            raise exhausted[0]
+        return contents
+
+    def _record_quota(self) -> None:
+        try:
+            rate_limit = self.service._rate_limit()
+            if rate_limit is not None:
+                github_quota.record(self.service.token_id, *rate_limit)
+        except Exception:
+            logger.debug("Could not read GitHub rate-limit headers", exc_info=True)  # never fail the call
+
+    def close(self) -> None:
+        """Close the client, or hand it back to ``github_clients`` if it is pooled."""
+        if self._release is not None:
+            self._release()
+        else:
+            self.service.close()
+
+
+class GitHubClientPool:
+    """Token-keyed pool of GitHub clients reused across requests.
+
+    Entries are keyed by the stored (Fernet-encrypted) token, so decryption
+    runs once per user login rather than per request, and each client keeps
+    its keep-alive HTTPS connections between requests. Clients idle for
+    longer than ``idle_seconds`` are closed; past ``max_size`` the least
+    recently used idle client is closed.
+    """
+
+    def __init__(self, max_size: int = 100, idle_seconds: int = 300, http_pool_size: int | None = None):
+        self._clients: OrderedDict[str, _PooledClient] = OrderedDict()
+        self._max_size = max_size
+        self._idle_seconds = idle_seconds
+        self._http_pool_size = http_pool_size
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(
+        self, encrypted_token: str, priority: str = INTERACTIVE, max_wait: float | None = None
+    ) -> AsyncGitHubService:
+        """Borrow the client for a stored token; ``close()`` on the facade returns it.
+
+        ``priority=BACKGROUND`` marks bulk work that yields to interactive
+        calls; ``max_wait`` bounds how long its calls wait for quota.
+        """
+        self._maybe_evict_idle()
+        with self._lock:
+            entry = self._clients.get(encrypted_token)
+            if entry is not None:
+                self._clients.move_to_end(encrypted_token)
+                self.hits += 1
+        if entry is None:
+            # Decrypt and build outside the lock; a racing miss just builds a spare
+            service = GitHubService(decrypt(encrypted_token), pool_size=self._http_pool_size)
+            with self._lock:
+                entry = self._clients.get(encrypted_token)
+                if entry is None:
+                    entry = self._clients[encrypted_token] = _PooledClient(service)
+                    self.misses += 1
+                    service = None
+                self._evict_over_capacity()
+            if service is not None:
+                service.close()
+        with self._lock:
+            entry.in_use += 1
+        return AsyncGitHubService(
+            entry.service, release=functools.partial(self._release, entry), priority=priority, max_wait=max_wait
+        )
+
+    def evict_idle(self) -> int:
+        """Close clients idle for longer than ``idle_seconds``. Returns count closed."""
+        cutoff = time.monotonic() - self._idle_seconds
+        with self._lock:
+            stale = [k for k, e in self._clients.items() if e.in_use == 0 and e.last_used < cutoff]
+            closed = [self._clients.pop(k) for k in stale]
+            self.evicted += len(closed)
+        for entry in closed:
+            entry.service.close()
+        return len(closed)
+
+    def clear(self) -> None:
+        with self._lock:
+            closed = list(self._clients.values())
+            self._clients.clear()
+            self.hits = self.misses = self.evicted = 0
+        for entry in closed:
+            entry.service.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "in_use": sum(1 for e in self._clients.values() if e.in_use),
+                "max_size": self._max_size,
+                "idle_seconds": self._idle_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+            }
+
+    def _release(self, entry: _PooledClient) -> None:
+        with self._lock:
+            entry.in_use = max(0, entry.in_use - 1)
+            entry.last_used = time.monotonic()
+
+    def _maybe_evict_idle(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep >= min(60, self._idle_seconds):
+            self._last_sweep = now
+            self.evict_idle()
+
+    def _evict_over_capacity(self) -> None:
+        # Caller holds the lock; clients in use are never closed
+        for key in list(self._clients):
+            if len(self._clients) <= self._max_size:
+                break
+            if self._clients[key].in_use == 0:
+                self._clients.pop(key).service.close()
+                self.evicted += 1
+
+
+class _PooledClient:
+    __slots__ = ("in_use", "last_used", "service")
+
+    def __init__(self, service: GitHubService):
+        self.service = service
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+# Global client pool
+github_clients = GitHubClientPool(
+    max_size=settings.github_client_pool_max_size,
+    idle_seconds=settings.github_client_idle_seconds,
+    http_pool_size=settings.github_max_threads,
+)
@@ -10,7 +10,8 @@ import aiosqlite
 
 from server.db.queries import prompts as prompt_queries
 from server.db.queries import applications as app_queries
-from server.services.github_service import GitHubService
+from server.services.github_service import AsyncGitHubService
+from server.services.render_service import template_cache
 from server.services.sync_service import sync_single_file
 from server.utils.front_matter import (
     parse_prompt_file,
@@ -23,7 +24,7 @@ logger = logging.getLogger(__name__)
 
 
 async def get_prompt_with_content(
-    db: aiosqlite.Connection, prompt_id: str, github: GitHubService
+    db: aiosqlite.Connection, prompt_id: str, github: AsyncGitHubService
 ) -> dict | None:
     """Get full prompt data including body content from GitHub."""
     prompt = await prompt_queries.get_prompt(db, prompt_id)
@@ -35,7 +36,7 @@ async def get_prompt_with_content(
         return None
 
     try:
-        content, _ = github.get_file_content(
+        content, _ = await github.get_file_content(
             app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main")
         )
         fm, body = parse_prompt_file(content)
@@ -53,7 +54,7 @@ async def get_prompt_by_name_with_content(
     org: str,
     app_name: str,
     name: str,
-    github: GitHubService,
+    github: AsyncGitHubService,
     environment: str | None = None,
 ) -> dict | None:
     """Look up a prompt by org/app/name and return full content."""
@@ -66,7 +67,7 @@ async def get_prompt_by_name_with_content(
         return None
 
     try:
-        content, _ = github.get_file_content(
+        content, _ = await github.get_file_content(
             app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main")
         )
         fm, body = parse_prompt_file(content)
@@ -79,7 +80,7 @@ async def get_prompt_by_name_with_content(
 
 
 async def create_prompt(
-    db: aiosqlite.Connection, data: dict, github: GitHubService, user: dict
+    db: aiosqlite.Connection, data: dict, github: AsyncGitHubService, user: dict
 ) -> dict:
     """Create a new prompt: write .md file to GitHub, index in SQLite."""
     app = await app_queries.get_app(db, data["app_id"])
@@ -127,7 +128,7 @@ async def create_prompt(
         file_path = f"{subdir}/{data['name']}.md".lstrip("/")
 
     # Commit to GitHub
-    github.create_file(
+    await github.create_file(
         app["github_repo"],
         file_path,
         file_content,
@@ -145,7 +146,7 @@ async def create_prompt(
 
 
 async def update_prompt(
-    db: aiosqlite.Connection, prompt_id: str, data: dict, github: GitHubService, user: dict
+    db: aiosqlite.Connection, prompt_id: str, data: dict, github: AsyncGitHubService, user: dict
 ) -> dict:
     """Update a prompt: update .md file in GitHub, re-index in SQLite."""
     prompt = await prompt_queries.get_prompt(db, prompt_id)
@@ -157,7 +158,7 @@ async def update_prompt(
         raise ValueError("Application not found")
 
     # Get current file from GitHub
-    current_content, current_sha = github.get_file_content(
+    current_content, current_sha = await github.get_file_content(
         app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main")
     )
     current_fm, current_body = parse_prompt_file(current_content)
@@ -178,7 +179,7 @@ async def update_prompt(
 
     # Serialize and commit
     file_content = serialize_prompt_file(current_fm, new_body)
-    github.update_file(
+    await github.update_file(
         app["github_repo"],
         prompt["file_path"],
         file_content,
@@ -196,7 +197,7 @@ async def update_prompt(
 
 
 async def delete_prompt_file(
-    db: aiosqlite.Connection, prompt_id: str, github: GitHubService, commit_message: str
+    db: aiosqlite.Connection, prompt_id: str, github: AsyncGitHubService, commit_message: str
 ) -> None:
     """Delete a prompt file from GitHub and remove from SQLite."""
     prompt = await prompt_queries.get_prompt(db, prompt_id)
@@ -207,11 +208,11 @@ async def delete_prompt_file(
     if not app:
         raise ValueError("Application not found")
 
-    _, current_sha = github.get_file_content(
+    _, current_sha = await github.get_file_content(
         app["github_repo"], prompt["file_path"], branch=app.get("default_branch", "main")
     )
 
-    github.delete_file(
+    await github.delete_file(
         app["github_repo"],
         prompt["file_path"],
         commit_message,
@@ -220,6 +221,7 @@ async def delete_prompt_file(
     )
 
     await prompt_queries.delete_prompt(db, prompt_id)
+    template_cache.invalidate(prompt["app_id"], prompt_id, prompt["name"])
 
 
 def _build_prompt_response(prompt: dict, fm: dict, body: str) -> dict:
@@ -0,0 +1,368 @@
+"""Rate-limit state — in-process (one worker), SQLite (workers on one host) or DynamoDB (Lambda)."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Protocol, runtime_checkable
+
+from server.config import settings
+
+logger = logging.getLogger(__name__)
+
+# A limit is a number of requests per window
+WINDOW_SECONDS = 60.0
+
+
+class RateLimitResult:
+    __slots__ = ("allowed", "limit", "remaining", "reset_at", "retry_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after: float, reset_at: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after  # seconds until the request would be allowed
+        self.reset_at = reset_at  # epoch seconds when the full limit is available again
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_at)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+@runtime_checkable
+class RateLimitStore(Protocol):
+    """Interface for rate-limit state."""
+
+    async def hit(self, key: str, limit: int, cost: int = 1) -> RateLimitResult: ...
+
+    def clear(self) -> None: ...
+
+    def stats(self) -> dict: ...
+
+    async def close(self) -> None: ...
+
+
+class MemoryRateLimitStore:
+    """Single worker — per-key token buckets: O(1) per check, bounded memory.
+
+    Each key holds ``limit`` tokens that refill continuously at ``limit`` per
+    minute, so a client may burst up to its limit and then sustain it. Keys
+    are kept in least-recently-used order: buckets untouched for a whole
+    window are full (the same as absent) and are dropped as later requests
+    arrive, and past ``max_keys`` the least recently used key is dropped.
+    Runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self._buckets: OrderedDict[str, _Bucket] = OrderedDict()
+        self._max_keys = max_keys
+        self.evicted = 0
+
+    async def hit(self, key: str, limit: int, cost: int = 1) -> RateLimitResult:
+        """Take ``cost`` tokens from ``key``'s bucket if it has them."""
+        now = time.monotonic()
+        self._evict_idle(now)
+        rate = limit / WINDOW_SECONDS  # tokens per second
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(float(limit), now)
+            if len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            bucket.tokens = min(float(limit), bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+
+        allowed = bucket.tokens >= cost
+        if allowed:
+            bucket.tokens -= cost
+        retry_after = 0.0 if allowed else (cost - bucket.tokens) / rate
+        reset_at = time.time() + (limit - bucket.tokens) / rate
+        return RateLimitResult(allowed, limit, int(bucket.tokens), retry_after, reset_at)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self.evicted = 0
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets), "max_keys": self._max_keys, "evicted": self.evicted}
+
+    async def close(self) -> None:
+        pass
+
+    def _evict_idle(self, now: float) -> None:
+        # Oldest first, so this stops at the first recently used key (amortized O(1))
+        cutoff = now - WINDOW_SECONDS
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket.updated >= cutoff:
+                break
+            del self._buckets[key]
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class _LeasedWindowStore(ABC):
+    """Sliding-window counter over a shared store, spent from local leases.
+
+    Each key has one counter per fixed window in the shared store. A request
+    is allowed while ``previous * (1 - elapsed) + current`` stays within the
+    limit (the two-bucket sliding-window estimate). Rather than incrementing
+    the shared counter on every request, a process atomically reserves a
+    lease of ``lease_fraction * limit`` requests at a time and spends it
+    locally, so enforcement is global at one round trip per lease. Leased
+    but unspent requests count against the limit, so the fraction trades
+    round trips for precision.
+
+    Subclasses implement ``_reserve`` (atomic, capped increment) and
+    ``_count``.
+    """
+
+    backend = ""
+
+    def __init__(self, lease_fraction: float = 0.05):
+        self._lease_fraction = lease_fraction
+        self._leases: dict[str, _Lease] = {}
+        self._window = 0
+        self.reservations = 0
+
+    async def hit(self, key: str, limit: int, cost: int = 1) -> RateLimitResult:
+        now = time.time()
+        window = int(now // WINDOW_SECONDS)
+        elapsed = now / WINDOW_SECONDS - window
+        if window != self._window:
+            self._window = window
+            # Leases from before the previous window can't matter any more
+            self._leases = {k: v for k, v in self._leases.items() if v.window >= window - 1}
+
+        lease = self._leases.get(key)
+        if lease is None or lease.window != window:
+            previous = await self._count(key, window - 1)
+            # Unspent requests were counted when leased, so they carry over
+            lease = self._leases[key] = _Lease(window, previous, lease.tokens if lease else 0)
+
+        # A denied key is not re-checked until its retry time, so floods cost no round trips
+        if lease.tokens < cost and now >= lease.blocked_until:
+            ceiling = math.floor(limit - lease.previous * (1 - elapsed))
+            want = max(cost - lease.tokens, math.ceil(limit * self._lease_fraction))
+            granted, lease.count = await self._reserve(key, window, want, ceiling)
+            lease.tokens += granted
+            self.reservations += 1
+
+        ceiling = limit - lease.previous * (1 - elapsed)
+        remaining = lease.tokens + max(0, math.floor(ceiling) - lease.count)
+        reset_at = (window + 2) * WINDOW_SECONDS  # both counted windows have slid past
+        if lease.tokens >= cost:
+            lease.tokens -= cost
+            return RateLimitResult(True, limit, max(0, remaining - cost), 0.0, reset_at)
+        retry_after = self._retry_after(lease, limit, cost, elapsed)
+        lease.blocked_until = now + retry_after
+        return RateLimitResult(False, limit, 0, retry_after, reset_at)
+
+    def clear(self) -> None:
+        self._leases.clear()
+        self.reservations = 0
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "keys": len(self._leases),
+            "lease_fraction": self._lease_fraction,
+            "reservations": self.reservations,
+        }
+
+    async def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _retry_after(lease: _Lease, limit: int, cost: int, elapsed: float) -> float:
+        # Seconds until the previous window's weight has decayed enough, at most to the next window
+        to_next_window = (1 - elapsed) * WINDOW_SECONDS
+        if lease.previous <= 0:
+            return to_next_window
+        needed = (lease.count + cost - lease.tokens) - limit + lease.previous
+        at = needed / lease.previous  # fraction of the window at which it fits
+        return min(to_next_window, max(0.0, (at - elapsed) * WINDOW_SECONDS))
+
+    @abstractmethod
+    async def _reserve(self, key: str, window: int, want: int, ceiling: int) -> tuple[int, int]:
+        """Atomically add up to ``want`` to the counter without passing ``ceiling``.
+
+        Returns (granted, counter after the increment).
+        """
+
+    @abstractmethod
+    async def _count(self, key: str, window: int) -> int:
+        """Shared counter of ``key`` in ``window`` (0 if absent)."""
+
+
+class _Lease:
+    __slots__ = ("blocked_until", "count", "previous", "tokens", "window")
+
+    def __init__(self, window: int, previous: int, tokens: int):
+        self.window = window
+        self.previous = previous  # shared count of the previous window
+        self.tokens = tokens  # reserved, not yet spent
+        self.count = 0  # shared count of this window as of the last reservation
+        self.blocked_until = 0.0
+
+
+class SQLiteRateLimitStore(_LeasedWindowStore):
+    """Several workers on one host — counters in a SQLite file shared by all of them.
+
+    Reservations run in ``BEGIN IMMEDIATE`` transactions, which SQLite
+    serializes across processes.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, lease_fraction: float = 0.05):
+        super().__init__(lease_fraction)
+        self._path = path
+        self._conn = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        if self._conn is None:
+            import aiosqlite
+
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+            conn = await aiosqlite.connect(self._path, isolation_level=None)
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA busy_timeout=5000")
+            await conn.execute(
+                """CREATE TABLE IF NOT EXISTS rate_limit_counters (
+                       key TEXT NOT NULL,
+                       window INTEGER NOT NULL,
+                       count INTEGER NOT NULL,
+                       PRIMARY KEY (key, window)
+                   ) WITHOUT ROWID"""
+            )
+            self._conn = conn
+        return self._conn
+
+    async def _reserve(self, key: str, window: int, want: int, ceiling: int) -> tuple[int, int]:
+        async with self._lock:
+            conn = await self._connect()
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                async with conn.execute(
+                    "SELECT count FROM rate_limit_counters WHERE key = ? AND window = ?", (key, window)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                count = row[0] if row else 0
+                granted = max(0, min(want, ceiling - count))
+                if granted:
+                    await conn.execute(
+                        """INSERT INTO rate_limit_counters (key, window, count) VALUES (?, ?, ?)
+                           ON CONFLICT (key, window) DO UPDATE SET count = count + excluded.count""",
+                        (key, window, granted),
+                    )
+                if row is None:
+                    # First counter of a new window for this key: drop its stale ones
+                    await conn.execute(
+                        "DELETE FROM rate_limit_counters WHERE key = ? AND window < ?", (key, window - 1)
+                    )
+                await conn.execute("COMMIT")
+            except Exception:
+                await conn.execute("ROLLBACK")
+                raise
+        return granted, count + granted
+
+    async def _count(self, key: str, window: int) -> int:
+        async with self._lock:
+            conn = await self._connect()
+            async with conn.execute(
+                "SELECT count FROM rate_limit_counters WHERE key = ? AND window = ?", (key, window)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+class DynamoDBRateLimitStore(_LeasedWindowStore):
+    """Lambda deployment — counters in DynamoDB, reserved with conditional ADD updates.
+
+    Items expire through the table's TTL attribute two windows after use.
+    boto3 is synchronous, so each call runs in a worker thread.
+    """
+
+    backend = "dynamodb"
+
+    def __init__(self, table_name: str, region: str = "us-west-2", lease_fraction: float = 0.05) -> None:
+        import boto3
+
+        super().__init__(lease_fraction)
+        self._table = boto3.resource("dynamodb", region_name=region).Table(table_name)
+
+    async def _reserve(self, key: str, window: int, want: int, ceiling: int) -> tuple[int, int]:
+        count = 0  # until the table says otherwise
+        want = min(want, ceiling)
+        for _ in range(2):
+            if want <= 0:
+                return 0, count
+            try:
+                resp = await asyncio.to_thread(
+                    self._table.update_item,
+                    Key={"pk": f"{key}#{window}"},
+                    UpdateExpression="ADD #count :n SET #ttl = :ttl",
+                    ConditionExpression="attribute_not_exists(#count) OR #count <= :max",
+                    ExpressionAttributeNames={"#count": "count", "#ttl": "ttl"},
+                    ExpressionAttributeValues={
+                        ":n": want,
+                        ":max": ceiling - want,
+                        ":ttl": int((window + 3) * WINDOW_SECONDS),
+                    },
+                    ReturnValues="UPDATED_NEW",
+                )
+                return want, int(resp["Attributes"]["count"])
+            except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Other instances took part of the window: take what is left
+                count = await self._count(key, window)
+                want = min(want, ceiling - count)
+        return 0, count
+
+    async def _count(self, key: str, window: int) -> int:
+        resp = await asyncio.to_thread(self._table.get_item, Key={"pk": f"{key}#{window}"})
+        return int(resp.get("Item", {}).get("count", 0))
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    """Factory: returns the RateLimitStore for ``RATE_LIMIT_BACKEND`` (default: by deployment mode)."""
+    backend = settings.rate_limit_backend or ("dynamodb" if settings.deployment_mode == "lambda" else "memory")
+    if backend == "dynamodb":
+        return DynamoDBRateLimitStore(
+            settings.dynamodb_rate_limit_table, settings.aws_region, settings.rate_limit_lease_fraction
+        )
+    if backend == "sqlite":
+        return SQLiteRateLimitStore(settings.rate_limit_db_path, settings.rate_limit_lease_fraction)
+    if backend != "memory":
+        logger.warning("Unknown RATE_LIMIT_BACKEND %r; using in-process limits", backend)
+    return MemoryRateLimitStore(max_keys=settings.rate_limit_max_keys)
+
+
+# Global store shared by the middleware and closed on shutdown
+rate_limit_store = get_rate_limit_store()
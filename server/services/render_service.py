@@ -4,11 +4,18 @@ from __future__ import annotations
 
 import logging
 import re
+import threading
+import time
+from collections import OrderedDict
 
-from jinja2 import BaseLoader
+from jinja2 import BaseLoader, Template
 from jinja2.loaders import DictLoader
 from jinja2.sandbox import SandboxedEnvironment
 
+from server.config import settings
+from server.db.queries import prompts as prompt_queries
+from server.utils.front_matter import body_hash
+
 logger = logging.getLogger(__name__)
 
 # Sandboxed environment prevents template injection attacks
@@ -18,15 +25,138 @@ _env = SandboxedEnvironment(
     keep_trailing_newline=True,
 )
 
+# (app_id, prompt_id, body_hash) — identifies one version of a prompt body
+TemplateKey = tuple[str, str, str]
+
+
+class TemplateCache:
+    """Thread-safe LRU of compiled Jinja2 templates.
+
+    Each entry remembers the names of every prompt it (transitively) includes,
+    so changing an included prompt evicts the templates that embed it. The TTL
+    bounds staleness for changes made by other worker processes.
+    """
+
+    def __init__(self, max_size: int = 500, ttl: int = 300):
+        self._cache: OrderedDict[TemplateKey, _TemplateEntry] = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: TemplateKey) -> Template | None:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or (time.time() - entry.cached_at) >= self._ttl:
+                if entry is not None:
+                    del self._cache[key]
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return entry.template
+
+    def put(self, key: TemplateKey, template: Template, includes: frozenset[str] = frozenset()) -> None:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            self._cache[key] = _TemplateEntry(template, includes, time.time())
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, app_id: str, prompt_id: str | None = None, name: str | None = None) -> int:
+        """Evict an app's templates for ``prompt_id`` and any template including ``name``.
+
+        Returns count removed.
+        """
+        with self._lock:
+            to_remove = [
+                k for k, e in self._cache.items()
+                if k[0] == app_id and (k[1] == prompt_id or (name is not None and name in e.includes))
+            ]
+            for k in to_remove:
+                del self._cache[k]
+            return len(to_remove)
+
+    def invalidate_app(self, app_id: str) -> int:
+        """Evict every template of an application. Returns count removed."""
+        with self._lock:
+            to_remove = [k for k in self._cache if k[0] == app_id]
+            for k in to_remove:
+                del self._cache[k]
+            return len(to_remove)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "ttl_seconds": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class _TemplateEntry:
+    __slots__ = ("cached_at", "includes", "template")
+
+    def __init__(self, template: Template, includes: frozenset[str], cached_at: float):
+        self.template = template
+        self.includes = includes
+        self.cached_at = cached_at
+
+
+# Global cache instance
+template_cache = TemplateCache(
+    max_size=settings.template_cache_max_size,
+    ttl=settings.template_cache_ttl_seconds,
+)
+
+
+def _template_key(cache_for: tuple[str, str] | None, template_body: str) -> TemplateKey | None:
+    if cache_for is None:
+        return None
+    app_id, prompt_id = cache_for
+    return (app_id, prompt_id, body_hash(template_body))
 
-def render_prompt(template_body: str, variables: dict) -> str:
+
+def render_prompt(
+    template_body: str, variables: dict, cache_for: tuple[str, str] | None = None
+) -> str:
     """Render a Jinja2 template with the given variables.
 
     Uses a sandboxed environment to prevent template injection.
     Only variable substitution and safe filters are allowed.
+    ``cache_for=(app_id, prompt_id)`` reuses the compiled template across calls.
     """
+    return render_template(compile_template(template_body, cache_for), variables)
+
+
+def compile_template(template_body: str, cache_for: tuple[str, str] | None = None) -> Template:
+    """Compile (or fetch from ``template_cache``) a template without includes."""
+    cache_key = _template_key(cache_for, template_body)
+    template = template_cache.get(cache_key) if cache_key else None
+    if template is None:
+        try:
+            template = _env.from_string(template_body)
+        except Exception as e:
+            logger.error("Template rendering failed: %s", e)
+            raise ValueError(f"Template rendering failed: {e}") from e
+        if cache_key:
+            template_cache.put(cache_key, template)
+    return template
+
+
+def render_template(template: Template, variables: dict) -> str:
+    """Render a compiled template. Safe to call from worker threads."""
     try:
-        template = _env.from_string(template_body)
         return template.render(**variables)
     except Exception as e:
         logger.error("Template rendering failed: %s", e)
@@ -42,17 +172,73 @@ _MAX_INCLUDE_DEPTH = 5
 _INCLUDE_RE = re.compile(r'\{%[-\s]*include\s+["\']([^"\']+)["\']')
 
 
-async def _resolve_includes(
+def extract_includes(template_body: str) -> list[str]:
+    """Names referenced by {% include "name" %} directives, in order, without duplicates."""
+    return list(dict.fromkeys(_INCLUDE_RE.findall(template_body)))
+
+
+async def _resolve_includes(template_body: str, db, app_id: str) -> dict[str, str]:
+    """Fetch every (transitively) included prompt body from the DB.
+
+    The include graph materialized at sync time lets one recursive query fetch
+    the whole closure. Names it could not reach (prompts indexed before the
+    graph existed) are fetched in follow-up rounds, then the graph is checked
+    in memory.
+    """
+    resolved: dict[str, str] = {}
+    queried: set[str] = set()
+    pending = extract_includes(template_body)
+    # Each round reaches at least one level deeper; deeper than the limit fails anyway
+    for _ in range(_MAX_INCLUDE_DEPTH + 1):
+        if not pending:
+            break
+        queried.update(pending)
+        resolved.update(
+            await prompt_queries.get_include_closure(db, app_id, pending, _MAX_INCLUDE_DEPTH)
+        )
+        pending = [
+            name
+            for body in resolved.values()
+            for name in extract_includes(body)
+            if name not in resolved and name not in queried
+        ]
+
+    _check_includes(template_body, resolved, set(), set(), 0)
+    return resolved
+
+
+async def find_include_cycles(db, app_id: str, names: list[str]) -> list[str]:
+    """Names among ``names`` that include themselves, directly or transitively (sync-time check).
+
+    Loads the app's include graph with one query and walks it in memory, so a
+    whole sync is checked at once however many prompts it wrote.
+    """
+    if not names:
+        return []
+    edges = await prompt_queries.get_include_edges(db, app_id)
+    cycles = []
+    for name in dict.fromkeys(names):
+        seen: set[str] = set()
+        stack = list(edges.get(name, ()))
+        while stack:
+            current = stack.pop()
+            if current == name:
+                cycles.append(name)
+                break
+            if current not in seen:
+                seen.add(current)
+                stack.extend(edges.get(current, ()))
+    return sorted(cycles)
+
+
+def _check_includes(
     template_body: str,
-    db,
-    app_id: str,
     resolved: dict[str, str],
+    visited: set[str],
     seen: set[str],
     depth: int,
 ) -> None:
-    """Recursively resolve all {% include "name" %} references from the DB."""
-    import json
-
+    """Validate the include tree: every include exists, no cycles, bounded depth."""
     for name in _INCLUDE_RE.findall(template_body):
         if depth >= _MAX_INCLUDE_DEPTH:
             raise ValueError(
@@ -64,23 +250,14 @@ async def _resolve_includes(
                 f"Circular include detected: '{name}' already included"
             )
 
-        if name in resolved:
+        if name in visited:
             continue
 
-        async with db.execute(
-            "SELECT front_matter FROM prompts WHERE app_id = ? AND name = ? AND active = 1 LIMIT 1",
-            (app_id, name),
-        ) as cursor:
-            row = await cursor.fetchone()
-
-        if not row:
+        if name not in resolved:
             raise ValueError(f"Include not found: '{name}'")
 
-        fm = json.loads(row["front_matter"] or "{}")
-        body = fm.get("_body", "")
-        resolved[name] = body
-
-        await _resolve_includes(body, db, app_id, resolved, seen | {name}, depth + 1)
+        visited.add(name)
+        _check_includes(resolved[name], resolved, visited, seen | {name}, depth + 1)
 
 
 async def render_prompt_with_includes(
@@ -88,25 +265,40 @@ async def render_prompt_with_includes(
     variables: dict,
     db,
     app_id: str,
+    cache_for: tuple[str, str] | None = None,
 ) -> str:
     """Render a template that may contain {% include "prompt_name" %} directives.
 
     Includes are resolved from the prompts table within the same application.
+    With ``cache_for=(app_id, prompt_id)`` the compiled template (bound to its
+    resolved includes) is reused, skipping include resolution on a hit.
     """
-    resolved: dict[str, str] = {}
-    await _resolve_includes(template_body, db, app_id, resolved, set(), 0)
-
-    loader = DictLoader(resolved)
-    env = SandboxedEnvironment(
-        loader=loader,
-        autoescape=False,
-        keep_trailing_newline=True,
-    )
-    try:
-        template = env.from_string(template_body)
-        return template.render(**variables)
-    except ValueError:
-        raise
-    except Exception as e:
-        logger.error("Template rendering with includes failed: %s", e)
-        raise ValueError(f"Template rendering failed: {e}")
+    template = await compile_template_with_includes(template_body, db, app_id, cache_for)
+    return render_template(template, variables)
+
+
+async def compile_template_with_includes(
+    template_body: str,
+    db,
+    app_id: str,
+    cache_for: tuple[str, str] | None = None,
+) -> Template:
+    """Compile (or fetch from ``template_cache``) a template with its includes resolved."""
+    cache_key = _template_key(cache_for, template_body)
+    template = template_cache.get(cache_key) if cache_key else None
+    if template is None:
+        resolved = await _resolve_includes(template_body, db, app_id)
+
+        env = SandboxedEnvironment(
+            loader=DictLoader(resolved),
+            autoescape=False,
+            keep_trailing_newline=True,
+        )
+        try:
+            template = env.from_string(template_body)
+        except Exception as e:
+            logger.error("Template rendering with includes failed: %s", e)
+            raise ValueError(f"Template rendering failed: {e}") from e
+        if cache_key:
+            template_cache.put(cache_key, template, frozenset(resolved))
+    return template
@@ -6,50 +6,220 @@ import logging
 
 import aiosqlite
 
+from server.config import settings
+from server.db.database import write_transaction
 from server.db.queries import prompts as prompt_queries
 from server.db.queries import applications as app_queries
-from server.services.github_service import GitHubService
+from server.services.github_service import AsyncGitHubService, GitHubQuotaExhausted
+from server.services.cache_service import prompt_cache
+from server.services.render_service import extract_includes, find_include_cycles, template_cache
 from server.utils.front_matter import parse_prompt_file, body_hash, ensure_id, front_matter_to_json, extract_tags
 
 logger = logging.getLogger(__name__)
 
 
-async def sync_app(db: aiosqlite.Connection, app: dict, github: GitHubService) -> int:
-    """Full sync: index all .md files in a GitHub repo/subdirectory into SQLite.
+async def sync_app(
+    db: aiosqlite.Connection, app: dict, github: AsyncGitHubService, full: bool = False
+) -> dict:
+    """Reconcile an app's prompts with its GitHub repo/subdirectory.
 
-    Returns count of prompts synced.
+    The repo is listed with one recursive Git tree call and diffed against the
+    indexed (file_path, git_sha) pairs; only the difference is written, in one
+    transaction. Unchanged files are not fetched or touched, moved files (same
+    blob at a new path) only get their path updated, and prompts whose files
+    are gone are removed. ``full=True`` re-fetches and re-indexes every file.
+
+    Returns counts: ``updated``, ``moved``, ``unchanged``, ``removed``,
+    ``failed``, ``synced`` (updated + moved + unchanged) and
+    ``include_cycles`` (names of written prompts that include themselves).
     """
     repo = app["github_repo"]
     subdir = app.get("subdirectory", "")
     branch = app.get("default_branch", "main")
+    counts = {
+        "synced": 0, "updated": 0, "moved": 0, "unchanged": 0, "removed": 0, "failed": 0, "include_cycles": [],
+    }
 
     logger.info("Syncing app %s from %s (branch: %s, subdir: %s)", app["id"], repo, branch, subdir)
 
-    md_files = github.list_md_files(repo, subdirectory=subdir, branch=branch)
-    synced = 0
+    try:
+        md_files, complete = await github.list_md_tree(repo, subdirectory=subdir, branch=branch)
+    except GitHubQuotaExhausted:
+        raise
+    except Exception as e:
+        logger.error("Failed to list files for app %s: %s", app["id"], e)
+        return counts
+
+    indexed = await prompt_queries.get_file_shas(db, app["id"])
+    plan = diff_tree(indexed, md_files, complete, full=full)
+    counts["unchanged"] = len(plan["unchanged"])
 
-    for md_file in md_files:
-        try:
-            content, file_sha = github.get_file_content(repo, md_file["path"], branch=branch)
-            await _index_prompt_file(db, app["id"], md_file["path"], content, file_sha)
-            synced += 1
-        except Exception as e:
-            logger.error("Failed to sync file %s: %s", md_file["path"], e)
+    contents = await github.get_blob_contents(
+        repo, [f["sha"] for f in plan["changed"]], settings.github_sync_concurrency
+    )
+
+    files = [
+        {"path": f["path"], "content": contents.get(f["sha"]), "sha": f["sha"]}
+        for f in plan["changed"]
+    ]
+    result = await index_files(db, app["id"], files, moves=plan["moved"], removed_paths=plan["removed"])
+    for key in ("updated", "moved", "removed", "failed", "include_cycles"):
+        counts[key] = result[key]
+    counts["synced"] = counts["updated"] + counts["moved"] + counts["unchanged"]
 
     await app_queries.update_sync_time(db, app["id"])
-    logger.info("Synced %d prompts for app %s", synced, app["id"])
-    return synced
+    logger.info(
+        "Synced app %s: %d updated, %d moved, %d unchanged, %d removed, %d failed",
+        app["id"], counts["updated"], counts["moved"], counts["unchanged"], counts["removed"], counts["failed"],
+    )
+    return counts
+
+
+async def index_files(
+    db: aiosqlite.Connection,
+    app_id: str,
+    files: list[dict],
+    moves: list[tuple[str, str]] = (),
+    removed_paths: list[str] = (),
+) -> dict:
+    """Write an app's changed .md files, moves and removals in one transaction.
+
+    ``files`` holds {"path", "content", "sha"} dicts (``content`` None when it
+    could not be fetched). Files are upserted in bulk, each inside its own
+    savepoint so one bad file is skipped without rolling back the rest. Cache
+    entries are then evicted for exactly the prompts written, moved or removed.
+
+    Include cycles are then checked once over every prompt written.
+
+    Returns counts ``updated``, ``moved``, ``removed``, ``failed``,
+    ``evicted`` (prompt cache entries dropped) and ``include_cycles`` (names
+    of written prompts that include themselves; rendering them fails).
+    """
+    counts = {"updated": 0, "moved": len(moves), "removed": 0, "failed": 0, "evicted": 0, "include_cycles": []}
+
+    rows = []
+    for f in files:
+        data = _parse_prompt_data(app_id, f["path"], f["content"], f["sha"]) if f["content"] is not None else None
+        if data is None:
+            counts["failed"] += 1
+            continue
+        data["includes"] = extract_includes(data["body"])
+        rows.append(data)
+
+    # Other writers wait until the whole batch is committed (or rolled back)
+    async with write_transaction(db):
+        errors = await prompt_queries.upsert_prompts(db, rows, savepoint_per_row=True)
+        await prompt_queries.move_prompt_files(db, app_id, list(moves))
+        removed = await prompt_queries.delete_prompts_by_paths(db, app_id, list(removed_paths))
+
+    for data, e in errors:
+        logger.error("Failed to sync file %s: %s", data["file_path"], e)
+    failed_ids = {data["id"] for data, _ in errors}
+    written = [data for data in rows if data["id"] not in failed_ids]
+
+    # Invalidate only what changed
+    for data in written:
+        counts["evicted"] += prompt_cache.invalidate_prompt(data["id"])
+        counts["evicted"] += prompt_cache.invalidate_file(app_id, data["file_path"])
+        template_cache.invalidate(app_id, data["id"], data["name"])
+    for old_path, _ in moves:
+        counts["evicted"] += prompt_cache.invalidate_file(app_id, old_path)
+    for row in removed:
+        counts["evicted"] += prompt_cache.invalidate_prompt(row["id"])
+        template_cache.invalidate(app_id, row["id"], row["name"])
+
+    counts["include_cycles"] = await _check_include_cycles(
+        db, app_id, [data["name"] for data in written if data["includes"]]
+    )
+    counts["updated"] = len(written)
+    counts["removed"] = len(removed)
+    counts["failed"] += len(errors)
+    return counts
+
+
+async def sync_files(
+    db: aiosqlite.Connection,
+    app: dict,
+    changed_paths: list[str],
+    removed_paths: list[str],
+    github: AsyncGitHubService,
+    ref: str | None = None,
+) -> dict:
+    """Sync the files a push touched, as they are at commit ``ref`` (used by webhooks).
+
+    The tree at ``ref`` (the push's ``after`` SHA; default: branch tip) is
+    listed with one call and is the source of truth for every touched path:
+    paths whose blob SHA is already indexed are skipped, moves only update
+    the path, and the remaining blobs are fetched in parallel and written
+    with the removals by ``index_files``. Returns its counts plus
+    ``unchanged``. Raises if the tree cannot be listed.
+    """
+    repo = app["github_repo"]
+    ref = ref or app.get("default_branch", "main")
+
+    md_files, complete = await github.list_md_tree(repo, subdirectory=app.get("subdirectory", ""), branch=ref)
+
+    touched = set(changed_paths) | set(removed_paths)
+    indexed = {path: sha for path, sha in (await prompt_queries.get_file_shas(db, app["id"])).items() if path in touched}
+    plan = diff_tree(indexed, [f for f in md_files if f["path"] in touched], complete)
+    if not complete:
+        # Absence from a partial listing proves nothing; trust the payload
+        plan["removed"] = [path for path in removed_paths if path in indexed]
+
+    contents = await github.get_blob_contents(
+        repo, [f["sha"] for f in plan["changed"]], settings.github_sync_concurrency
+    )
+    files = [
+        {"path": f["path"], "content": contents.get(f["sha"]), "sha": f["sha"]}
+        for f in plan["changed"]
+    ]
+    result = await index_files(db, app["id"], files, moves=plan["moved"], removed_paths=plan["removed"])
+    result["unchanged"] = len(plan["unchanged"])
+    return result
+
+
+def diff_tree(
+    indexed: dict[str, str | None], files: list[dict], complete: bool = True, full: bool = False
+) -> dict:
+    """Diff a repo listing against indexed {file_path: git_sha}.
+
+    Returns ``changed`` (files to fetch and upsert), ``moved`` ((old_path,
+    new_path) pairs whose blob is unchanged), ``removed`` (paths to delete)
+    and ``unchanged`` (paths to leave alone). Removals are only derived from
+    a ``complete`` listing.
+    """
+    listed = {f["path"] for f in files}
+    removed = sorted(set(indexed) - listed) if complete else []
+
+    # A new path whose blob equals a removed path's blob is a move
+    removed_by_sha: dict[str, list[str]] = {}
+    for path in removed:
+        if indexed[path]:
+            removed_by_sha.setdefault(indexed[path], []).append(path)
+
+    changed, moved, unchanged = [], [], []
+    for f in files:
+        if not full and indexed.get(f["path"]) == f["sha"]:
+            unchanged.append(f["path"])
+        elif not full and f["path"] not in indexed and removed_by_sha.get(f["sha"]):
+            old_path = removed_by_sha[f["sha"]].pop(0)
+            removed.remove(old_path)
+            moved.append((old_path, f["path"]))
+        else:
+            changed.append(f)
+
+    return {"changed": changed, "moved": moved, "removed": removed, "unchanged": unchanged}
 
 
 async def sync_single_file(
-    db: aiosqlite.Connection, app: dict, file_path: str, github: GitHubService
+    db: aiosqlite.Connection, app: dict, file_path: str, github: AsyncGitHubService
 ) -> None:
     """Sync a single file from GitHub into SQLite (used by webhook handler)."""
     repo = app["github_repo"]
     branch = app.get("default_branch", "main")
 
     try:
-        content, file_sha = github.get_file_content(repo, file_path, branch=branch)
+        content, file_sha = await github.get_file_content(repo, file_path, branch=branch)
         await _index_prompt_file(db, app["id"], file_path, content, file_sha)
     except Exception as e:
         logger.error("Failed to sync file %s: %s", file_path, e)
@@ -59,11 +229,12 @@ async def sync_single_file(
 async def remove_file(db: aiosqlite.Connection, app_id: str, file_path: str) -> None:
     """Remove a prompt from SQLite when its file is deleted from GitHub."""
     async with db.execute(
-        "SELECT id FROM prompts WHERE app_id = ? AND file_path = ?", (app_id, file_path)
+        "SELECT id, name FROM prompts WHERE app_id = ? AND file_path = ?", (app_id, file_path)
     ) as cursor:
         row = await cursor.fetchone()
         if row:
             await prompt_queries.delete_prompt(db, row["id"])
+            template_cache.invalidate(app_id, row["id"], row["name"])
             logger.info("Removed prompt %s (file: %s)", row["id"], file_path)
 
 
@@ -71,22 +242,35 @@ async def _index_prompt_file(
     db: aiosqlite.Connection, app_id: str, file_path: str, content: str, git_sha: str
 ) -> None:
     """Parse a .md file and upsert its metadata into the prompts table."""
+    data = _parse_prompt_data(app_id, file_path, content, git_sha)
+    if data is None:
+        return
+
+    async with write_transaction(db):
+        await prompt_queries.upsert_prompt(db, data)
+        await _index_includes(db, app_id, data["id"], data["name"], data["body"])
+    # Drop compiled templates of this prompt and of any prompt including it
+    template_cache.invalidate(app_id, data["id"], data["name"])
+
+
+def _parse_prompt_data(app_id: str, file_path: str, content: str, git_sha: str) -> dict | None:
+    """Build a prompts row from a .md file. Returns None if the file is not a valid prompt."""
     try:
         fm, body = parse_prompt_file(content)
     except Exception as e:
         logger.warning("Failed to parse front-matter in %s: %s", file_path, e)
-        return
+        return None
 
     if not fm.get("name"):
         logger.warning("Skipping %s: no 'name' in front-matter", file_path)
-        return
+        return None
 
     fm = ensure_id(fm)
 
     model_config = fm.get("model", {})
     modality = fm.get("modality", {})
 
-    data = {
+    return {
         "id": fm["id"],
         "app_id": app_id,
         "name": fm["name"],
@@ -107,4 +291,20 @@ async def _index_prompt_file(
         "body": body,
     }
 
-    await prompt_queries.upsert_prompt(db, data)
+
+async def _index_includes(
+    db: aiosqlite.Connection, app_id: str, prompt_id: str, name: str, body: str
+) -> None:
+    """Persist a prompt's include edges and report include cycles it closes."""
+    includes = extract_includes(body)
+    await prompt_queries.replace_includes(db, prompt_id, app_id, includes)
+    if includes:
+        await _check_include_cycles(db, app_id, [name])
+
+
+async def _check_include_cycles(db: aiosqlite.Connection, app_id: str, names: list[str]) -> list[str]:
+    """Names among ``names`` on an include cycle, logged once per sync."""
+    cycles = await find_include_cycles(db, app_id, names)
+    if cycles:
+        logger.warning("Circular include detected in app %s: %s", app_id, ", ".join(cycles))
+    return cycles
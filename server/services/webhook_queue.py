@@ -0,0 +1,282 @@
+"""Background queue for GitHub push webhooks.
+
+The webhook handler only verifies and enqueues a push; a background worker
+applies it. Pushes for the same app that are still pending are coalesced:
+the touched paths are synced once, as they are in the tree at the newest
+push's ``after`` commit, so a burst of pushes costs one incremental sync.
+A push is only known to be newer when its ``before`` is the pinned
+``after``; pushes that don't chain (redelivered or reordered) sync the
+branch head instead, so an older commit never replaces a newer one.
+Deliveries are recorded in ``webhook_deliveries`` only after their sync
+has been applied. GitHub has already been answered 202 by then and never
+retries, so a failed sync stays queued and is retried with exponential
+backoff, up to ``WEBHOOK_MAX_ATTEMPTS`` attempts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+import aiosqlite
+
+from server.config import settings
+from server.db.database import write_transaction
+from server.db.queries import applications as app_queries
+from server.services.github_service import BACKGROUND, github_clients
+from server.services.sync_service import sync_files
+
+logger = logging.getLogger(__name__)
+
+CHANGED = "changed"
+REMOVED = "removed"
+
+
+class _PendingSync:
+    """Coalesced state of one app's queued pushes."""
+
+    __slots__ = ("after", "attempts", "before", "deliveries", "not_before", "paths")
+
+    def __init__(self):
+        self.paths: dict[str, str] = {}  # file_path -> CHANGED | REMOVED
+        self.deliveries: list[tuple[str, str]] = []  # (delivery_id, event)
+        self.before: str | None = None  # parent commit of the first push
+        self.after: str | None = None  # head commit of the newest push; None syncs the branch head
+        self.attempts = 0  # failed syncs so far
+        self.not_before = 0.0  # monotonic time of the next attempt
+
+    def advance(self, before: str | None, after: str | None) -> None:
+        """Pin ``after`` if that push continues from the pinned commit, else sync the branch head."""
+        self.after = after if self.after is not None and before == self.after else None
+
+
+class WebhookQueue:
+    """Pending pushes keyed by app, applied in order of first arrival.
+
+    A failed sync is kept pending and retried after ``retry_backoff`` seconds,
+    doubling per attempt; after ``max_attempts`` its deliveries are given up
+    (counted as failed) and the app needs a manual sync.
+    """
+
+    def __init__(self, max_pending: int = 1000, max_attempts: int = 5, retry_backoff: float = 30.0):
+        self._pending: dict[str, _PendingSync] = {}
+        self._in_flight: set[str] = set()
+        self._max_pending = max_pending
+        self._max_attempts = max_attempts
+        self._retry_backoff = retry_backoff
+        self._wakeup: asyncio.Event | None = None
+        self.enqueued = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def enqueue(
+        self,
+        app_id: str,
+        delivery_id: str,
+        event: str,
+        paths: dict[str, str],
+        after: str | None = None,
+        before: str | None = None,
+    ) -> bool:
+        """Queue a push's final path states and its ``before``/``after`` commits.
+
+        Returns False (and counts a drop) when full.
+        """
+        if self.pending_deliveries >= self._max_pending:
+            self.dropped += 1
+            return False
+        pending = self._pending.get(app_id)
+        if pending is None:
+            pending = self._pending[app_id] = _PendingSync()
+            pending.before, pending.after = before, after
+        else:
+            self.coalesced += 1
+            pending.advance(before, after)
+        # A later push overrides the state of a path from an earlier one
+        pending.paths.update(paths)
+        pending.deliveries.append((delivery_id, event))
+        self.enqueued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def has_delivery(self, delivery_id: str) -> bool:
+        """True if a delivery is queued or being processed (GitHub retried it early)."""
+        if not delivery_id:
+            return False
+        if delivery_id in self._in_flight:
+            return True
+        return any(d == delivery_id for p in self._pending.values() for d, _ in p.deliveries)
+
+    async def process(self, db: aiosqlite.Connection) -> list[dict]:
+        """Apply every pending app sync that is due. Returns one result dict per app applied."""
+        results = []
+        while (app_id := self._next_ready()) is not None:
+            pending = self._pending.pop(app_id)
+            delivery_ids = {d for d, _ in pending.deliveries if d}
+            self._in_flight |= delivery_ids
+            try:
+                result = await _apply_pending(db, app_id, pending)
+            except Exception as e:  # noqa: BLE001 - any failure is retried or reported as failed
+                self._retry_or_give_up(app_id, pending, e)
+                continue
+            finally:
+                self._in_flight -= delivery_ids
+
+            for delivery_id, event in pending.deliveries:
+                await record_delivery(db, delivery_id, app_id, event)
+            self.processed += len(pending.deliveries)
+            results.append({"app_id": app_id, "deliveries": len(pending.deliveries), **result})
+        return results
+
+    async def wait_for_work(self) -> None:
+        """Block until at least one pending push is due."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while self._next_ready() is None:
+            retry_in = min((p.not_before for p in self._pending.values()), default=None)
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), None if retry_in is None else max(0.0, retry_in - time.monotonic())
+                )
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+        self._wakeup.clear()
+
+    def is_retrying(self, app_id: str) -> bool:
+        """True if the app has a failed sync waiting to be retried."""
+        pending = self._pending.get(app_id)
+        return pending is not None and pending.attempts > 0
+
+    def discard(self, app_id: str) -> int:
+        """Drop an app's pending pushes. Returns the number of deliveries dropped."""
+        pending = self._pending.pop(app_id, None)
+        return len(pending.deliveries) if pending else 0
+
+    def clear(self) -> None:
+        """Discard pending pushes and reset counters."""
+        self._pending.clear()
+        self._in_flight.clear()
+        self.enqueued = self.coalesced = self.processed = self.retried = self.failed = self.dropped = 0
+
+    def stats(self) -> dict:
+        return {
+            "pending_apps": len(self._pending),
+            "pending_deliveries": self.pending_deliveries,
+            "retrying_apps": sum(1 for p in self._pending.values() if p.attempts),
+            "max_pending": self._max_pending,
+            "max_attempts": self._max_attempts,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    @property
+    def pending_deliveries(self) -> int:
+        return sum(len(p.deliveries) for p in self._pending.values())
+
+    def _next_ready(self) -> str | None:
+        now = time.monotonic()
+        return next((app_id for app_id, p in self._pending.items() if p.not_before <= now), None)
+
+    def _retry_or_give_up(self, app_id: str, failed: _PendingSync, error: Exception) -> None:
+        failed.attempts += 1
+        if failed.attempts >= self._max_attempts:
+            self.failed += len(failed.deliveries)
+            logger.error(
+                "Webhook sync for app %s failed %d times, giving up on %d deliveries (run a manual sync): %s",
+                app_id, failed.attempts, len(failed.deliveries), error,
+            )
+            return
+        # Low GitHub quota says when it is worth trying again
+        delay = max(self._retry_backoff * 2 ** (failed.attempts - 1), getattr(error, "retry_after", 0))
+        logger.warning(
+            "Webhook sync for app %s failed (attempt %d/%d), retrying in %.0fs: %s",
+            app_id, failed.attempts, self._max_attempts, delay, error,
+        )
+        newer = self._pending.pop(app_id, None)
+        if newer is not None:
+            # Pushes that arrived during the attempt override the failed ones' paths
+            failed.paths.update(newer.paths)
+            failed.deliveries.extend(newer.deliveries)
+            failed.advance(newer.before, newer.after)
+        failed.not_before = time.monotonic() + delay
+        self._pending[app_id] = failed
+        self.retried += 1
+
+
+async def get_sync_token(db: aiosqlite.Connection, org_id: str) -> str | None:
+    """Encrypted GitHub token of an org admin, used to fetch pushed files."""
+    async with db.execute(
+        """SELECT u.access_token_encrypted FROM users u
+           JOIN org_memberships om ON om.user_id = u.id
+           WHERE om.org_id = ? AND om.role = 'admin'
+           LIMIT 1""",
+        (org_id,),
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row["access_token_encrypted"] if row and row["access_token_encrypted"] else None
+
+
+async def record_delivery(db: aiosqlite.Connection, delivery_id: str, app_id: str, event_type: str) -> None:
+    """Record a processed webhook delivery for idempotency."""
+    if not delivery_id:
+        return
+    try:
+        async with write_transaction(db):
+            await db.execute(
+                "INSERT OR IGNORE INTO webhook_deliveries (delivery_id, app_id, event_type) VALUES (?, ?, ?)",
+                (delivery_id, app_id, event_type),
+            )
+    except Exception:
+        # The sync itself is applied; only a redelivery of it could repeat the work
+        logger.exception("Failed to record webhook delivery %s for app %s", delivery_id, app_id)
+
+
+async def _apply_pending(db: aiosqlite.Connection, app_id: str, pending: _PendingSync) -> dict:
+    empty = {
+        "updated": 0, "moved": 0, "unchanged": 0, "removed": 0, "failed": 0, "evicted": 0, "include_cycles": [],
+    }
+    app = await app_queries.get_app(db, app_id)
+    if not app:
+        logger.info("Dropping queued webhook sync for deleted app %s", app_id)
+        return empty
+
+    token = await get_sync_token(db, app["org_id"])
+    if not token:
+        logger.warning("No admin token available for org %s, skipping sync", app["org_id"])
+        return empty
+
+    changed = [path for path, state in pending.paths.items() if state == CHANGED]
+    removed = [path for path, state in pending.paths.items() if state == REMOVED]
+    gh = github_clients.get(token, priority=BACKGROUND, max_wait=settings.github_quota_max_wait_seconds)
+    try:
+        # Files are read at the newest push's commit (or the branch head),
+        # so later pushes can't leak in
+        result = await sync_files(db, app, changed, removed, gh, ref=pending.after)
+    finally:
+        gh.close()
+
+    logger.info(
+        "Webhook sync for app %s (%d deliveries): %d files synced, %d unchanged, %d removed, %d failed, "
+        "%d cache entries evicted",
+        app_id, len(pending.deliveries), result["updated"], result["unchanged"], result["removed"],
+        result["failed"], result["evicted"],
+    )
+    return result
+
+
+# Global queue instance
+webhook_queue = WebhookQueue(
+    max_pending=settings.webhook_queue_max_pending,
+    max_attempts=settings.webhook_max_attempts,
+    retry_backoff=settings.webhook_retry_backoff_seconds,
+)
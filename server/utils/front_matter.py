@@ -26,6 +26,12 @@ def body_hash(body: str) -> str:
     return hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
 
 
+def git_blob_sha(content: str) -> str:
+    """Git blob SHA-1 of a file's content, as GitHub reports it for the file."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
 def ensure_id(front_matter: dict) -> dict:
     """Ensure front-matter has an id field; generate one if missing."""
     if "id" not in front_matter or not front_matter["id"]:
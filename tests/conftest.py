@@ -134,22 +134,41 @@ async def app(db):
     for middleware in fastapi_app.user_middleware:
         if middleware.cls is RateLimitMiddleware:
             break
-    # Clear the rate limiter windows on the middleware stack
+    # Clear the rate limiter buckets on the middleware stack
     # The actual middleware instances are in the middleware_stack
     _clear_rate_limiter(fastapi_app)
 
+    # Verified-key cache is process-global; start each test cold
+    from server.auth.api_keys import last_used_buffer, verified_key_cache
+    verified_key_cache.clear()
+    await last_used_buffer.flush(db)
+    from server.auth.sessions import session_cache, session_expiry_buffer
+    session_cache.clear()
+    await session_expiry_buffer.flush(db)
+    from server.services.access_log import access_log_writer
+    access_log_writer.clear()
+    from server.services.webhook_queue import webhook_queue
+    webhook_queue.clear()
+    from server.services.github_service import blob_cache, github_clients, github_quota
+    github_clients.clear()
+    blob_cache.clear()
+    github_quota.clear()
+
+    from server.services.render_service import template_cache
+    template_cache.clear()
+
     yield fastapi_app
 
     db_module._db = original_db
 
 
 def _clear_rate_limiter(app):
-    """Walk the middleware stack and clear any RateLimitMiddleware windows."""
+    """Walk the middleware stack and clear any RateLimitMiddleware buckets."""
     from server.auth.rate_limiter import RateLimitMiddleware
     obj = app.middleware_stack
     while obj is not None:
         if isinstance(obj, RateLimitMiddleware):
-            obj._windows.clear()
+            obj.clear()
             return
         obj = getattr(obj, "app", None)
 
@@ -197,6 +197,28 @@ class TestPromptClient:
             prompt = client.get(SAMPLE_PROMPT["id"])
             assert prompt.name == "greeting"
 
+    def test_render_many(self):
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append((request.method, request.url.path, request.read()))
+            return httpx.Response(200, json={"results": [
+                {"index": 0, "id": "p1", "rendered_body": "Hi Alice"},
+                {"index": 1, "error": {"code": "PROMPT_NOT_FOUND", "message": "nope"}},
+            ]})
+
+        client = PromptClient(base_url="http://test", api_key="test-key")
+        client._http = httpx.Client(transport=httpx.MockTransport(handler), base_url="http://test/api/v1")
+
+        results = client.render_many([
+            {"prompt_id": "p1", "variables": {"name": "Alice"}},
+            {"prompt_id": "missing"},
+        ])
+        assert results[0]["rendered_body"] == "Hi Alice"
+        assert results[1]["error"]["code"] == "PROMPT_NOT_FOUND"
+        assert seen[0][:2] == ("POST", "/api/v1/prompts/render:batch")
+        client.close()
+
     def test_transport_error_no_cache_raises(self):
         """Transport error with no cached entry raises PromptdisError."""
         transport = httpx.MockTransport(
@@ -317,3 +339,81 @@ class TestAsyncPromptClient:
         assert count == 1
         assert client.cache_stats()["total_entries"] == 0
         await client.close()
+
+    @pytest.mark.asyncio
+    async def test_render_many(self):
+        transport = httpx.MockTransport(
+            lambda req: httpx.Response(200, json={"results": [{"index": 0, "rendered_body": "Hi"}]})
+        )
+        client = AsyncPromptClient(base_url="http://test", api_key="test-key")
+        client._http = httpx.AsyncClient(transport=transport, base_url="http://test/api/v1")
+
+        results = await client.render_many([{"prompt_id": "p1", "variables": {}}])
+        assert results == [{"index": 0, "rendered_body": "Hi"}]
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_render_many_401_raises_auth_error(self):
+        transport = httpx.MockTransport(lambda req: httpx.Response(401, json={"error": "unauthorized"}))
+        client = AsyncPromptClient(base_url="http://test", api_key="bad-key")
+        client._http = httpx.AsyncClient(transport=transport, base_url="http://test/api/v1")
+
+        with pytest.raises(AuthenticationError):
+            await client.render_many([{"prompt_id": "p1"}])
+        await client.close()
+
+
+class TestPrefetch:
+    def test_prefetch_populates_cache(self):
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(200, json={"prompts": [{"etag": '"v1"', "prompt": SAMPLE_PROMPT}], "errors": []})
+
+        client = PromptClient(base_url="http://test", api_key="test-key")
+        client._http = httpx.Client(transport=httpx.MockTransport(handler), base_url="http://test/api/v1")
+
+        assert client.prefetch(org="testorg", app="testapp") == 1
+        assert calls[0].url.path == "/api/v1/prompts:batch"
+
+        # Both keys are warm — no further HTTP calls
+        assert client.get(SAMPLE_PROMPT["id"]).name == "greeting"
+        assert client.get_by_name("testorg", "testapp", "greeting").name == "greeting"
+        assert len(calls) == 1
+        client.close()
+
+    def test_prefetch_sends_known_etags(self):
+        import json
+
+        bodies = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            bodies.append(json.loads(request.read()))
+            if len(bodies) == 1:
+                return httpx.Response(200, json={"prompts": [{"etag": '"v1"', "prompt": SAMPLE_PROMPT}], "errors": []})
+            item = {"id": SAMPLE_PROMPT["id"], "name": "greeting", "etag": '"v1"', "not_modified": True}
+            return httpx.Response(200, json={"prompts": [item], "errors": []})
+
+        client = PromptClient(base_url="http://test", api_key="test-key")
+        client._http = httpx.Client(transport=httpx.MockTransport(handler), base_url="http://test/api/v1")
+
+        client.prefetch([SAMPLE_PROMPT["id"]])
+        client._cache._cache[f"id:{SAMPLE_PROMPT['id']}"].fetched_at = 0
+        client.prefetch([SAMPLE_PROMPT["id"]])
+
+        assert bodies[1]["etags"] == {SAMPLE_PROMPT["id"]: '"v1"'}
+        assert client._cache.get(f"id:{SAMPLE_PROMPT['id']}")[1] is True
+        client.close()
+
+    @pytest.mark.asyncio
+    async def test_async_prefetch(self):
+        transport = httpx.MockTransport(
+            lambda req: httpx.Response(200, json={"prompts": [{"etag": '"v1"', "prompt": SAMPLE_PROMPT}], "errors": []})
+        )
+        client = AsyncPromptClient(base_url="http://test", api_key="test-key")
+        client._http = httpx.AsyncClient(transport=transport, base_url="http://test/api/v1")
+
+        assert await client.prefetch(org="testorg", app="testapp", names=["greeting"]) == 1
+        assert client.cache_stats()["total_entries"] == 2
+        await client.close()
@@ -0,0 +1,109 @@
+"""Tests for the buffered prompt_access_log writer."""
+
+from __future__ import annotations
+
+import pytest
+
+from server.services.access_log import AccessLogWriter, access_log_writer
+from tests.conftest import PROMPT_ID
+
+
+async def _count_rows(db) -> int:
+    async with db.execute("SELECT COUNT(*) FROM prompt_access_log") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_does_not_write_until_flush(db):
+    writer = AccessLogWriter(max_queue=100, batch_size=10)
+    for _ in range(3):
+        assert writer.enqueue(PROMPT_ID, "greeting", None, None, True, 1, "127.0.0.1", "ua")
+
+    assert await _count_rows(db) == 0
+    assert await writer.flush(db) == 3
+    assert await _count_rows(db) == 3
+    assert writer.stats()["written"] == 3
+    assert writer.size == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_in_batches(db):
+    writer = AccessLogWriter(max_queue=100, batch_size=4)
+    for i in range(10):
+        writer.enqueue(PROMPT_ID, "greeting", None, None, i % 2 == 0, i, None, None)
+
+    assert await writer.flush(db) == 10
+    async with db.execute("SELECT SUM(cache_hit) FROM prompt_access_log") as cursor:
+        assert (await cursor.fetchone())[0] == 5
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_rolled_back_and_retried_once(db):
+    writer = AccessLogWriter(max_queue=100, batch_size=10)
+    writer.enqueue(PROMPT_ID, "greeting", None, None, True, 1, None, None)
+    writer.enqueue(None, "ghost", None, None, True, 1, None, None)  # violates NOT NULL after row 1
+
+    assert await writer.flush(db) == 0
+    assert writer.size == 2 and writer.stats()["requeued"] == 2
+    assert not db.in_transaction
+    # An unrelated write commits nothing from the failed batch
+    await db.execute("UPDATE prompts SET name = name WHERE id = ?", (PROMPT_ID,))
+    await db.commit()
+    assert await _count_rows(db) == 0
+
+    writer.enqueue(PROMPT_ID, "greeting", None, None, True, 1, None, None)
+    assert await writer.flush(db) == 1  # the retried batch fails again and is dropped
+    assert writer.stats()["dropped"] == 2
+    assert await _count_rows(db) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_does_not_roll_back_concurrent_sync(db):
+    import asyncio
+
+    from server.services.sync_service import index_files
+    from tests.conftest import APP_ID
+
+    files = [
+        {"path": f"prompts/log_{i}.md", "content": f"---\nid: log-{i}\nname: log_{i}\n---\nBody", "sha": f"s{i}"}
+        for i in range(200)
+    ]
+    writer = AccessLogWriter(max_queue=100, batch_size=10)
+
+    async def failing_flushes():
+        for _ in range(5):
+            writer.enqueue(None, "ghost", None, None, True, 1, None, None)  # NOT NULL violation
+            await writer.flush(db)
+
+    result, _ = await asyncio.gather(index_files(db, APP_ID, files), failing_flushes())
+
+    assert result["updated"] == 200
+    async with db.execute("SELECT COUNT(*) FROM prompts WHERE id LIKE 'log-%'") as cursor:
+        assert (await cursor.fetchone())[0] == 200
+    assert await _count_rows(db) == 0
+
+
+def test_full_queue_drops_and_counts():
+    writer = AccessLogWriter(max_queue=2, batch_size=10)
+    assert writer.enqueue(PROMPT_ID, None, None, None, False, 0, None, None)
+    assert writer.enqueue(PROMPT_ID, None, None, None, False, 0, None, None)
+    assert not writer.enqueue(PROMPT_ID, None, None, None, False, 0, None, None)
+
+    stats = writer.stats()
+    assert stats["queued"] == 2
+    assert stats["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_public_fetch_queues_access_row(client, db, test_api_key):
+    resp = await client.get(
+        f"/api/v1/prompts/{PROMPT_ID}",
+        headers={"Authorization": f"Bearer {test_api_key}"},
+    )
+    assert resp.status_code == 200
+    assert access_log_writer.size == 1
+
+    await access_log_writer.flush(db)
+    async with db.execute("SELECT prompt_id, api_key_id FROM prompt_access_log") as cursor:
+        row = dict(await cursor.fetchone())
+    assert row == {"prompt_id": PROMPT_ID, "api_key_id": "key-test-001"}
@@ -13,6 +13,9 @@ import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 
+from server.services.github_service import AsyncGitHubService
+from server.utils.front_matter import git_blob_sha
+
 from tests.conftest import ORG_ID, APP_ID, PROMPT_ID, USER_ID
 
 
@@ -191,7 +194,7 @@ async def test_get_prompt_detail(admin_client):
             "front_matter": {"version": "1.0"},
         }
         with patch("server.api.admin._get_github_for_user") as mock_gh:
-            mock_gh.return_value = MagicMock()
+            mock_gh.return_value = AsyncGitHubService(MagicMock())
             resp = await admin_client.get(f"/api/v1/admin/prompts/{PROMPT_ID}")
             assert resp.status_code == 200
             data = resp.json()
@@ -204,7 +207,7 @@ async def test_get_prompt_detail_not_found(admin_client):
     with patch("server.api.admin.get_prompt_with_content", new_callable=AsyncMock) as mock_fn:
         mock_fn.return_value = None
         with patch("server.api.admin._get_github_for_user") as mock_gh:
-            mock_gh.return_value = MagicMock()
+            mock_gh.return_value = AsyncGitHubService(MagicMock())
             resp = await admin_client.get("/api/v1/admin/prompts/nonexistent-id")
             assert resp.status_code == 404
 
@@ -258,7 +261,7 @@ async def test_toggle_active_prompt_not_found(admin_client):
 @pytest.mark.asyncio
 async def test_update_prompt_conflict(admin_client):
     with patch("server.api.admin._get_github_for_user") as mock_gh:
-        mock_gh.return_value = MagicMock()
+        mock_gh.return_value = AsyncGitHubService(MagicMock())
         resp = await admin_client.put(
             f"/api/v1/admin/prompts/{PROMPT_ID}",
             json={
@@ -284,14 +287,52 @@ async def test_sync_status(admin_client):
     assert "cache_size" in data
 
 
+@pytest.mark.asyncio
+async def test_github_quota_reports_callers_token(admin_client):
+    from server.services.github_service import github_quota
+
+    service = MagicMock()
+    service.token_id = "tok123"
+    github_quota.record("tok123", 4200, 5000, 9999999999)
+    with patch("server.api.admin._get_github_for_user") as mock_gh:
+        mock_gh.return_value = AsyncGitHubService(service)
+        resp = await admin_client.get("/api/v1/admin/github/quota")
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["current"]["remaining"] == 4200
+    assert [t["token_id"] for t in data["tokens"]] == ["tok123"]
+
+
 @pytest.mark.asyncio
 async def test_force_sync_app_not_found(admin_client):
     with patch("server.api.admin._get_github_for_user") as mock_gh:
-        mock_gh.return_value = MagicMock()
+        mock_gh.return_value = AsyncGitHubService(MagicMock())
         resp = await admin_client.post("/api/v1/admin/apps/nonexistent-app/sync")
         assert resp.status_code == 404
 
 
+@pytest.mark.asyncio
+async def test_force_sync_app_fails_fast_when_quota_is_low(admin_client):
+    """A sync that would wait for the quota reset answers 429 instead of holding the request."""
+    import time
+
+    from server.services.github_service import BACKGROUND, github_quota
+    from tests.conftest import APP_ID
+
+    service = MagicMock()
+    service.token_id = "tok-low"
+    github_quota.record("tok-low", 10, 5000, int(time.time()) + 1800)
+    with patch("server.api.admin._get_github_for_user") as mock_gh:
+        mock_gh.return_value = AsyncGitHubService(service, priority=BACKGROUND, max_wait=10)
+        resp = await admin_client.post(f"/api/v1/admin/apps/{APP_ID}/sync")
+
+    assert resp.status_code == 429
+    assert resp.json()["detail"]["error"]["code"] == "GITHUB_QUOTA_EXHAUSTED"
+    assert 1700 < int(resp.headers["retry-after"]) <= 1800
+    service.list_md_tree.assert_not_called()
+
+
 # ---------------------------------------------------------------------------
 # Create prompt (mocked GitHub)
 # ---------------------------------------------------------------------------
@@ -299,7 +340,7 @@ async def test_force_sync_app_not_found(admin_client):
 @pytest.mark.asyncio
 async def test_create_prompt(admin_client):
     with patch("server.api.admin._get_github_for_user") as mock_gh:
-        mock_gh.return_value = MagicMock()
+        mock_gh.return_value = AsyncGitHubService(MagicMock())
         with patch("server.api.admin.create_prompt", new_callable=AsyncMock) as mock_create:
             mock_create.return_value = {
                 "id": "new-prompt-id",
@@ -322,7 +363,7 @@ async def test_create_prompt(admin_client):
 @pytest.mark.asyncio
 async def test_create_prompt_validation_error(admin_client):
     with patch("server.api.admin._get_github_for_user") as mock_gh:
-        mock_gh.return_value = MagicMock()
+        mock_gh.return_value = AsyncGitHubService(MagicMock())
         with patch("server.api.admin.create_prompt", new_callable=AsyncMock) as mock_create:
             mock_create.side_effect = ValueError("name is required")
             resp = await admin_client.post(
@@ -340,7 +381,7 @@ async def test_create_prompt_validation_error(admin_client):
 @pytest.mark.asyncio
 async def test_delete_prompt(admin_client):
     with patch("server.api.admin._get_github_for_user") as mock_gh:
-        mock_gh.return_value = MagicMock()
+        mock_gh.return_value = AsyncGitHubService(MagicMock())
         with patch("server.api.admin.delete_prompt_file", new_callable=AsyncMock):
             resp = await admin_client.delete(f"/api/v1/admin/prompts/{PROMPT_ID}")
             assert resp.status_code == 200
@@ -350,7 +391,7 @@ async def test_delete_prompt(admin_client):
 @pytest.mark.asyncio
 async def test_delete_prompt_not_found(admin_client):
     with patch("server.api.admin._get_github_for_user") as mock_gh:
-        mock_gh.return_value = MagicMock()
+        mock_gh.return_value = AsyncGitHubService(MagicMock())
         with patch("server.api.admin.delete_prompt_file", new_callable=AsyncMock) as mock_del:
             mock_del.side_effect = ValueError("Prompt not found")
             resp = await admin_client.delete("/api/v1/admin/prompts/nonexistent-id")
@@ -369,7 +410,7 @@ async def test_get_prompt_history(admin_client):
             {"sha": "abc123", "message": "Initial commit", "author": "testuser", "date": "2026-01-01T00:00:00"},
             {"sha": "def456", "message": "Update prompt", "author": "testuser", "date": "2026-01-02T00:00:00"},
         ]
-        mock_gh.return_value = mock_service
+        mock_gh.return_value = AsyncGitHubService(mock_service)
 
         resp = await admin_client.get(f"/api/v1/admin/prompts/{PROMPT_ID}/history")
         assert resp.status_code == 200
@@ -473,6 +514,27 @@ async def test_batch_update_prompt_not_found(admin_client):
     assert resp.status_code == 404
 
 
+@pytest.mark.asyncio
+async def test_batch_update_indexes_committed_content(admin_client, db):
+    gh = MagicMock()
+    gh.get_file_content.return_value = (f"---\nid: {PROMPT_ID}\nname: greeting\n---\nHello", "old-sha")
+    gh.create_or_update_files.return_value = "commit-sha"
+    with patch("server.api.admin._get_github_for_user", return_value=AsyncGitHubService(gh)):
+        resp = await admin_client.post(
+            "/api/v1/admin/prompts/batch",
+            json={"prompt_ids": [PROMPT_ID], "field": "environment", "value": "staging"},
+        )
+
+    assert resp.status_code == 200
+    # No re-sync from GitHub: the committed content is indexed directly
+    gh.list_md_tree.assert_not_called()
+    committed = gh.create_or_update_files.call_args[0][1][0]["content"]
+    async with db.execute("SELECT environment, git_sha FROM prompts WHERE id = ?", (PROMPT_ID,)) as cursor:
+        row = await cursor.fetchone()
+    assert row["environment"] == "staging"
+    assert row["git_sha"] == git_blob_sha(committed)
+
+
 @pytest.mark.asyncio
 async def test_batch_delete_empty_ids(admin_client):
     resp = await admin_client.post(
@@ -586,7 +648,7 @@ async def test_get_prompt_at_sha(admin_client):
             "---\nname: greeting\nversion: '1.0'\n---\nHello {{ name }}!",
             "blob-sha-123",
         )
-        mock_gh.return_value = mock_service
+        mock_gh.return_value = AsyncGitHubService(mock_service)
 
         resp = await admin_client.get(f"/api/v1/admin/prompts/{PROMPT_ID}/at/abc123")
         assert resp.status_code == 200
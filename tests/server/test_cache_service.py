@@ -0,0 +1,185 @@
+"""Tests for the server-side PromptCache."""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from server.services.cache_service import PromptCache, SingleFlight
+
+SAMPLE = {"id": "p1", "name": "greeting", "version": "1.0", "git_sha": "deadbeefcafe", "body": "Hi"}
+
+
+def test_put_stores_encoded_payload():
+    cache = PromptCache()
+    entry = cache.put("id:p1", SAMPLE)
+    assert json.loads(entry.payload) == SAMPLE
+    assert entry.etag == '"1.0-deadbeef"'
+    assert entry.payload_gzip is None  # below gzip threshold
+
+
+def test_large_payload_has_gzip_variant():
+    cache = PromptCache(gzip_min_bytes=100)
+    data = dict(SAMPLE, body="x" * 500)
+    entry = cache.put("id:p1", data)
+    assert entry.payload_gzip is not None
+    assert gzip.decompress(entry.payload_gzip) == entry.payload
+
+
+def test_get_entry_and_legacy_get():
+    cache = PromptCache()
+    cache.put("id:p1", SAMPLE, '"etag"')
+
+    entry, is_fresh = cache.get_entry("id:p1")
+    assert is_fresh
+    assert entry.etag == '"etag"'
+
+    data, etag, is_fresh = cache.get("id:p1")
+    assert data == SAMPLE and etag == '"etag"' and is_fresh
+
+    assert cache.get_entry("id:missing") == (None, False)
+
+
+def test_put_entry_shares_entry_across_keys():
+    cache = PromptCache()
+    entry = cache.put("name:o/a/greeting:any", SAMPLE)
+    cache.put_entry("id:p1", entry)
+    assert cache.get_entry("id:p1")[0] is entry
+    assert cache.size == 2
+
+
+def test_stale_entry():
+    cache = PromptCache(default_ttl=0)
+    cache.put("id:p1", SAMPLE)
+    entry, is_fresh = cache.get_entry("id:p1")
+    assert entry is not None
+    assert not is_fresh
+
+
+def test_entry_past_stale_window_is_dropped():
+    cache = PromptCache(default_ttl=60, stale_ttl=300)
+    entry = cache.put("id:p1", SAMPLE)
+    entry.cached_at -= 359
+    assert cache.get_entry("id:p1")[0] is entry
+    entry.cached_at -= 1
+    assert cache.get_entry("id:p1") == (None, False)
+    assert cache.size == 0
+
+
+def test_lru_eviction():
+    cache = PromptCache(max_size=2)
+    cache.put("a", SAMPLE)
+    cache.put("b", SAMPLE)
+    cache.get_entry("a")
+    cache.put("c", SAMPLE)
+    assert cache.get_entry("b")[0] is None
+    assert cache.get_entry("a")[0] is not None
+
+
+# ---------------------------------------------------------------------------
+# Targeted invalidation (reverse index)
+# ---------------------------------------------------------------------------
+
+
+def _seed(cache: PromptCache) -> None:
+    p1 = dict(SAMPLE, app_id="app-1")
+    p2 = {"id": "p2", "app_id": "app-1", "name": "farewell", "version": "1.0", "git_sha": "cafe"}
+    p3 = {"id": "p3", "app_id": "app-2", "name": "other", "version": "1.0", "git_sha": "beef"}
+    e1 = cache.put("name:o/a/greeting:any", p1, file_path="prompts/greeting.md")
+    cache.put_entry("id:p1", e1)
+    cache.put("name:o/a/greeting:production", p1, file_path="prompts/greeting.md")
+    cache.put("id:p2", p2, file_path="prompts/farewell.md")
+    cache.put("id:p3", p3, file_path="prompts/greeting.md")
+
+
+def test_invalidate_prompt_removes_id_and_name_keys():
+    cache = PromptCache()
+    _seed(cache)
+    assert cache.invalidate_prompt("p1") == 3
+    assert cache.size == 2
+    assert cache.get_entry("id:p2")[0] is not None
+
+
+def test_invalidate_file_is_scoped_to_app():
+    cache = PromptCache()
+    _seed(cache)
+    assert cache.invalidate_file("app-1", "prompts/greeting.md") == 3
+    assert cache.get_entry("id:p3")[0] is not None  # same path, different app
+    assert cache.invalidate_file("app-1", "prompts/missing.md") == 0
+
+
+def test_invalidate_app():
+    cache = PromptCache()
+    _seed(cache)
+    assert cache.invalidate_app("app-1") == 4
+    assert cache.size == 1
+    assert cache.invalidate_app("app-1") == 0
+
+
+def test_index_follows_eviction_and_overwrite():
+    cache = PromptCache(max_size=2)
+    a = {"id": "a", "app_id": "app-1"}
+    b = {"id": "b", "app_id": "app-1"}
+    cache.put("id:a", a)
+    cache.put("id:a", dict(a, app_id="app-2"))  # overwrite re-tags the key
+    cache.put("id:b", b)
+    cache.put("id:c", {"id": "c", "app_id": "app-3"})  # evicts id:a
+    assert cache.invalidate_app("app-2") == 0
+    assert cache.invalidate_app("app-1") == 1
+    assert cache._index.keys() == {"app:app-3", "prompt:c"}
+
+
+# ---------------------------------------------------------------------------
+# Single-flight request coalescing
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_single_flight_runs_loader_once():
+    flight = SingleFlight()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*(flight.do("k", loader) for _ in range(10)))
+    assert results == ["value"] * 10
+    assert calls == 1
+    assert flight.coalesced == 9
+    assert not flight.in_flight("k")
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_to_all_waiters():
+    flight = SingleFlight()
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        flight.do("k", loader), flight.do("k", loader), return_exceptions=True
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_leader():
+    flight = SingleFlight()
+
+    async def loader():
+        await asyncio.sleep(0.02)
+        return 42
+
+    leader = asyncio.ensure_future(flight.do("k", loader))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do("k", loader))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == 42
@@ -0,0 +1,68 @@
+"""Tests for the SQLite connection manager (writer + read pool)."""
+
+from __future__ import annotations
+
+import aiosqlite
+import pytest
+import pytest_asyncio
+
+from server.config import settings
+from server.db import database as db_module
+
+
+@pytest_asyncio.fixture
+async def file_db(tmp_path, monkeypatch):
+    """Initialize the real connection manager against a temp database file."""
+    monkeypatch.setattr(settings, "database_path", str(tmp_path / "test.db"))
+    monkeypatch.setattr(settings, "deployment_mode", "container")
+    monkeypatch.setattr(settings, "db_read_pool_size", 2)
+    original_db = db_module._db
+    db_module._db = None
+    await db_module.init_db()
+    yield
+    await db_module.close_db()
+    db_module._db = original_db
+
+
+@pytest.mark.asyncio
+async def test_read_pool_round_robin(file_db):
+    writer = await db_module.get_db()
+    r1 = await db_module.get_db(read_only=True)
+    r2 = await db_module.get_db(read_only=True)
+    r3 = await db_module.get_db(read_only=True)
+    assert r1 is not writer and r2 is not writer
+    assert r1 is not r2
+    assert r3 is r1
+
+
+@pytest.mark.asyncio
+async def test_readers_see_committed_writes(file_db):
+    writer = await db_module.get_db()
+    await writer.execute(
+        "INSERT INTO organizations (id, github_owner) VALUES (?, ?)", ("org-pool", "poolorg")
+    )
+    await writer.commit()
+
+    reader = await db_module.get_db(read_only=True)
+    async with reader.execute("SELECT github_owner FROM organizations WHERE id = 'org-pool'") as cursor:
+        row = await cursor.fetchone()
+    assert row["github_owner"] == "poolorg"
+
+
+@pytest.mark.asyncio
+async def test_readers_reject_writes(file_db):
+    reader = await db_module.get_db(read_only=True)
+    with pytest.raises(aiosqlite.OperationalError):
+        await reader.execute(
+            "INSERT INTO organizations (id, github_owner) VALUES (?, ?)", ("org-x", "x")
+        )
+
+
+@pytest.mark.asyncio
+async def test_read_only_falls_back_to_writer_without_pool(db):
+    original_db = db_module._db
+    db_module._db = db
+    try:
+        assert await db_module.get_db(read_only=True) is db
+    finally:
+        db_module._db = original_db
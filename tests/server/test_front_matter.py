@@ -11,6 +11,7 @@ from server.utils.front_matter import (
     ensure_version,
     extract_tags,
     front_matter_to_json,
+    git_blob_sha,
     parse_prompt_file,
     serialize_prompt_file,
 )
@@ -94,6 +95,15 @@ class TestBodyHash:
         assert len(h) == 16
 
 
+class TestGitBlobSha:
+    def test_matches_git_hash_object(self):
+        # printf 'hello\n' | git hash-object --stdin
+        assert git_blob_sha("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+    def test_hashes_utf8_bytes(self):
+        assert git_blob_sha("héllo") != git_blob_sha("hello")
+
+
 class TestEnsureId:
     def test_adds_id_when_missing(self):
         fm = {"name": "test"}
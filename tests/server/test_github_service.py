@@ -6,20 +6,44 @@ All PyGithub calls are mocked — no actual GitHub API calls are made.
 from __future__ import annotations
 
 import base64
+import json
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from server.services.github_service import GitHubService
+from server.services.github_service import (
+    BACKGROUND,
+    INTERACTIVE,
+    AsyncGitHubService,
+    BlobCache,
+    GitHubClientPool,
+    GitHubQuotaExhausted,
+    GitHubQuotaScheduler,
+    GitHubService,
+    blob_cache,
+    github_metrics,
+    github_quota,
+)
+from server.utils.front_matter import git_blob_sha
 
 
 @pytest.fixture
 def gh_service():
     """GitHubService with mocked PyGithub Github instance."""
+    blob_cache.clear()
     with patch("server.services.github_service.Github") as MockGithub:
         service = GitHubService("fake-token")
         service.gh = MockGithub.return_value
         yield service
+    blob_cache.clear()
+
+
+def _respond(gh_service, *responses):
+    """Queue raw (status, body, etag) responses for conditional GETs."""
+    gh_service.gh.requester.requestJson.side_effect = [
+        (status, {"etag": etag} if etag else {}, json.dumps(body) if body is not None else "")
+        for status, body, etag in responses
+    ]
 
 
 def _make_content_file(name: str, path: str, sha: str = "abc123", size: int = 100, file_type: str = "file", content_b64: str | None = None):
@@ -103,76 +127,128 @@ class TestListMdFiles:
 
 
 # ---------------------------------------------------------------------------
-# get_file_content
+# list_md_tree / get_blob_contents
 # ---------------------------------------------------------------------------
 
-class TestGetFileContent:
-    def test_returns_content_and_sha(self, gh_service):
+def _tree_element(path: str, sha: str, element_type: str = "blob") -> dict:
+    return {"path": path, "sha": sha, "type": element_type, "size": 10}
+
+
+class TestListMdTree:
+    def test_lists_md_blobs_under_subdirectory(self, gh_service):
+        tree = {"truncated": False, "tree": [
+            _tree_element("prompts", "t1", "tree"),
+            _tree_element("prompts/a.md", "sha-a"),
+            _tree_element("prompts/sub/b.md", "sha-b"),
+            _tree_element("prompts/notes.txt", "sha-n"),
+            _tree_element("other/c.md", "sha-c"),
+        ]}
+        _respond(gh_service, (200, tree, None))
+
+        files, complete = gh_service.list_md_tree("owner/repo", subdirectory="prompts/")
+        gh_service.gh.requester.requestJson.assert_called_once_with(
+            "GET", "/repos/owner/repo/git/trees/main", {"recursive": "1"}, None
+        )
+        assert complete is True
+        assert [(f["path"], f["sha"]) for f in files] == [("prompts/a.md", "sha-a"), ("prompts/sub/b.md", "sha-b")]
+
+    def test_branch_with_slash_keeps_its_path_separator(self, gh_service):
+        _respond(gh_service, (200, {"truncated": False, "tree": []}, None))
+
+        gh_service.list_md_tree("owner/repo", branch="release/1.x")
+        gh_service.gh.requester.requestJson.assert_called_once_with(
+            "GET", "/repos/owner/repo/git/trees/release/1.x", {"recursive": "1"}, None
+        )
+
+    def test_unchanged_tree_is_revalidated_with_etag(self, gh_service):
+        tree = {"truncated": False, "tree": [_tree_element("a.md", "sha-a")]}
+        _respond(gh_service, (200, tree, '"v1"'), (304, None, '"v1"'))
+
+        first, _ = gh_service.list_md_tree("owner/repo")
+        second, _ = gh_service.list_md_tree("owner/repo")
+        assert first == second
+        headers = gh_service.gh.requester.requestJson.call_args.args[3]
+        assert headers == {"If-None-Match": '"v1"'}
+
+    def test_truncated_tree_falls_back_to_directory_walk(self, gh_service):
         repo = MagicMock()
         gh_service.gh.get_repo.return_value = repo
+        _respond(gh_service, (200, {"truncated": True, "tree": []}, None))
+        repo.get_contents.return_value = [_make_content_file("a.md", "a.md")]
+
+        files, complete = gh_service.list_md_tree("owner/repo")
+        assert complete is False
+        assert [f["path"] for f in files] == ["a.md"]
+
+
+class TestGetBlobContents:
+    @pytest.mark.asyncio
+    async def test_serves_cached_blobs_without_calls(self, gh_service):
+        blob_cache.put("s1", "cached body")
+        result = await AsyncGitHubService(gh_service).get_blob_contents("owner/repo", ["s1"])
+        assert result == {"s1": "cached body"}
+        gh_service.gh.get_repo.assert_not_called()
 
+    @pytest.mark.asyncio
+    async def test_empty_list_makes_no_calls(self, gh_service):
+        assert await AsyncGitHubService(gh_service).get_blob_contents("owner/repo", []) == {}
+        gh_service.gh.get_repo.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# get_file_content
+# ---------------------------------------------------------------------------
+
+class TestGetFileContent:
+    def test_returns_content_and_sha(self, gh_service):
         content = "---\nname: greeting\n---\nHello {{ name }}"
         encoded = base64.b64encode(content.encode()).decode()
-        mock_file = MagicMock()
-        mock_file.content = encoded
-        mock_file.sha = "file-sha-123"
-        repo.get_contents.return_value = mock_file
+        _respond(gh_service, (200, {"type": "file", "sha": "file-sha-123", "content": encoded}, None))
 
         result_content, result_sha = gh_service.get_file_content("owner/repo", "prompts/greeting.md")
         assert result_content == content
         assert result_sha == "file-sha-123"
+        assert blob_cache.get("file-sha-123") == content
 
     def test_raises_on_directory(self, gh_service):
-        repo = MagicMock()
-        gh_service.gh.get_repo.return_value = repo
-        repo.get_contents.return_value = [MagicMock(), MagicMock()]
+        _respond(gh_service, (200, [{"type": "file"}, {"type": "file"}], None))
 
         with pytest.raises(ValueError, match="Expected file, got directory"):
             gh_service.get_file_content("owner/repo", "prompts/")
 
+    def test_raises_github_exception_on_error(self, gh_service):
+        from github import GithubException
+        _respond(gh_service, (404, {"message": "Not Found"}, None))
+
+        with pytest.raises(GithubException):
+            gh_service.get_file_content("owner/repo", "missing.md")
+
 
 # ---------------------------------------------------------------------------
 # get_file_history
 # ---------------------------------------------------------------------------
 
-class TestGetFileHistory:
-    def test_returns_commit_history(self, gh_service):
-        repo = MagicMock()
-        gh_service.gh.get_repo.return_value = repo
+def _commit(sha: str, message: str) -> dict:
+    return {"sha": sha, "commit": {"message": message, "author": {"name": "Test User", "date": "2026-01-01T00:00:00Z"}}}
 
-        mock_commit = MagicMock()
-        mock_commit.sha = "abc123"
-        mock_commit.commit.message = "Update greeting"
-        mock_commit.commit.author.name = "Test User"
-        mock_commit.commit.author.date.isoformat.return_value = "2026-01-01T00:00:00"
 
-        repo.get_commits.return_value = [mock_commit]
+class TestGetFileHistory:
+    def test_returns_commit_history(self, gh_service):
+        _respond(gh_service, (200, [_commit("abc123", "Update greeting")], None))
 
         result = gh_service.get_file_history("owner/repo", "prompts/greeting.md")
+        gh_service.gh.requester.requestJson.assert_called_once_with(
+            "GET", "/repos/owner/repo/commits",
+            {"path": "prompts/greeting.md", "sha": "main", "per_page": 20}, None,
+        )
         assert len(result) == 1
         assert result[0]["sha"] == "abc123"
         assert result[0]["message"] == "Update greeting"
+        assert result[0]["author"] == "Test User"
+        assert result[0]["date"] == "2026-01-01T00:00:00+00:00"
 
     def test_respects_limit(self, gh_service):
-        repo = MagicMock()
-        gh_service.gh.get_repo.return_value = repo
-
-        commits = []
-        for i in range(25):
-            date_mock = MagicMock()
-            date_mock.isoformat = MagicMock(return_value="2026-01-01")
-            author_mock = MagicMock()
-            author_mock.name = "User"
-            author_mock.date = date_mock
-            commit_inner = MagicMock()
-            commit_inner.message = f"Commit {i}"
-            commit_inner.author = author_mock
-            c = MagicMock()
-            c.sha = f"sha-{i}"
-            c.commit = commit_inner
-            commits.append(c)
-
-        repo.get_commits = MagicMock(return_value=commits)
+        _respond(gh_service, (200, [_commit(f"sha-{i}", f"Commit {i}") for i in range(25)], None))
 
         result = gh_service.get_file_history("owner/repo", "file.md", limit=5)
         assert len(result) == 5
@@ -264,44 +340,55 @@ class TestDeleteFile:
 
 class TestGetDiff:
     def test_returns_patch(self, gh_service):
-        repo = MagicMock()
-        gh_service.gh.get_repo.return_value = repo
-
-        mock_file = MagicMock()
-        mock_file.filename = "prompts/greeting.md"
-        mock_file.patch = "@@ -1 +1 @@\n-old\n+new"
-
-        mock_comparison = MagicMock()
-        mock_comparison.files = [mock_file]
-        repo.compare.return_value = mock_comparison
+        comparison = {"files": [{"filename": "prompts/greeting.md", "patch": "@@ -1 +1 @@\n-old\n+new"}]}
+        _respond(gh_service, (200, comparison, None))
 
         result = gh_service.get_diff("owner/repo", "prompts/greeting.md", "abc123")
+        assert gh_service.gh.requester.requestJson.call_args.args[1] == "/repos/owner/repo/compare/abc123...main"
         assert result is not None
         assert "+new" in result
 
     def test_returns_none_for_missing_file(self, gh_service):
-        repo = MagicMock()
-        gh_service.gh.get_repo.return_value = repo
-
-        mock_file = MagicMock()
-        mock_file.filename = "other/file.md"
-        mock_comparison = MagicMock()
-        mock_comparison.files = [mock_file]
-        repo.compare.return_value = mock_comparison
+        _respond(gh_service, (200, {"files": [{"filename": "other/file.md", "patch": ""}]}, None))
 
         result = gh_service.get_diff("owner/repo", "prompts/greeting.md", "abc123")
         assert result is None
 
     def test_returns_none_on_github_error(self, gh_service):
-        from github import GithubException
-        repo = MagicMock()
-        gh_service.gh.get_repo.return_value = repo
-        repo.compare.side_effect = GithubException(404, "Not Found", None)
+        _respond(gh_service, (404, {"message": "Not Found"}, None))
 
         result = gh_service.get_diff("owner/repo", "prompts/greeting.md", "abc123")
         assert result is None
 
 
+# ---------------------------------------------------------------------------
+# BlobCache
+# ---------------------------------------------------------------------------
+
+class TestBlobCache:
+    def test_memory_lru_evicts_oldest(self):
+        cache = BlobCache(max_size=2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.get("a")
+        cache.put("c", "C")
+        assert cache.get("b") is None
+        assert cache.get("a") == "A"
+        assert cache.stats()["size"] == 2
+
+    def test_disk_store_survives_restart_and_verifies_content(self, tmp_path):
+        sha = git_blob_sha("hello\n")
+        BlobCache(disk_dir=str(tmp_path)).put(sha, "hello\n")
+        assert (tmp_path / sha[:2] / sha[2:]).exists()
+
+        restarted = BlobCache(disk_dir=str(tmp_path))
+        assert restarted.get(sha) == "hello\n"
+        assert restarted.stats()["disk_hits"] == 1
+
+        (tmp_path / sha[:2] / sha[2:]).write_text("tampered")
+        assert BlobCache(disk_dir=str(tmp_path)).get(sha) is None
+
+
 # ---------------------------------------------------------------------------
 # create_or_update_files (bulk commit via Git Trees API)
 # ---------------------------------------------------------------------------
@@ -394,3 +481,213 @@ class TestClose:
     def test_close_calls_github_close(self, gh_service):
         gh_service.close()
         gh_service.gh.close.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# AsyncGitHubService
+# ---------------------------------------------------------------------------
+
+class TestAsyncGitHubService:
+    @pytest.mark.asyncio
+    async def test_runs_calls_in_github_pool(self, gh_service):
+        import threading
+
+        threads = []
+        gh_service.gh.get_user.side_effect = lambda: threads.append(threading.current_thread().name) or MagicMock(
+            login="octocat", avatar_url="https://a"
+        )
+        profile = await AsyncGitHubService(gh_service).get_user_profile()
+
+        assert profile == {"login": "octocat", "avatar_url": "https://a"}
+        assert threads[0].startswith("github")
+
+    @pytest.mark.asyncio
+    async def test_records_per_method_metrics(self, gh_service):
+        github_metrics.clear()
+        gh_service.gh.get_repo.side_effect = [MagicMock(), Exception("Not Found")]
+        facade = AsyncGitHubService(gh_service)
+
+        await facade.get_repo_info("org/repo")
+        with pytest.raises(Exception, match="Not Found"):
+            await facade.get_repo_info("org/missing")
+
+        stats = github_metrics.stats()["get_repo_info"]
+        assert stats["calls"] == 2
+        assert stats["errors"] == 1
+        assert stats["max_ms"] >= stats["avg_ms"] >= 0
+        github_metrics.clear()
+
+    def test_close_is_synchronous(self, gh_service):
+        AsyncGitHubService(gh_service).close()
+        gh_service.gh.close.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# GitHubQuotaScheduler
+# ---------------------------------------------------------------------------
+
+class TestGitHubQuotaScheduler:
+    def test_background_delay_follows_remaining_quota(self):
+        import time
+
+        scheduler = GitHubQuotaScheduler(reserve=100, low_watermark=1000)
+        reset_at = int(time.time()) + 600
+        assert scheduler.delay_for("t") == (0.0, False)  # unknown token
+
+        scheduler.record("t", 4000, 5000, reset_at)
+        assert scheduler.delay_for("t") == (0.0, False)
+
+        scheduler.record("t", 700, 5000, reset_at)
+        delay, deferred = scheduler.delay_for("t")
+        assert not deferred and 0.9 < delay <= 1.0  # ~600s spread over 600 spendable calls
+
+        scheduler.record("t", 50, 5000, reset_at)
+        delay, deferred = scheduler.delay_for("t")
+        assert deferred and delay > 590
+
+        scheduler.record("t", 0, 5000, int(time.time()) - 1)  # already reset
+        assert scheduler.delay_for("t") == (0.0, False)
+
+    @pytest.mark.asyncio
+    async def test_interactive_calls_are_never_delayed(self):
+        import time
+
+        scheduler = GitHubQuotaScheduler(reserve=100)
+        scheduler.record("t", 0, 5000, int(time.time()) + 3600)
+        await scheduler.acquire("t", INTERACTIVE)
+        assert scheduler.stats()["deferred"] == 0
+
+    def test_paced_calls_take_successive_slots(self):
+        import time
+
+        scheduler = GitHubQuotaScheduler(reserve=100, low_watermark=1000)
+        scheduler.record("t", 700, 5000, int(time.time()) + 600)  # ~1s apart
+
+        delays = [scheduler._reserve_slot("t", None)[0] for _ in range(3)]
+        assert delays[0] == 0.0
+        assert 0.9 < delays[1] <= 1.0 and 1.9 < delays[2] <= 2.0
+
+        # Past max_wait the call fails without taking a slot
+        with pytest.raises(GitHubQuotaExhausted):
+            scheduler._reserve_slot("t", 2.5)
+        assert 2.9 < scheduler._reserve_slot("t", None)[0] <= 3.0
+
+    @pytest.mark.asyncio
+    async def test_deferral_past_max_wait_raises(self):
+        import time
+
+        scheduler = GitHubQuotaScheduler(reserve=100)
+        scheduler.record("t", 50, 5000, int(time.time()) + 3600)
+        with pytest.raises(GitHubQuotaExhausted) as exc:
+            await scheduler.acquire("t", BACKGROUND, max_wait=10)
+        assert exc.value.retry_after > 3500
+
+    @pytest.mark.asyncio
+    async def test_facade_fetches_blobs_as_separate_scheduled_calls(self, gh_service):
+        from github import GithubException
+
+        def get_git_blob(sha):
+            if sha == "bad":
+                raise GithubException(404, "Not Found", None)
+            blob = MagicMock()
+            blob.content = base64.b64encode(f"body-{sha}".encode()).decode()
+            return blob
+
+        gh_service.gh.get_repo.return_value.get_git_blob.side_effect = get_git_blob
+        blob_cache.put("cached", "cached body")
+        github_metrics.clear()
+
+        result = await AsyncGitHubService(gh_service, priority=BACKGROUND).get_blob_contents(
+            "owner/repo", ["s1", "s2", "bad", "cached", "s1"], max_workers=2
+        )
+
+        assert result == {"s1": "body-s1", "s2": "body-s2", "cached": "cached body"}
+        assert github_metrics.stats()["get_blob"]["calls"] == 3
+        github_metrics.clear()
+
+    @pytest.mark.asyncio
+    async def test_facade_blob_fetch_stops_when_quota_runs_out(self, gh_service):
+        import time
+
+        github_quota.clear()
+        github_quota.record(gh_service.token_id, 10, 5000, int(time.time()) + 3600)
+        facade = AsyncGitHubService(gh_service, priority=BACKGROUND, max_wait=5)
+        with pytest.raises(GitHubQuotaExhausted):
+            await facade.get_blob_contents("owner/repo", ["s1", "s2"])
+        gh_service.gh.get_repo.assert_not_called()
+        github_quota.clear()
+
+    @pytest.mark.asyncio
+    async def test_facade_records_quota_from_response_headers(self, gh_service):
+        github_quota.clear()
+        gh_service.gh.requester.rate_limiting = (4321, 5000)
+        gh_service.gh.requester.rate_limiting_resettime = 1700000000
+
+        await AsyncGitHubService(gh_service, priority=BACKGROUND).get_repo_info("org/repo")
+
+        quota = github_quota.quota(gh_service.token_id)
+        assert (quota["remaining"], quota["limit"], quota["reset_at"]) == (4321, 5000, 1700000000)
+        github_quota.clear()
+
+
+# ---------------------------------------------------------------------------
+# GitHubClientPool
+# ---------------------------------------------------------------------------
+
+class TestGitHubClientPool:
+    @pytest.fixture(autouse=True)
+    def _mock_clients(self):
+        with patch("server.services.github_service.Github") as MockGithub, \
+             patch("server.services.github_service.decrypt", side_effect=lambda t: f"plain-{t}") as mock_decrypt:
+            MockGithub.side_effect = lambda *a, **kw: MagicMock()
+            self.mock_decrypt = mock_decrypt
+            yield
+
+    def test_reuses_client_and_decrypts_once_per_token(self):
+        pool = GitHubClientPool()
+        first = pool.get("enc-a")
+        first.close()
+        second = pool.get("enc-a")
+
+        assert second.service is first.service
+        first.service.gh.close.assert_not_called()
+        assert self.mock_decrypt.call_count == 1
+        assert pool.get("enc-b").service is not first.service
+        assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 2
+
+    def test_evicts_idle_clients_only_when_released(self):
+        pool = GitHubClientPool(idle_seconds=0)
+        held = pool.get("enc-a")
+        released = pool.get("enc-b")
+        released.close()
+
+        assert pool.evict_idle() == 1
+        released.service.gh.close.assert_called_once()
+        held.service.gh.close.assert_not_called()
+        assert pool.stats()["size"] == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("mode, cleared", [("container", True), ("lambda", False)])
+    async def test_lifespan_keeps_pool_across_lambda_invocations(self, monkeypatch, mode, cleared):
+        from server import main
+
+        monkeypatch.setattr(main.settings, "deployment_mode", mode)
+        with patch.object(main, "init_db"), patch.object(main, "close_db"), \
+             patch.object(main, "get_db", side_effect=RuntimeError("no db")), \
+             patch.object(main.github_clients, "clear") as clear, \
+             patch.object(main.rate_limit_store, "close"):
+            async with main.lifespan(main.app):
+                pass
+        assert clear.called is cleared
+
+    def test_closes_least_recently_used_idle_client_past_max_size(self):
+        pool = GitHubClientPool(max_size=2)
+        clients = []
+        for token in ("enc-a", "enc-b", "enc-c"):
+            gh = pool.get(token)
+            gh.close()
+            clients.append(gh)
+
+        assert pool.stats()["size"] == 2
+        clients[0].service.gh.close.assert_called_once()
+        clients[2].service.gh.close.assert_not_called()
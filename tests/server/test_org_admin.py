@@ -12,6 +12,8 @@ import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 
+from server.services.github_service import AsyncGitHubService
+
 from tests.conftest import ORG_ID, USER_ID
 
 
@@ -65,7 +67,7 @@ def _mock_github_for_refresh(
     personal_avatar="https://avatar.test/u",
     list_orgs_side_effect=None,
 ):
-    """Build a MagicMock that behaves like _get_github_for_user() return value."""
+    """Build an async facade over a MagicMock, like _get_github_for_user() returns."""
     gh = MagicMock()
 
     if list_orgs_side_effect:
@@ -75,12 +77,9 @@ def _mock_github_for_refresh(
 
     gh.list_org_memberships.return_value = memberships or []
 
-    gh_user = MagicMock()
-    gh_user.login = personal_login
-    gh_user.avatar_url = personal_avatar
-    gh.gh.get_user.return_value = gh_user
+    gh.get_user_profile.return_value = {"login": personal_login, "avatar_url": personal_avatar}
 
-    return gh
+    return AsyncGitHubService(gh)
 
 
 # ---------------------------------------------------------------------------
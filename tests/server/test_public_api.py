@@ -121,3 +121,401 @@ async def test_scoped_key_by_name_allowed(client, scoped_api_key):
     )
     assert resp.status_code == 200
     assert resp.json()["name"] == "greeting"
+
+
+# ---------------------------------------------------------------------------
+# Pre-encoded cache responses
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_cached_fetch_returns_etag_and_304(client, test_api_key):
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    miss = await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)
+    hit = await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)
+
+    assert miss.status_code == hit.status_code == 200
+    assert miss.content == hit.content
+    assert hit.headers["content-type"] == "application/json"
+    etag = hit.headers["etag"]
+
+    not_modified = await client.get(
+        f"/api/v1/prompts/{PROMPT_ID}", headers={**headers, "If-None-Match": etag},
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_cached_fetch_serves_gzip_variant(client, test_api_key):
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    original_min = prompt_cache._gzip_min_bytes
+    prompt_cache._gzip_min_bytes = 0
+    try:
+        resp = await client.get(
+            f"/api/v1/prompts/{PROMPT_ID}",
+            headers={"Authorization": f"Bearer {test_api_key}", "Accept-Encoding": "gzip"},
+        )
+    finally:
+        prompt_cache._gzip_min_bytes = original_min
+        prompt_cache.clear()
+
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.json()["id"] == PROMPT_ID  # httpx decodes transparently
+
+
+@pytest.mark.asyncio
+async def test_gzip_and_identity_variants_have_distinct_etags(client, test_api_key):
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    original_min = prompt_cache._gzip_min_bytes
+    prompt_cache._gzip_min_bytes = 0
+    url = f"/api/v1/prompts/{PROMPT_ID}"
+    auth = {"Authorization": f"Bearer {test_api_key}"}
+    try:
+        gz = await client.get(url, headers={**auth, "Accept-Encoding": "gzip"})
+        plain = await client.get(url, headers={**auth, "Accept-Encoding": "identity"})
+        gz_304 = await client.get(
+            url, headers={**auth, "Accept-Encoding": "gzip", "If-None-Match": gz.headers["etag"]},
+        )
+        # Either variant's ETag revalidates: both describe the same prompt
+        plain_after_gz = await client.get(
+            url,
+            headers={**auth, "Accept-Encoding": "identity", "If-None-Match": gz.headers["etag"]},
+        )
+        gz_after_plain = await client.get(
+            url,
+            headers={**auth, "Accept-Encoding": "gzip", "If-None-Match": plain.headers["etag"]},
+        )
+    finally:
+        prompt_cache._gzip_min_bytes = original_min
+        prompt_cache.clear()
+
+    assert gz.headers["etag"] == plain.headers["etag"][:-1] + '-gz"'
+    assert "Accept-Encoding" in gz.headers["vary"]
+    assert "Accept-Encoding" in plain.headers["vary"]
+    assert gz_304.status_code == 304
+    assert gz_304.headers["etag"] == gz.headers["etag"]
+    assert plain_after_gz.status_code == 304
+    assert plain_after_gz.headers["etag"] == plain.headers["etag"]
+    assert gz_after_plain.status_code == 304
+    assert gz_after_plain.headers["etag"] == gz.headers["etag"]
+
+
+@pytest.mark.asyncio
+async def test_if_none_match_lists_weak_and_wildcard(client, test_api_key):
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    url = f"/api/v1/prompts/{PROMPT_ID}"
+    auth = {"Authorization": f"Bearer {test_api_key}"}
+    try:
+        etag = (await client.get(url, headers=auth)).headers["etag"]
+        listed = await client.get(url, headers={**auth, "If-None-Match": f'"other", {etag}'})
+        weak = await client.get(url, headers={**auth, "If-None-Match": f"W/{etag}"})
+        wildcard = await client.get(url, headers={**auth, "If-None-Match": "*"})
+        stale = await client.get(url, headers={**auth, "If-None-Match": '"other"'})
+    finally:
+        prompt_cache.clear()
+
+    assert listed.status_code == 304
+    assert weak.status_code == 304
+    assert wildcard.status_code == 304
+    assert stale.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_gzip_refused_with_zero_quality(client, test_api_key):
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    original_min = prompt_cache._gzip_min_bytes
+    prompt_cache._gzip_min_bytes = 0
+    url = f"/api/v1/prompts/{PROMPT_ID}"
+    auth = {"Authorization": f"Bearer {test_api_key}"}
+    try:
+        refused = await client.get(url, headers={**auth, "Accept-Encoding": "gzip;q=0, identity"})
+        wildcard = await client.get(url, headers={**auth, "Accept-Encoding": "*"})
+    finally:
+        prompt_cache._gzip_min_bytes = original_min
+        prompt_cache.clear()
+
+    assert "content-encoding" not in refused.headers
+    assert wildcard.headers["content-encoding"] == "gzip"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_coalesce_into_one_db_load(client, test_api_key):
+    import asyncio
+    from unittest.mock import patch
+
+    from server.db.queries import prompts as prompt_queries
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    real_get_prompt = prompt_queries.get_prompt
+    calls = 0
+
+    async def slow_get_prompt(db, prompt_id):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return await real_get_prompt(db, prompt_id)
+
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    with patch.object(prompt_queries, "get_prompt", slow_get_prompt):
+        responses = await asyncio.gather(
+            *(client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers) for _ in range(5))
+        )
+
+    assert [r.status_code for r in responses] == [200] * 5
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_while_revalidating(client, test_api_key, db):
+    import asyncio
+
+    from server.api import public
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    first = await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)
+    assert first.status_code == 200
+
+    # Change the row and age the cached entry past its TTL
+    await db.execute("UPDATE prompts SET git_sha = 'f00dfeed99' WHERE id = ?", (PROMPT_ID,))
+    await db.commit()
+    entry, _ = prompt_cache.get_entry(f"id:{PROMPT_ID}")
+    entry.cached_at -= 120
+
+    stale = await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)
+    assert stale.status_code == 200
+    assert stale.json()["git_sha"] == "deadbeef"  # served immediately from stale entry
+
+    await asyncio.gather(*public._background_tasks)
+    fresh = await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)
+    assert fresh.json()["git_sha"] == "f00dfeed99"
+    prompt_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_entry_past_stale_window_is_not_served(client, test_api_key):
+    """Past ttl + stale-while-revalidate the entry is reloaded synchronously.
+
+    A failed reload is an error rather than the stale entry.
+    """
+    from unittest.mock import AsyncMock, patch
+
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    assert (await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)).status_code == 200
+    entry, _ = prompt_cache.get_entry(f"id:{PROMPT_ID}")
+    entry.cached_at -= 400
+
+    failing = AsyncMock(side_effect=RuntimeError("db down"))
+    with patch("server.api.public._load_prompt_by_id", failing), pytest.raises(RuntimeError):
+        await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)
+    assert prompt_cache.get_entry(f"id:{PROMPT_ID}")[0] is None
+    prompt_cache.clear()
+
+
+# ---------------------------------------------------------------------------
+# Batch render
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_render_batch_mixed_items(client, test_api_key):
+    resp = await client.post(
+        "/api/v1/prompts/render:batch",
+        headers={"Authorization": f"Bearer {test_api_key}"},
+        json={"items": [
+            {"prompt_id": PROMPT_ID, "variables": {"name": "Alice", "place": "Wonderland"}},
+            {"org": "testorg", "app": "testapp", "name": "greeting", "variables": {"name": "Bob", "place": "Home"}},
+            {"prompt_id": "missing"},
+            {"org": "testorg", "app": "testapp", "name": "greeting", "environment": "staging"},
+            {"org": "nope", "app": "nope", "name": "x"},
+            {"variables": {}},
+        ]},
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [r["index"] for r in results] == list(range(6))
+    assert results[0]["rendered_body"] == "Hello Alice, welcome to Wonderland."
+    assert results[1]["rendered_body"] == "Hello Bob, welcome to Home."
+    assert results[2]["error"]["code"] == "PROMPT_NOT_FOUND"
+    assert results[3]["error"]["code"] == "PROMPT_NOT_FOUND"
+    assert results[4]["error"]["code"] == "APP_NOT_FOUND"
+    assert results[5]["error"]["code"] == "VALIDATION_ERROR"
+
+
+@pytest.mark.asyncio
+async def test_render_batch_scoped_key_per_item_forbidden(client, scoped_api_key):
+    resp = await client.post(
+        "/api/v1/prompts/render:batch",
+        headers={"Authorization": f"Bearer {scoped_api_key}"},
+        json={"items": [
+            {"prompt_id": PROMPT_ID, "variables": {"name": "A", "place": "B"}},
+            {"prompt_id": PROMPT_ID_2, "variables": {"name": "A"}},
+        ]},
+    )
+    results = resp.json()["results"]
+    assert results[0]["rendered_body"] == "Hello A, welcome to B."
+    assert results[1]["error"]["code"] == "FORBIDDEN"
+
+
+@pytest.mark.asyncio
+async def test_render_batch_large_batch_renders_concurrently(client, test_api_key):
+    import asyncio
+    from unittest.mock import patch
+
+    items = [{"prompt_id": PROMPT_ID, "variables": {"name": str(i), "place": "x"}} for i in range(20)]
+    with patch("server.api.public.settings.render_batch_thread_threshold", 10), \
+            patch("server.api.public.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+        resp = await client.post(
+            "/api/v1/prompts/render:batch",
+            headers={"Authorization": f"Bearer {test_api_key}"},
+            json={"items": items},
+        )
+    assert to_thread.call_count == 20
+    assert [r["rendered_body"] for r in resp.json()["results"]] == [
+        f"Hello {i}, welcome to x." for i in range(20)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_render_batch_validates_request(client, test_api_key):
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    resp = await client.post("/api/v1/prompts/render:batch", headers=headers, json={"items": []})
+    assert resp.status_code == 400
+
+    resp = await client.post(
+        "/api/v1/prompts/render:batch", headers=headers, json={"items": [{"prompt_id": PROMPT_ID}] * 101}
+    )
+    assert resp.status_code == 400
+
+
+# ---------------------------------------------------------------------------
+# Batch fetch (prompts:batch)
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_by_ids(client, test_api_key):
+    resp = await client.post(
+        "/api/v1/prompts:batch",
+        headers={"Authorization": f"Bearer {test_api_key}"},
+        json={"ids": [PROMPT_ID, PROMPT_ID_2, "missing"]},
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [p["prompt"]["id"] for p in data["prompts"]] == [PROMPT_ID, PROMPT_ID_2]
+    assert all(p["etag"] for p in data["prompts"])
+    assert data["errors"] == [{"id": "missing", "code": "PROMPT_NOT_FOUND"}]
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_keeps_request_order_with_partial_cache(client, test_api_key):
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    try:
+        # Only the second id is cached; it must not jump ahead of the first
+        await client.get(f"/api/v1/prompts/{PROMPT_ID_2}", headers=headers)
+        resp = await client.post(
+            "/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID, PROMPT_ID_2]}
+        )
+    finally:
+        prompt_cache.clear()
+
+    assert [p["prompt"]["id"] for p in resp.json()["prompts"]] == [PROMPT_ID, PROMPT_ID_2]
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_get_by_names_and_whole_app(client, test_api_key):
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    resp = await client.get(
+        "/api/v1/prompts:batch",
+        headers=headers,
+        params={"org": "testorg", "app": "testapp", "names": "greeting,nope"},
+    )
+    data = resp.json()
+    assert [p["prompt"]["name"] for p in data["prompts"]] == ["greeting"]
+    assert data["errors"] == [{"name": "nope", "code": "PROMPT_NOT_FOUND"}]
+
+    resp = await client.get("/api/v1/prompts:batch", headers=headers, params={"org": "testorg", "app": "testapp"})
+    assert [p["prompt"]["id"] for p in resp.json()["prompts"]] == [PROMPT_ID]
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_etags_not_modified(client, test_api_key):
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    first = await client.post("/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID]})
+    etag = first.json()["prompts"][0]["etag"]
+
+    resp = await client.post(
+        "/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID], "etags": {PROMPT_ID: etag}}
+    )
+    item = resp.json()["prompts"][0]
+    assert item == {"id": PROMPT_ID, "name": "greeting", "etag": etag, "not_modified": True}
+
+    # An ETag issued for the gzip variant of a single fetch also matches
+    gz_etag = etag[:-1] + '-gz"'
+    resp = await client.post(
+        "/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID], "etags": {PROMPT_ID: gz_etag}}
+    )
+    assert resp.json()["prompts"][0]["not_modified"] is True
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_logs_real_cache_hit_per_item(client, test_api_key):
+    from unittest.mock import patch
+
+    from server.services.cache_service import prompt_cache
+
+    prompt_cache.clear()
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    await client.get(f"/api/v1/prompts/{PROMPT_ID}", headers=headers)  # warm one id
+
+    with patch("server.api.public.access_log_writer.enqueue") as enqueue:
+        resp = await client.post(
+            "/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID, PROMPT_ID_2]}
+        )
+    assert resp.status_code == 200
+    logged = {c.args[0]: c.args[4] for c in enqueue.call_args_list}
+    assert logged == {PROMPT_ID: True, PROMPT_ID_2: False}
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_respects_key_scope(client, scoped_api_key):
+    headers = {"Authorization": f"Bearer {scoped_api_key}"}
+    resp = await client.post("/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID, PROMPT_ID_2]})
+    data = resp.json()
+    assert [p["prompt"]["id"] for p in data["prompts"]] == [PROMPT_ID]
+    assert data["errors"] == [{"id": PROMPT_ID_2, "code": "FORBIDDEN"}]
+
+    resp = await client.post("/api/v1/prompts:batch", headers=headers, json={"org": "testorg", "app": "otherapp"})
+    assert resp.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_prompts_batch_validation(client, test_api_key):
+    headers = {"Authorization": f"Bearer {test_api_key}"}
+    assert (await client.post("/api/v1/prompts:batch", headers=headers, json={})).status_code == 400
+    resp = await client.post(
+        "/api/v1/prompts:batch", headers=headers, json={"ids": [PROMPT_ID], "org": "testorg", "app": "testapp"}
+    )
+    assert resp.status_code == 400
+    assert (await client.get("/api/v1/prompts:batch")).status_code == 401
@@ -0,0 +1,163 @@
+"""Tests for rate-limit store implementations."""
+
+from __future__ import annotations
+
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from server.services.rate_limit_store import MemoryRateLimitStore, SQLiteRateLimitStore
+
+# Mid-window, so a test never straddles a window boundary by accident
+WINDOW_START = 1_700_000_040.0
+
+
+class TestMemoryRateLimitStore:
+    @pytest.mark.asyncio
+    async def test_token_bucket_refills_and_evicts_idle_keys(self):
+        store = MemoryRateLimitStore(max_keys=2)
+        now = [1000.0]
+        with patch("server.services.rate_limit_store.time.monotonic", side_effect=lambda: now[0]):
+            assert [(await store.hit("a", 3)).allowed for _ in range(4)] == [True, True, True, False]
+            denied = await store.hit("a", 3)
+            assert denied.remaining == 0 and 0 < denied.retry_after <= 20
+
+            now[0] += 20  # one token per 20s at 3/minute
+            assert (await store.hit("a", 3)).allowed
+            assert not (await store.hit("a", 3)).allowed
+
+            await store.hit("b", 3)
+            await store.hit("c", 3)  # over max_keys: least recently used key goes
+            assert store.stats() == {"backend": "memory", "keys": 2, "max_keys": 2, "evicted": 1}
+
+            now[0] += 61  # untouched for a window: full buckets, dropped
+            await store.hit("d", 3)
+            assert store.stats()["keys"] == 1
+
+
+class TestSQLiteRateLimitStore:
+    @pytest.mark.asyncio
+    async def test_limit_is_shared_across_workers(self, tmp_path):
+        path = str(tmp_path / "rl.db")
+        workers = [SQLiteRateLimitStore(path, lease_fraction=0.2), SQLiteRateLimitStore(path, lease_fraction=0.2)]
+        try:
+            with patch("server.services.rate_limit_store.time.time", return_value=WINDOW_START + 30):
+                allowed = [(await workers[i % 2].hit("k", 10)).allowed for i in range(16)]
+            assert allowed.count(True) == 10
+            assert allowed[-4:] == [False] * 4
+            # Leases of 2 requests: 5 reservations granted the 10, plus one denied check per worker
+            assert sum(w.reservations for w in workers) == 7
+        finally:
+            for w in workers:
+                await w.close()
+
+    @pytest.mark.asyncio
+    async def test_previous_window_weighs_on_the_current_one(self, tmp_path):
+        store = SQLiteRateLimitStore(str(tmp_path / "rl.db"), lease_fraction=0.1)
+        try:
+            with patch("server.services.rate_limit_store.time.time", return_value=WINDOW_START + 59):
+                assert all([(await store.hit("k", 10)).allowed for _ in range(10)])
+            # Half-way through the next window, half of the previous 10 still count
+            with patch("server.services.rate_limit_store.time.time", return_value=WINDOW_START + 90):
+                allowed = [(await store.hit("k", 10)).allowed for _ in range(8)]
+            assert allowed.count(True) == 5
+        finally:
+            await store.close()
+
+    @pytest.mark.asyncio
+    async def test_denied_key_skips_round_trips_until_retry(self, tmp_path):
+        store = SQLiteRateLimitStore(str(tmp_path / "rl.db"), lease_fraction=1.0)
+        try:
+            with patch("server.services.rate_limit_store.time.time", return_value=WINDOW_START + 30):
+                await store.hit("k", 2)
+                await store.hit("k", 2)
+                denied = [await store.hit("k", 2) for _ in range(5)]
+            assert not any(r.allowed for r in denied)
+            assert denied[0].headers()["Retry-After"] == "30"
+            assert store.reservations == 2
+        finally:
+            await store.close()
+
+
+def test_leased_store_requires_reserve_and_count():
+    from server.services.rate_limit_store import _LeasedWindowStore
+
+    class CountOnly(_LeasedWindowStore):
+        async def _count(self, key, window):
+            return 0
+
+    with pytest.raises(TypeError):
+        CountOnly()
+
+
+class TestDynamoDBRateLimitStore:
+    def _make_store(self, mock_table: MagicMock, lease_fraction: float = 0.5):
+        mock_boto = MagicMock()
+        mock_boto.resource.return_value.Table.return_value = mock_table
+        mock_table.meta.client.exceptions.ConditionalCheckFailedException = type("CCF", (Exception,), {})
+        with patch.dict(sys.modules, {"boto3": mock_boto}):
+            from server.services.rate_limit_store import DynamoDBRateLimitStore
+            return DynamoDBRateLimitStore("test-table", region="us-east-1", lease_fraction=lease_fraction)
+
+    @pytest.mark.asyncio
+    async def test_reserves_leases_with_conditional_add(self):
+        mock_table = MagicMock()
+        mock_table.get_item.return_value = {}
+        mock_table.update_item.return_value = {"Attributes": {"count": 5}}
+        store = self._make_store(mock_table)
+
+        with patch("server.services.rate_limit_store.time.time", return_value=WINDOW_START + 30):
+            results = [await store.hit("k", 10) for _ in range(5)]
+
+        assert all(r.allowed for r in results)
+        mock_table.update_item.assert_called_once()
+        kwargs = mock_table.update_item.call_args.kwargs
+        assert kwargs["Key"] == {"pk": f"k#{int(WINDOW_START // 60)}"}
+        assert kwargs["ExpressionAttributeValues"][":n"] == 5
+        assert kwargs["ExpressionAttributeValues"][":max"] == 5
+
+    @pytest.mark.asyncio
+    async def test_takes_what_is_left_when_other_instances_took_the_rest(self):
+        mock_table = MagicMock()
+        store = self._make_store(mock_table)
+        ccf = mock_table.meta.client.exceptions.ConditionalCheckFailedException
+        mock_table.get_item.side_effect = [{}, {"Item": {"count": 8}}, {"Item": {"count": 10}}]
+        mock_table.update_item.side_effect = [ccf(), {"Attributes": {"count": 10}}, ccf()]
+
+        with patch("server.services.rate_limit_store.time.time", return_value=WINDOW_START + 30):
+            results = [await store.hit("k", 10) for _ in range(3)]
+
+        assert [r.allowed for r in results] == [True, True, False]
+        assert mock_table.update_item.call_args_list[1].kwargs["ExpressionAttributeValues"][":n"] == 2
+
+
+class TestGetRateLimitStore:
+    def test_container_mode_defaults_to_memory(self):
+        with patch("server.services.rate_limit_store.settings") as mock_settings:
+            mock_settings.rate_limit_backend = ""
+            mock_settings.deployment_mode = "container"
+            from server.services.rate_limit_store import get_rate_limit_store
+            assert isinstance(get_rate_limit_store(), MemoryRateLimitStore)
+
+    def test_sqlite_backend(self, tmp_path):
+        with patch("server.services.rate_limit_store.settings") as mock_settings:
+            mock_settings.rate_limit_backend = "sqlite"
+            mock_settings.rate_limit_db_path = str(tmp_path / "rl.db")
+            mock_settings.rate_limit_lease_fraction = 0.05
+            from server.services.rate_limit_store import get_rate_limit_store
+            assert isinstance(get_rate_limit_store(), SQLiteRateLimitStore)
+
+    def test_lambda_mode_defaults_to_dynamodb(self):
+        with patch.dict(sys.modules, {"boto3": MagicMock()}), \
+                patch("server.services.rate_limit_store.settings") as mock_settings:
+            mock_settings.rate_limit_backend = ""
+            mock_settings.deployment_mode = "lambda"
+            mock_settings.dynamodb_rate_limit_table = "test-table"
+            mock_settings.aws_region = "us-east-1"
+            mock_settings.rate_limit_lease_fraction = 0.05
+            from server.services.rate_limit_store import (
+                DynamoDBRateLimitStore,
+                get_rate_limit_store,
+            )
+            assert isinstance(get_rate_limit_store(), DynamoDBRateLimitStore)
@@ -7,7 +7,12 @@ import json
 import pytest
 import aiosqlite
 
-from server.services.render_service import render_prompt, render_prompt_with_includes
+from server.services.render_service import (
+    TemplateCache,
+    render_prompt,
+    render_prompt_with_includes,
+    template_cache,
+)
 
 
 def test_basic_render():
@@ -202,3 +207,100 @@ async def test_render_with_includes_and_variables():
         assert "Your role is admin." in result
     finally:
         await db.close()
+
+
+# ---------------------------------------------------------------------------
+# Compiled-template cache
+# ---------------------------------------------------------------------------
+
+
+def test_render_prompt_reuses_compiled_template():
+    template_cache.clear()
+    first = render_prompt("Hi {{ name }}", {"name": "A"}, cache_for=(APP_ID, "p1"))
+    second = render_prompt("Hi {{ name }}", {"name": "B"}, cache_for=(APP_ID, "p1"))
+    assert (first, second) == ("Hi A", "Hi B")
+    assert template_cache.stats()["hits"] == 1
+
+    # A new body for the same prompt is a different key, never a stale hit
+    assert render_prompt("Bye {{ name }}", {"name": "C"}, cache_for=(APP_ID, "p1")) == "Bye C"
+
+
+def test_render_prompt_does_not_cache_failures():
+    template_cache.clear()
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Template rendering failed"):
+            render_prompt("{{ invalid syntax {{", {}, cache_for=(APP_ID, "bad"))
+    assert template_cache.stats()["size"] == 0
+
+
+def test_template_cache_ttl_and_lru():
+    cache = TemplateCache(max_size=2, ttl=0)
+    cache.put(("a", "p", "h"), object())
+    assert cache.get(("a", "p", "h")) is None
+
+    cache = TemplateCache(max_size=2, ttl=60)
+    for i in range(3):
+        cache.put(("a", f"p{i}", "h"), object())
+    assert cache.get(("a", "p0", "h")) is None
+    assert cache.stats()["size"] == 2
+
+
+@pytest.mark.asyncio
+async def test_include_render_hit_skips_db():
+    template_cache.clear()
+    db = await _create_include_db()
+    try:
+        await _add_prompt(db, "preamble", "Be kind.")
+        template = '{% include "preamble" %} {{ task }}'
+        await render_prompt_with_includes(template, {"task": "x"}, db, APP_ID, cache_for=(APP_ID, "main"))
+        await db.execute("DELETE FROM prompts")
+        await db.commit()
+
+        result = await render_prompt_with_includes(template, {"task": "y"}, db, APP_ID, cache_for=(APP_ID, "main"))
+        assert result == "Be kind. y"
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_include_change_invalidates_dependents():
+    template_cache.clear()
+    db = await _create_include_db()
+    try:
+        await _add_prompt(db, "preamble", "Old.")
+        template = '{% include "preamble" %} {{ task }}'
+        key = (APP_ID, "main")
+        assert await render_prompt_with_includes(template, {"task": "t"}, db, APP_ID, cache_for=key) == "Old. t"
+
+        await db.execute(
+            "UPDATE prompts SET front_matter = ? WHERE name = 'preamble'",
+            (json.dumps({"_body": "New.", "name": "preamble"}),),
+        )
+        await db.commit()
+        assert template_cache.invalidate(APP_ID, "id-preamble", "preamble") == 1
+
+        assert await render_prompt_with_includes(template, {"task": "t"}, db, APP_ID, cache_for=key) == "New. t"
+    finally:
+        await db.close()
+
+
+@pytest.mark.asyncio
+async def test_include_closure_fetched_in_one_query(db):
+    """With the include graph materialized at sync time, a deep tree costs one query."""
+    from unittest.mock import patch
+
+    from server.db.queries import prompts as prompt_queries
+    from server.services.sync_service import _index_prompt_file
+    from tests.conftest import APP_ID as SEED_APP_ID
+
+    await _index_prompt_file(db, SEED_APP_ID, "p/c.md", "---\nname: inc_c\n---\nC", "s1")
+    await _index_prompt_file(db, SEED_APP_ID, "p/b.md", '---\nname: inc_b\n---\nB{% include "inc_c" %}', "s2")
+    await _index_prompt_file(db, SEED_APP_ID, "p/a.md", '---\nname: inc_a\n---\nA{% include "inc_b" %}', "s3")
+
+    with patch.object(
+        prompt_queries, "get_include_closure", wraps=prompt_queries.get_include_closure
+    ) as spy:
+        result = await render_prompt_with_includes('{% include "inc_a" %}!', {}, db, SEED_APP_ID)
+
+    assert result == "ABC!"
+    assert spy.call_count == 1
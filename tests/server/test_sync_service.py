@@ -4,11 +4,24 @@ from __future__ import annotations
 
 from unittest.mock import MagicMock
 
+import aiosqlite
 import pytest
 
-from server.services.sync_service import _index_prompt_file, remove_file, sync_app, sync_single_file
+from server.db.database import write_transaction
+from server.db.queries import api_keys as key_queries
+from server.db.queries import prompts as prompt_queries
+from server.services.github_service import AsyncGitHubService
+from server.services.sync_service import (
+    _index_prompt_file,
+    diff_tree,
+    index_files,
+    remove_file,
+    sync_app,
+    sync_files,
+    sync_single_file,
+)
 
-from tests.conftest import APP_ID
+from tests.conftest import API_KEY_ID, APP_ID
 
 
 SAMPLE_PROMPT_MD = """---
@@ -130,41 +143,53 @@ async def test_remove_file_nonexistent(db):
     await remove_file(db, APP_ID, "prompts/does_not_exist.md")
 
 
-@pytest.mark.asyncio
-async def test_sync_app(db):
-    """sync_app should index all .md files returned by GitHubService."""
-    mock_github = MagicMock()
-    mock_github.list_md_files.return_value = [
-        {"path": "prompts/a.md"},
-        {"path": "prompts/b.md"},
-    ]
+def _tree_github(files: dict[str, tuple[str, str]], complete: bool = True) -> AsyncGitHubService:
+    """Mock GitHubService serving {path: (content, blob_sha)} via the tree/blob API."""
+    github = MagicMock()
+    github.list_md_tree.return_value = (
+        [{"path": path, "name": path.rsplit("/", 1)[-1], "sha": sha, "size": 1} for path, (_, sha) in files.items()],
+        complete,
+    )
+    blobs = {sha: content for content, sha in files.values()}
+    github.get_blob.side_effect = lambda repo, sha: blobs[sha]
+    return AsyncGitHubService(github)
+
+
+def _fetched(github: AsyncGitHubService) -> list[str]:
+    """Blob SHAs fetched from GitHub, in sorted order."""
+    return sorted(c.args[1] for c in github.service.get_blob.call_args_list)
+
 
-    prompt_a = """---
+APP_RECORD = {
+    "id": APP_ID,
+    "github_repo": "testorg/testapp",
+    "subdirectory": "",
+    "default_branch": "main",
+}
+
+PROMPT_A = """---
+id: sync-a
 name: prompt_a
 version: 1.0.0
 ---
 Prompt A body."""
 
-    prompt_b = """---
+PROMPT_B = """---
+id: sync-b
 name: prompt_b
 version: 1.0.0
 ---
 Prompt B body."""
 
-    mock_github.get_file_content.side_effect = [
-        (prompt_a, "sha_a"),
-        (prompt_b, "sha_b"),
-    ]
 
-    app_record = {
-        "id": APP_ID,
-        "github_repo": "testorg/testapp",
-        "subdirectory": "",
-        "default_branch": "main",
-    }
+@pytest.mark.asyncio
+async def test_sync_app(db):
+    """sync_app should index all .md files listed in the repo tree."""
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a"), "prompts/b.md": (PROMPT_B, "sha_b")})
 
-    synced = await sync_app(db, app_record, mock_github)
-    assert synced == 2
+    result = await sync_app(db, APP_RECORD, github)
+    assert result["synced"] == 2
+    assert result["updated"] == 2
 
     # Verify both prompts exist
     async with db.execute(
@@ -173,6 +198,254 @@ Prompt B body."""
         assert (await cursor.fetchone())[0] == 2
 
 
+@pytest.mark.asyncio
+async def test_sync_app_skips_unchanged_blobs_and_removes_deleted(db):
+    prompt_c = PROMPT_A.replace("sync-a", "sync-c").replace("prompt_a", "prompt_c")
+    github = _tree_github({
+        "prompts/a.md": (PROMPT_A, "sha_a"),
+        "prompts/b.md": (PROMPT_B, "sha_b"),
+        "prompts/c.md": (prompt_c, "sha_c"),
+    })
+    first = await sync_app(db, APP_RECORD, github)
+    assert first["removed"] == 1  # seeded prompts/greeting.md is not in the repo
+
+    # a.md unchanged, b.md edited, c.md deleted
+    edited_b = PROMPT_B.replace("Prompt B body.", "Prompt B v2.")
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a"), "prompts/b.md": (edited_b, "sha_b2")})
+    result = await sync_app(db, APP_RECORD, github)
+
+    assert _fetched(github) == ["sha_b2"]
+    assert result == {
+        "synced": 2, "updated": 1, "moved": 0, "unchanged": 1, "removed": 1, "failed": 0, "include_cycles": [],
+    }
+    async with db.execute("SELECT body FROM prompts WHERE id = 'sync-b'") as cursor:
+        assert (await cursor.fetchone())[0] == "Prompt B v2."
+    async with db.execute("SELECT COUNT(*) FROM prompts WHERE id = 'sync-c'") as cursor:
+        assert (await cursor.fetchone())[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_sync_app_keeps_prompts_when_listing_incomplete(db):
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a")}, complete=False)
+    result = await sync_app(db, APP_RECORD, github)
+    assert result["removed"] == 0
+
+    github = MagicMock()
+    github.list_md_tree.side_effect = Exception("boom")
+    result = await sync_app(db, APP_RECORD, AsyncGitHubService(github))
+    assert result["synced"] == 0 and result["removed"] == 0
+
+    async with db.execute("SELECT COUNT(*) FROM prompts WHERE file_path = 'prompts/greeting.md'") as cursor:
+        assert (await cursor.fetchone())[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_sync_app_counts_invalid_files_as_failed(db):
+    github = _tree_github({
+        "prompts/a.md": (PROMPT_A, "sha_a"),
+        "prompts/noname.md": ("---\ntype: chat\n---\nNo name.", "sha_n"),
+    })
+    result = await sync_app(db, APP_RECORD, github)
+    assert result["updated"] == 1
+    assert result["failed"] == 1
+
+
+def test_diff_tree_classifies_changes():
+    indexed = {"a.md": "sa", "b.md": "sb", "old.md": "sm", "gone.md": "sg"}
+    files = [
+        {"path": "a.md", "sha": "sa"},
+        {"path": "b.md", "sha": "sb2"},
+        {"path": "new/moved.md", "sha": "sm"},
+        {"path": "fresh.md", "sha": "sf"},
+    ]
+    plan = diff_tree(indexed, files)
+    assert plan["unchanged"] == ["a.md"]
+    assert [f["path"] for f in plan["changed"]] == ["b.md", "fresh.md"]
+    assert plan["moved"] == [("old.md", "new/moved.md")]
+    assert plan["removed"] == ["gone.md"]
+
+    assert diff_tree(indexed, files, complete=False)["removed"] == []
+    full = diff_tree(indexed, files, full=True)
+    assert len(full["changed"]) == 4 and full["moved"] == []
+
+
+@pytest.mark.asyncio
+async def test_sync_app_moves_renamed_file_without_fetching(db):
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a")})
+    await sync_app(db, APP_RECORD, github)
+
+    github = _tree_github({"prompts/moved/a.md": (PROMPT_A, "sha_a")})
+    result = await sync_app(db, APP_RECORD, github)
+
+    assert result["moved"] == 1 and result["updated"] == 0
+    assert _fetched(github) == []
+    async with db.execute("SELECT file_path FROM prompts WHERE id = 'sync-a'") as cursor:
+        assert (await cursor.fetchone())[0] == "prompts/moved/a.md"
+
+
+@pytest.mark.asyncio
+async def test_sync_app_invalidates_only_changed_prompts(db):
+    from server.services.cache_service import prompt_cache
+
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a"), "prompts/b.md": (PROMPT_B, "sha_b")})
+    await sync_app(db, APP_RECORD, github)
+    prompt_cache.put("id:sync-a", {"id": "sync-a", "app_id": APP_ID}, file_path="prompts/a.md")
+    prompt_cache.put("id:sync-b", {"id": "sync-b", "app_id": APP_ID}, file_path="prompts/b.md")
+
+    edited_b = PROMPT_B.replace("Prompt B body.", "Prompt B v2.")
+    await sync_app(db, APP_RECORD, _tree_github({"prompts/a.md": (PROMPT_A, "sha_a"), "prompts/b.md": (edited_b, "sha_b2")}))
+
+    assert prompt_cache.get_entry("id:sync-a")[0] is not None
+    assert prompt_cache.get_entry("id:sync-b")[0] is None
+    prompt_cache.clear()
+
+
+def _row(prompt_id: str, name: str, includes: list[str] | None = None) -> dict:
+    row = {"id": prompt_id, "app_id": APP_ID, "name": name, "file_path": f"prompts/{name}.md", "body": "Body"}
+    if includes is not None:
+        row["includes"] = includes
+    return row
+
+
+@pytest.mark.asyncio
+async def test_upsert_prompts_writes_rows_and_include_edges(db):
+    failed = await prompt_queries.upsert_prompts(db, [_row("bulk-1", "bulk_one", ["greeting"]), _row("bulk-2", "bulk_two")])
+    assert failed == []
+
+    async with db.execute("SELECT COUNT(*) FROM prompts WHERE id IN ('bulk-1', 'bulk-2')") as cursor:
+        assert (await cursor.fetchone())[0] == 2
+    async with db.execute("SELECT include_name FROM prompt_includes WHERE prompt_id = 'bulk-1'") as cursor:
+        assert [r[0] for r in await cursor.fetchall()] == ["greeting"]
+
+
+@pytest.mark.asyncio
+async def test_upsert_prompts_rolls_back_whole_batch_on_error(db):
+    # Same name as the seeded prompt violates UNIQUE(app_id, name)
+    with pytest.raises(aiosqlite.IntegrityError):
+        await prompt_queries.upsert_prompts(db, [_row("bulk-1", "bulk_one"), _row("bulk-dup", "greeting")])
+
+    async with db.execute("SELECT COUNT(*) FROM prompts WHERE id = 'bulk-1'") as cursor:
+        assert (await cursor.fetchone())[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_upsert_prompts_savepoint_per_row_skips_bad_rows(db):
+    rows = [_row("bulk-1", "bulk_one", ["x"]), _row("bulk-dup", "greeting", ["y"]), _row("bulk-2", "bulk_two")]
+    failed = await prompt_queries.upsert_prompts(db, rows, savepoint_per_row=True)
+
+    assert [row["id"] for row, _ in failed] == ["bulk-dup"]
+    async with db.execute("SELECT id FROM prompts WHERE id LIKE 'bulk-%' ORDER BY id") as cursor:
+        assert [r[0] for r in await cursor.fetchall()] == ["bulk-1", "bulk-2"]
+    async with db.execute("SELECT COUNT(*) FROM prompt_includes WHERE prompt_id = 'bulk-dup'") as cursor:
+        assert (await cursor.fetchone())[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_index_files_is_isolated_from_concurrent_writers(db):
+    import asyncio
+
+    files = [
+        {"path": f"prompts/idx_{i}.md", "content": f"---\nid: idx-{i}\nname: idx_{i}\n---\nBody", "sha": f"s{i}"}
+        for i in range(300)
+    ]
+
+    async def touch_key():
+        for _ in range(20):
+            await key_queries.update_last_used_many(db, [("2026-01-01 00:00:00", API_KEY_ID)])
+
+    async def failing_writer():
+        # Its rollback must only undo its own insert, not the sync's rows
+        for i in range(10):
+            with pytest.raises(RuntimeError):
+                async with write_transaction(db):
+                    await db.execute(
+                        "INSERT INTO organizations (id, github_owner) VALUES (?, ?)", (f"tx-{i}", f"tx-{i}")
+                    )
+                    raise RuntimeError("boom")
+
+    result, *_ = await asyncio.gather(index_files(db, APP_ID, files), touch_key(), failing_writer())
+
+    assert (result["updated"], result["failed"]) == (300, 0)
+    async with db.execute("SELECT COUNT(*) FROM prompts WHERE id LIKE 'idx-%'") as cursor:
+        assert (await cursor.fetchone())[0] == 300
+    async with db.execute("SELECT COUNT(*) FROM organizations WHERE id LIKE 'tx-%'") as cursor:
+        assert (await cursor.fetchone())[0] == 0
+    assert not db.in_transaction
+
+
+@pytest.mark.asyncio
+async def test_sync_files_reads_touched_paths_at_ref(db):
+    github = _tree_github({
+        "prompts/a.md": (PROMPT_A, "sha_a"),
+        "prompts/b.md": (PROMPT_B, "sha_b"),
+        "prompts/noname.md": ("---\ntype: chat\n---\nNo name.", "sha_n"),
+    })
+
+    # greeting.md was modified by the push but is gone at the pinned commit
+    result = await sync_files(
+        db, APP_RECORD, ["prompts/a.md", "prompts/noname.md", "prompts/greeting.md"], [], github, ref="after-sha"
+    )
+
+    assert github.service.list_md_tree.call_args.kwargs["branch"] == "after-sha"
+    # b.md was not touched by the push, so it is not fetched
+    assert _fetched(github) == ["sha_a", "sha_n"]
+    assert result["updated"] == 1 and result["removed"] == 1 and result["failed"] == 1
+    async with db.execute("SELECT file_path FROM prompts WHERE app_id = ?", (APP_ID,)) as cursor:
+        assert [r[0] for r in await cursor.fetchall()] == ["prompts/a.md"]
+
+
+@pytest.mark.asyncio
+async def test_sync_files_skips_indexed_blobs_and_detects_moves(db):
+    await sync_app(db, APP_RECORD, _tree_github({"prompts/a.md": (PROMPT_A, "sha_a"), "prompts/b.md": (PROMPT_B, "sha_b")}))
+
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a"), "prompts/moved/b.md": (PROMPT_B, "sha_b")})
+    result = await sync_files(db, APP_RECORD, ["prompts/a.md", "prompts/moved/b.md"], ["prompts/b.md"], github)
+
+    assert _fetched(github) == []
+    assert result["unchanged"] == 1 and result["moved"] == 1 and result["updated"] == 0
+    async with db.execute("SELECT file_path FROM prompts WHERE id = 'sync-b'") as cursor:
+        assert (await cursor.fetchone())[0] == "prompts/moved/b.md"
+
+
+@pytest.mark.asyncio
+async def test_sync_files_trusts_payload_removals_when_listing_incomplete(db):
+    github = _tree_github({"prompts/a.md": (PROMPT_A, "sha_a")}, complete=False)
+    result = await sync_files(db, APP_RECORD, ["prompts/greeting.md"], ["prompts/old.md"], github)
+    assert result["removed"] == 0
+
+    result = await sync_files(db, APP_RECORD, [], ["prompts/greeting.md"], github)
+    assert result["removed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fts_row_rewritten_only_for_indexed_column_changes(db):
+    """Updating non-indexed columns (or re-setting equal values) must not touch prompts_fts."""
+    async def fts_hits():
+        async with db.execute("SELECT COUNT(*) FROM prompts_fts WHERE prompts_fts MATCH 'welcome'") as cursor:
+            return (await cursor.fetchone())[0]
+
+    # Drop the FTS row by hand so any trigger execution would be visible
+    await db.execute(
+        """INSERT INTO prompts_fts(prompts_fts, rowid, name, description, tags, body)
+           SELECT 'delete', rowid, name, description, tags, body FROM prompts WHERE name = 'greeting'"""
+    )
+    assert await fts_hits() == 0
+
+    await db.execute("UPDATE prompts SET active = 0, git_sha = 'x' WHERE name = 'greeting'")
+    await db.execute("UPDATE prompts SET body = body WHERE name = 'greeting'")
+    assert await fts_hits() == 0
+
+    # Restore the row; a real body change is re-indexed
+    await db.execute(
+        """INSERT INTO prompts_fts(rowid, name, description, tags, body)
+           SELECT rowid, name, description, tags, body FROM prompts WHERE name = 'greeting'"""
+    )
+    await db.execute("UPDATE prompts SET body = 'Zebra {{ name }}' WHERE name = 'greeting'")
+    assert await fts_hits() == 0
+    async with db.execute("SELECT COUNT(*) FROM prompts_fts WHERE prompts_fts MATCH 'zebra'") as cursor:
+        assert (await cursor.fetchone())[0] == 1
+
+
 @pytest.mark.asyncio
 async def test_sync_single_file(db):
     """sync_single_file should index one file from GitHub."""
@@ -185,7 +458,7 @@ async def test_sync_single_file(db):
         "default_branch": "main",
     }
 
-    await sync_single_file(db, app_record, "prompts/single.md", mock_github)
+    await sync_single_file(db, app_record, "prompts/single.md", AsyncGitHubService(mock_github))
 
     async with db.execute(
         "SELECT * FROM prompts WHERE file_path = 'prompts/single.md' AND app_id = ?", (APP_ID,)
@@ -208,4 +481,49 @@ async def test_sync_single_file_error(db):
     }
 
     with pytest.raises(Exception, match="GitHub API error"):
-        await sync_single_file(db, app_record, "prompts/fail.md", mock_github)
+        await sync_single_file(db, app_record, "prompts/fail.md", AsyncGitHubService(mock_github))
+
+
+@pytest.mark.asyncio
+async def test_index_prompt_file_records_include_edges(db):
+    """Include directives in the body are persisted as include-graph edges."""
+    content = '---\nid: comp-1\nname: composed\n---\n{% include "header" %}\n{% include "footer" %}'
+    await _index_prompt_file(db, APP_ID, "prompts/composed.md", content, "sha-c")
+
+    async with db.execute(
+        "SELECT include_name FROM prompt_includes WHERE prompt_id = 'comp-1' ORDER BY include_name"
+    ) as cursor:
+        assert [r[0] for r in await cursor.fetchall()] == ["footer", "header"]
+
+    # Re-indexing replaces the edge set
+    content = '---\nid: comp-1\nname: composed\n---\n{% include "header" %}'
+    await _index_prompt_file(db, APP_ID, "prompts/composed.md", content, "sha-d")
+    async with db.execute("SELECT COUNT(*) FROM prompt_includes WHERE prompt_id = 'comp-1'") as cursor:
+        assert (await cursor.fetchone())[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_index_prompt_file_warns_on_include_cycle(db, caplog):
+    """A cycle is reported when the file that closes it is synced."""
+    await _index_prompt_file(db, APP_ID, "prompts/a.md", '---\nid: cyc-a\nname: cyc_a\n---\n{% include "cyc_b" %}', "s1")
+    assert "Circular include" not in caplog.text
+
+    await _index_prompt_file(db, APP_ID, "prompts/b.md", '---\nid: cyc-b\nname: cyc_b\n---\n{% include "cyc_a" %}', "s2")
+    assert f"Circular include detected in app {APP_ID}: cyc_b" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_index_files_reports_include_cycles_once_per_sync(db):
+    """Cycles among the written prompts come back in the counts, from one graph query."""
+    from unittest.mock import patch
+
+    files = [
+        {"path": "prompts/a.md", "content": '---\nid: cyc-a\nname: cyc_a\n---\n{% include "cyc_b" %}', "sha": "s1"},
+        {"path": "prompts/b.md", "content": '---\nid: cyc-b\nname: cyc_b\n---\n{% include "cyc_a" %}', "sha": "s2"},
+        {"path": "prompts/c.md", "content": '---\nid: cyc-c\nname: cyc_c\n---\n{% include "cyc_a" %}', "sha": "s3"},
+    ]
+    with patch.object(prompt_queries, "get_include_edges", wraps=prompt_queries.get_include_edges) as edges:
+        result = await index_files(db, APP_ID, files)
+
+    assert result["include_cycles"] == ["cyc_a", "cyc_b"]
+    assert edges.await_count == 1
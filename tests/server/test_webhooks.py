@@ -1,7 +1,8 @@
 """Tests for GitHub webhook endpoint POST /api/v1/webhooks/github.
 
 Covers payload validation, repo matching, signature verification,
-idempotency, event filtering, file sync dispatch, and cache invalidation.
+idempotency, event filtering, queueing with per-app coalescing, the
+background sync worker, and cache invalidation.
 """
 
 from __future__ import annotations
@@ -9,13 +10,15 @@ from __future__ import annotations
 import hashlib
 import hmac
 import json
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 
-from tests.conftest import APP_ID, ORG_ID, USER_ID
+from server.services.github_service import AsyncGitHubService
+
+from tests.conftest import APP_ID, ORG_ID, PROMPT_ID, USER_ID
 
 
 WEBHOOK_URL = "/api/v1/webhooks/github"
@@ -27,6 +30,9 @@ def _push_payload(
     added: list[str] | None = None,
     modified: list[str] | None = None,
     removed: list[str] | None = None,
+    ref: str = "refs/heads/main",
+    after: str = "after-sha",
+    before: str = "before-sha",
 ) -> dict:
     """Build a minimal GitHub push event payload."""
     commits = []
@@ -37,11 +43,22 @@ def _push_payload(
             "removed": removed or [],
         })
     return {
+        "ref": ref,
+        "before": before,
+        "after": after,
         "repository": {"full_name": repo},
         "commits": commits,
     }
 
 
+def _sync_result(updated: int = 0, removed: int = 0) -> dict:
+    """Counts as returned by sync_service.sync_files."""
+    return {
+        "updated": updated, "moved": 0, "unchanged": 0,
+        "removed": removed, "failed": 0, "evicted": 0, "include_cycles": [],
+    }
+
+
 def _sign_payload(body: bytes, secret: str) -> str:
     """Compute X-Hub-Signature-256 header value."""
     sig = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
@@ -128,21 +145,18 @@ async def test_valid_signature(wh_client, db):
     body = json.dumps(payload).encode()
     sig = _sign_payload(body, secret)
 
-    with patch("server.services.sync_service.sync_single_file", new_callable=AsyncMock), \
-         patch("server.services.github_service.GitHubService"), \
-         patch("server.utils.crypto.decrypt", return_value="fake-token"):
-        # Need an admin token row for sync to proceed
-        await _seed_admin_token(db)
-        resp = await wh_client.post(
-            WEBHOOK_URL, content=body,
-            headers={
-                "content-type": "application/json",
-                "x-github-event": "push",
-                "x-hub-signature-256": sig,
-            },
-        )
+    # Need an admin token row for sync to proceed
+    await _seed_admin_token(db)
+    resp = await wh_client.post(
+        WEBHOOK_URL, content=body,
+        headers={
+            "content-type": "application/json",
+            "x-github-event": "push",
+            "x-hub-signature-256": sig,
+        },
+    )
 
-    assert resp.status_code == 200
+    assert resp.status_code == 202
     assert resp.json()["ok"] is True
 
     # Clean up
@@ -226,49 +240,239 @@ async def _seed_admin_token(db):
     await db.commit()
 
 
+def _patch_worker(**sync_kwargs):
+    """Patch the worker's GitHub access; sync_files is mocked when kwargs are given."""
+    patches = [
+        patch(
+            "server.services.webhook_queue.github_clients.get",
+            return_value=AsyncGitHubService(MagicMock()),
+        ),
+    ]
+    if sync_kwargs:
+        patches.append(
+            patch("server.services.webhook_queue.sync_files", new_callable=AsyncMock, **sync_kwargs)
+        )
+    return patches
+
+
+async def _process_queue(db, **sync_kwargs):
+    """Run the background worker once. Returns (results, sync_files mock or None)."""
+    from server.services.webhook_queue import webhook_queue
+
+    patches = _patch_worker(**sync_kwargs)
+    mocks = [p.start() for p in patches]
+    try:
+        results = await webhook_queue.process(db)
+    finally:
+        for p in patches:
+            p.stop()
+    return results, (mocks[1] if sync_kwargs else None)
+
+
 @pytest.mark.asyncio
-async def test_push_syncs_changed_md_files(wh_client, db):
+async def test_push_is_queued_and_returns_202(wh_client, db):
     await _seed_admin_token(db)
 
     payload = _push_payload(
         added=["prompts/new.md"],
         modified=["prompts/greeting.md"],
     )
-
-    with patch("server.services.sync_service.sync_single_file", new_callable=AsyncMock) as mock_sync, \
-         patch("server.services.github_service.GitHubService"), \
-         patch("server.utils.crypto.decrypt", return_value="fake-token"):
+    with patch("server.services.webhook_queue.sync_files", new_callable=AsyncMock) as mock_sync:
         resp = await wh_client.post(
             WEBHOOK_URL, json=payload,
             headers={"x-github-event": "push"},
         )
 
-    assert resp.status_code == 200
+    assert resp.status_code == 202
     data = resp.json()
-    assert data["ok"] is True
-    assert data["synced"] == 2
-    assert mock_sync.call_count == 2
+    assert data == {"ok": True, "queued": True, "changed": 2, "removed": 0}
+    # Nothing is fetched inside the request
+    mock_sync.assert_not_called()
 
 
 @pytest.mark.asyncio
-async def test_push_removes_deleted_md_files(wh_client, db):
+async def test_worker_syncs_changed_md_files(wh_client, db):
     await _seed_admin_token(db)
 
-    payload = _push_payload(removed=["prompts/old.md"])
+    payload = _push_payload(
+        added=["prompts/new.md"],
+        modified=["prompts/greeting.md"],
+    )
+    await wh_client.post(WEBHOOK_URL, json=payload, headers={"x-github-event": "push"})
+
+    results, mock_sync = await _process_queue(db, return_value=_sync_result(updated=2))
 
-    with patch("server.services.sync_service.sync_single_file", new_callable=AsyncMock), \
-         patch("server.services.sync_service.remove_file", new_callable=AsyncMock) as mock_remove, \
-         patch("server.services.github_service.GitHubService"), \
-         patch("server.utils.crypto.decrypt", return_value="fake-token"):
+    assert results[0]["app_id"] == APP_ID
+    assert results[0]["updated"] == 2
+    # All changed files go through one batched sync
+    assert mock_sync.call_count == 1
+    assert mock_sync.call_args[0][2] == ["prompts/new.md", "prompts/greeting.md"]
+
+
+@pytest.mark.asyncio
+async def test_worker_coalesces_pushes_per_app(wh_client, db):
+    from server.services.webhook_queue import webhook_queue
+
+    await _seed_admin_token(db)
+
+    first = _push_payload(added=["prompts/new.md"], modified=["prompts/greeting.md"])
+    second = _push_payload(removed=["prompts/greeting.md"], before="earlier-sha", after="after-sha")
+    first["after"] = "earlier-sha"
+    for i, payload in enumerate((first, second)):
         resp = await wh_client.post(
             WEBHOOK_URL, json=payload,
-            headers={"x-github-event": "push"},
+            headers={"x-github-event": "push", "x-github-delivery": f"coalesce-{i}"},
+        )
+        assert resp.status_code == 202
+    assert webhook_queue.stats()["coalesced"] == 1
+
+    results, mock_sync = await _process_queue(db, return_value=_sync_result(updated=1, removed=1))
+
+    # One sync with the final state of each path, read at the latest push's commit
+    assert mock_sync.call_count == 1
+    assert mock_sync.call_args.kwargs["ref"] == "after-sha"
+    assert mock_sync.call_args[0][2] == ["prompts/new.md"]
+    assert mock_sync.call_args[0][3] == ["prompts/greeting.md"]
+    assert results[0]["deliveries"] == 2
+    async with db.execute(
+        "SELECT COUNT(*) FROM webhook_deliveries WHERE delivery_id LIKE 'coalesce-%'"
+    ) as cursor:
+        assert (await cursor.fetchone())[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_pushes_sync_the_branch_head(wh_client, db):
+    await _seed_admin_token(db)
+
+    newer = _push_payload(modified=["prompts/greeting.md"], before="sha-1", after="sha-2")
+    older = _push_payload(modified=["prompts/greeting.md"], before="sha-0", after="sha-1")
+    for i, payload in enumerate((newer, older)):
+        resp = await wh_client.post(
+            WEBHOOK_URL, json=payload,
+            headers={"x-github-event": "push", "x-github-delivery": f"reorder-{i}"},
         )
+        assert resp.status_code == 202
+
+    _, mock_sync = await _process_queue(db, return_value=_sync_result(updated=1))
+
+    # The older push must not pin sha-1 over sha-2; neither is known to be newest
+    assert mock_sync.call_args.kwargs["ref"] is None
+
+
+@pytest.mark.asyncio
+async def test_lambda_mode_applies_push_before_responding(wh_client, db, monkeypatch):
+    from server.config import settings
+
+    await _seed_admin_token(db)
+    monkeypatch.setattr(settings, "deployment_mode", "lambda")
+
+    payload = _push_payload(modified=["prompts/greeting.md"])
+    patches = _patch_worker(return_value={**_sync_result(updated=1), "evicted": 3})
+    mocks = [p.start() for p in patches]
+    try:
+        resp = await wh_client.post(WEBHOOK_URL, json=payload, headers={"x-github-event": "push"})
+    finally:
+        for p in patches:
+            p.stop()
 
+    assert resp.status_code == 202
+    assert mocks[1].call_count == 1
+    assert resp.json()["evicted"] == 3
+
+
+@pytest.mark.asyncio
+async def test_lambda_mode_reports_failed_sync(wh_client, db, monkeypatch):
+    from server.config import settings
+    from server.services.webhook_queue import webhook_queue
+
+    await _seed_admin_token(db)
+    monkeypatch.setattr(settings, "deployment_mode", "lambda")
+
+    payload = _push_payload(modified=["prompts/greeting.md"])
+    patches = _patch_worker(side_effect=Exception("GitHub down"))
+    for p in patches:
+        p.start()
+    try:
+        resp = await wh_client.post(WEBHOOK_URL, json=payload, headers={"x-github-event": "push"})
+    finally:
+        for p in patches:
+            p.stop()
+
+    # GitHub sees the failure, and a redelivery isn't mistaken for a queued one
+    assert resp.status_code == 502
+    assert webhook_queue.stats()["pending_apps"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queued_delivery_retry_skipped(wh_client, db):
+    await _seed_admin_token(db)
+
+    payload = _push_payload(modified=["prompts/greeting.md"])
+    headers = {"x-github-event": "push", "x-github-delivery": "queued-retry"}
+    assert (await wh_client.post(WEBHOOK_URL, json=payload, headers=headers)).status_code == 202
+
+    resp = await wh_client.post(WEBHOOK_URL, json=payload, headers=headers)
     assert resp.status_code == 200
-    data = resp.json()
-    assert data["removed"] == 1
-    assert mock_remove.call_count == 1
+    assert resp.json()["message"] == "Already processed"
+
+
+@pytest.mark.asyncio
+async def test_push_evicts_only_affected_cache_entries(wh_client, db):
+    from server.services.cache_service import prompt_cache
+    from server.services.webhook_queue import webhook_queue
+
+    await _seed_admin_token(db)
+    prompt_cache.clear()
+    prompt_cache.put(
+        "id:p-greet", {"id": "p-greet", "app_id": APP_ID}, file_path="prompts/greeting.md"
+    )
+    prompt_cache.put(
+        "id:p-other", {"id": "p-other", "app_id": APP_ID}, file_path="prompts/other.md"
+    )
+
+    payload = _push_payload(modified=["prompts/greeting.md"])
+    await wh_client.post(WEBHOOK_URL, json=payload, headers={"x-github-event": "push"})
+
+    content = f"---\nid: {PROMPT_ID}\nname: greeting\n---\nHi {{{{ name }}}}"
+    gh = MagicMock()
+    gh.list_md_tree.return_value = ([{"path": "prompts/greeting.md", "sha": "new-sha"}], True)
+    gh.get_blob.return_value = content
+    with patch(
+        "server.services.webhook_queue.github_clients.get", return_value=AsyncGitHubService(gh)
+    ):
+        results = await webhook_queue.process(db)
+
+    assert results[0]["evicted"] == 1
+    assert prompt_cache.get_entry("id:p-greet")[0] is None
+    assert prompt_cache.get_entry("id:p-other")[0] is not None
+    prompt_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_push_removes_deleted_md_files(wh_client, db):
+    await _seed_admin_token(db)
+
+    payload = _push_payload(removed=["prompts/old.md"])
+    resp = await wh_client.post(
+        WEBHOOK_URL, json=payload,
+        headers={"x-github-event": "push"},
+    )
+    assert resp.status_code == 202
+    assert resp.json()["removed"] == 1
+
+    results, mock_sync = await _process_queue(db, return_value=_sync_result(removed=1))
+    assert results[0]["removed"] == 1
+    assert mock_sync.call_args[0][3] == ["prompts/old.md"]
+
+
+@pytest.mark.asyncio
+async def test_push_to_other_branch_ignored(wh_client, db):
+    await _seed_admin_token(db)
+
+    payload = _push_payload(modified=["prompts/greeting.md"], ref="refs/heads/feature")
+    resp = await wh_client.post(WEBHOOK_URL, json=payload, headers={"x-github-event": "push"})
+    assert resp.status_code == 200
+    assert resp.json()["message"] == "Ignoring push to refs/heads/feature"
 
 
 @pytest.mark.asyncio
@@ -326,24 +530,109 @@ async def test_delivery_recorded_after_sync(wh_client, db):
     delivery_id = "delivery-record-test-456"
     payload = _push_payload(modified=["prompts/greeting.md"])
 
-    with patch("server.services.sync_service.sync_single_file", new_callable=AsyncMock), \
-         patch("server.services.github_service.GitHubService"), \
-         patch("server.utils.crypto.decrypt", return_value="fake-token"):
-        resp = await wh_client.post(
-            WEBHOOK_URL, json=payload,
-            headers={
-                "x-github-event": "push",
-                "x-github-delivery": delivery_id,
-            },
-        )
+    resp = await wh_client.post(
+        WEBHOOK_URL, json=payload,
+        headers={
+            "x-github-event": "push",
+            "x-github-delivery": delivery_id,
+        },
+    )
+    assert resp.status_code == 202
+
+    async def recorded():
+        async with db.execute(
+            "SELECT * FROM webhook_deliveries WHERE delivery_id = ?",
+            (delivery_id,),
+        ) as cursor:
+            return await cursor.fetchone()
+
+    # Not recorded until the worker has applied the push
+    assert await recorded() is None
+    await _process_queue(db, return_value=_sync_result(updated=1))
+    row = await recorded()
+    assert row is not None
+    assert row["app_id"] == APP_ID
 
-    assert resp.status_code == 200
 
-    # Verify delivery was recorded
+@pytest.mark.asyncio
+async def test_failed_sync_is_retried_with_backoff(wh_client, db):
+    import time
+
+    from server.services.webhook_queue import webhook_queue
+
+    await _seed_admin_token(db)
+
+    payload = _push_payload(modified=["prompts/greeting.md"])
+    await wh_client.post(
+        WEBHOOK_URL, json=payload,
+        headers={"x-github-event": "push", "x-github-delivery": "delivery-fails"},
+    )
+    results, _ = await _process_queue(db, side_effect=Exception("GitHub down"))
+
+    assert results == []
+    stats = webhook_queue.stats()
+    assert (stats["retrying_apps"], stats["retried"], stats["failed"]) == (1, 1, 0)
+    assert webhook_queue.has_delivery("delivery-fails")
     async with db.execute(
-        "SELECT * FROM webhook_deliveries WHERE delivery_id = ?",
-        (delivery_id,),
+        "SELECT 1 FROM webhook_deliveries WHERE delivery_id = 'delivery-fails'"
     ) as cursor:
-        row = await cursor.fetchone()
-    assert row is not None
-    assert row["app_id"] == APP_ID
+        assert await cursor.fetchone() is None
+
+    # Not due yet: the worker leaves it alone
+    results, mock_sync = await _process_queue(db, return_value=_sync_result(updated=1))
+    assert results == [] and mock_sync.await_count == 0
+
+    webhook_queue._pending[APP_ID].not_before = time.monotonic()
+    results, _ = await _process_queue(db, return_value=_sync_result(updated=1))
+    assert results[0]["deliveries"] == 1
+    async with db.execute(
+        "SELECT 1 FROM webhook_deliveries WHERE delivery_id = 'delivery-fails'"
+    ) as cursor:
+        assert await cursor.fetchone() is not None
+
+
+@pytest.mark.asyncio
+async def test_sync_out_of_quota_is_retried_after_the_reset(wh_client, db):
+    import time
+
+    from server.services.github_service import GitHubQuotaExhausted
+    from server.services.webhook_queue import webhook_queue
+
+    await _seed_admin_token(db)
+    await wh_client.post(
+        WEBHOOK_URL, json=_push_payload(modified=["prompts/greeting.md"]),
+        headers={"x-github-event": "push"},
+    )
+    await _process_queue(db, side_effect=GitHubQuotaExhausted("tok", 900))
+
+    assert webhook_queue._pending[APP_ID].not_before - time.monotonic() > 890
+
+
+@pytest.mark.asyncio
+async def test_failed_sync_gives_up_after_max_attempts(wh_client, db):
+    from server.services.webhook_queue import webhook_queue
+
+    await _seed_admin_token(db)
+    await wh_client.post(
+        WEBHOOK_URL, json=_push_payload(modified=["prompts/greeting.md"]),
+        headers={"x-github-event": "push", "x-github-delivery": "delivery-lost"},
+    )
+    with patch.object(webhook_queue, "_retry_backoff", 0):
+        for _ in range(webhook_queue.stats()["max_attempts"]):
+            await _process_queue(db, side_effect=Exception("GitHub down"))
+
+    stats = webhook_queue.stats()
+    assert (stats["pending_apps"], stats["failed"]) == (0, 1)
+    assert not webhook_queue.has_delivery("delivery-lost")
+
+
+@pytest.mark.asyncio
+async def test_record_delivery_failure_is_logged(db, caplog):
+    from server.services.webhook_queue import record_delivery
+
+    await db.execute("DROP TABLE webhook_deliveries")
+    with caplog.at_level("ERROR", logger="server.services.webhook_queue"):
+        await record_delivery(db, "delivery-untracked", APP_ID, "push")
+
+    assert "Failed to record webhook delivery delivery-untracked" in caplog.text
+    assert not db.in_transaction
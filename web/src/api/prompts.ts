@@ -184,7 +184,9 @@ export async function fetchPromptHistory(
   return apiFetch(`/api/v1/admin/prompts/${promptId}/history`);
 }
 
-export async function syncApp(appId: string): Promise<{ synced: number }> {
+export async function syncApp(
+  appId: string
+): Promise<{ synced: number; include_cycles: string[] }> {
   return apiFetch(`/api/v1/admin/apps/${appId}/sync`, { method: "POST" });
 }
 